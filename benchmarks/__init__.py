@@ -0,0 +1 @@
+# Reproducible benchmarks for the IPTV player core. See benchmarks/run.py.
@@ -0,0 +1,106 @@
+import gzip
+import random
+import struct
+import time
+import zlib
+
+# Deterministic synthetic inputs: the same arguments (and seed) always produce byte-identical files,
+# so timings from different versions of the player are comparable.
+
+EPG_ANCHOR = 1767225600 # 2026-01-01 00:00 UTC, the first day of every generated guide
+
+COUNTRIES = ["uk", "fr", "de", "es", "it", "nl", "pt", "pl", "tr", "ar", "us", "ca"]
+GENRES = ["News", "Sport", "Movies", "Kids", "Music", "Documentary", "Entertainment", "Religious",
+          "Shopping", "Series", "Lifestyle", "Regional"]
+NAME_WORDS = ["One", "Two", "Plus", "Max", "Prime", "Cinema", "Sport", "News", "Kids", "Télé", "Música",
+              "Actualité", "Doku", "Premium", "Family", "Action", "Classic", "Live", "24", "World"]
+TITLE_WORDS = ["Morning", "Evening", "News", "Live", "Match", "Highlights", "Movie", "Story", "Journal",
+               "Weather", "Report", "Show", "Magazine", "Special", "Episode", "Cup", "Tonight", "Classics"]
+HOSTS = ["cdn1.example.net", "cdn2.example.net", "edge.example.org", "live.example.com", "tv.example.tv"]
+
+def category_names(count):
+    return [f"{COUNTRIES[i % len(COUNTRIES)].upper()} | {GENRES[(i // len(COUNTRIES)) % len(GENRES)]}"
+            + (f" {i // (len(COUNTRIES) * len(GENRES)) + 1}" if i >= len(COUNTRIES) * len(GENRES) else "")
+            for i in range(count)]
+
+def channel_ids(count):
+    return [f"ch{i}.{COUNTRIES[i % len(COUNTRIES)]}" for i in range(count)]
+
+def iter_m3u_lines(entries, categories=200, seed=1):
+    # Category sizes follow a Zipf-like distribution, like real provider playlists where a few
+    # groups hold most of the channels. About 80% of entries carry a tvg-id and a logo.
+    rng = random.Random(seed)
+    names = category_names(categories)
+    weights = [1 / (rank + 1) for rank in range(categories)]
+    yield "#EXTM3U\n"
+    for i in range(entries):
+        category = rng.choices(names, weights)[0]
+        name = f"{rng.choice(NAME_WORDS)} {rng.choice(NAME_WORDS)} {i}"
+        attributes = []
+        if rng.random() < 0.8:
+            attributes.append(f'tvg-id="ch{i}.{COUNTRIES[i % len(COUNTRIES)]}"')
+        attributes.append(f'tvg-name="{name}"')
+        if rng.random() < 0.8:
+            attributes.append(f'tvg-logo="http://logos.example.net/{i % 5000}.png"')
+        attributes.append(f'group-title="{category}"')
+        if rng.random() < 0.1:
+            attributes.append('catchup="default" catchup-days="7"')
+        extension = "m3u8" if rng.random() < 0.6 else "ts"
+        yield f"#EXTINF:-1 {' '.join(attributes)},{name}\n"
+        yield f"http://{rng.choice(HOSTS)}/live/user/pass/{i}.{extension}\n"
+
+def iter_xmltv_lines(channels, days=7, programmes_per_day=24, seed=1, anchor=EPG_ANCHOR):
+    # One guide channel per id from channel_ids(channels), each with back-to-back programmes of
+    # varying length. Timestamps carry a non-UTC offset so the offset handling is exercised.
+    rng = random.Random(seed)
+    ids = channel_ids(channels)
+    yield '<?xml version="1.0" encoding="UTF-8"?>\n<tv generator-info-name="iptv-benchmarks">\n'
+    for channel_id in ids:
+        yield f'  <channel id="{channel_id}"><display-name>{channel_id.upper()}</display-name></channel>\n'
+
+    average_length = 86400 // programmes_per_day
+    end = anchor + days * 86400
+    for channel_id in ids:
+        start = anchor - rng.randrange(average_length)
+        while start < end:
+            stop = start + rng.randrange(average_length // 2, average_length * 3 // 2 + 1)
+            title = f"{rng.choice(TITLE_WORDS)} {rng.choice(TITLE_WORDS)}"
+            yield (f'  <programme start="{xmltv_time(start)}" stop="{xmltv_time(stop)}" channel="{channel_id}">'
+                   f'<title lang="en">{title}</title>'
+                   f'<desc lang="en">{title} on {channel_id}, part {rng.randrange(1, 100)}.</desc></programme>\n')
+            start = stop
+    yield "</tv>\n"
+
+def xmltv_time(epoch):
+    # Rendered in UTC+01:00 to make sure offsets are honoured by the parser
+    return time.strftime("%Y%m%d%H%M%S", time.gmtime(epoch + 3600)) + " +0100"
+
+def write_m3u(path, entries, categories=200, seed=1):
+    with open(path, "w", encoding="utf-8") as f:
+        f.writelines(iter_m3u_lines(entries, categories, seed))
+    return path
+
+def write_xmltv(path, channels, days=7, programmes_per_day=24, seed=1, compress=False):
+    opener = gzip.open if compress else open
+    with opener(path, "wt", encoding="utf-8") as f:
+        f.writelines(iter_xmltv_lines(channels, days, programmes_per_day, seed))
+    return path
+
+def _png_chunk(kind, data):
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+def write_png(path, width=400, height=300, seed=1):
+    # A logo-sized RGB image: a gradient in a colour picked from the seed
+    rng = random.Random(seed)
+    red, green, blue = rng.randrange(256), rng.randrange(256), rng.randrange(256)
+    rows = []
+    for y in range(height):
+        shade = y * 255 // max(1, height - 1)
+        pixel = bytes(((red + shade) % 256, (green + shade) % 256, blue))
+        rows.append(b"\0" + pixel * width)
+    with open(path, "wb") as f:
+        f.write(b"\x89PNG\r\n\x1a\n")
+        f.write(_png_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)))
+        f.write(_png_chunk(b"IDAT", zlib.compress(b"".join(rows), 6)))
+        f.write(_png_chunk(b"IEND", b""))
+    return path
@@ -0,0 +1,581 @@
+import argparse
+import json
+import os
+import platform
+import queue
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from iptv_core import PlaylistModel, parse_epg, ChannelSearchIndex, ChannelTable, GuideGridLayout, GridRow, ProgrammeDatabase
+from iptv_core.cli import main as cli_main
+from iptv_core.model import LOAD_CHANNELS, LOAD_DONE, LOAD_ERROR, LOAD_ROWS
+from iptv_core.buffering import BufferingPolicy
+from iptv_core.epg_pool import default_pool
+from iptv_core.health import StreamProber
+from iptv_core.logos import LogoCache
+from iptv_core.player import (ChannelZapper, FakeBackend, VLCBackend, EVENT_PLAYING, EVENT_STALL, EVENT_STALL_END,
+                               EVENT_STARTING, EVENT_STOPPED)
+from benchmarks.generators import EPG_ANCHOR, channel_ids, write_m3u, write_png, write_xmltv
+from benchmarks.server import serve_directory, serve_streams
+
+# Runs every stage of the player pipeline against generated inputs served over local HTTP and
+# writes one JSON document with the wall time and peak traced memory of each stage, e.g.
+#
+#   python -m benchmarks.run --sizes 1k,10k,100k --epg 2000x7x24 --output results.json
+#   python -m benchmarks.run --baseline results.json   # fails if a stage got >20% slower
+
+SIZE_SUFFIXES = {"k": 1000, "m": 1000000}
+SEARCH_QUERIES = ["s", "sp", "spo", "spor", "sport", "sport 1", "sport 12", "news", "télé", "one two"]
+EPG_LOOKUPS = 10000
+GRID_FRAMES = 1000 # Viewports of the guide grid laid out per run
+GRID_VIEWPORT = (1200, 700) # Programme area of the guide grid in pixels
+UI_TICK_SECONDS = 0.005 # Period of the stand-in for the Tk main loop while a guide is parsed in the background
+GUIDE_QUERIES = ["match", "news evening", "movi", "highlights live", "journal"]
+DEFAULT_EPG_SHAPE = "2000x7x24"
+ZAP_DWELL = 1.0 # Seconds "watched" per channel before switching, giving the standby time to warm up
+# Simulated hosts for the buffering stage: (connect seconds, network hiccups per minute, longest
+# hiccup in ms). A hiccup longer than the caching drains the buffer and stalls playback.
+BUFFERING_HOSTS = {"stable.invalid": (0.3, 1, 200), "busy.invalid": (0.6, 3, 1500), "flaky.invalid": (1.0, 6, 4000)}
+BUFFERING_WATCH_SECONDS = 120 # Playback per simulated play
+PROBE_KINDS = ["good.m3u8", "good.m3u8", "master.m3u8", "good.ts", "broken.m3u8", "empty.ts", "gone.m3u8"]
+
+def parse_size(text):
+    text = text.strip().lower()
+    if text[-1:] in SIZE_SUFFIXES:
+        return int(float(text[:-1]) * SIZE_SUFFIXES[text[-1]])
+    return int(text)
+
+def parse_epg_shape(text):
+    channels, days, per_day = (int(part) for part in text.lower().split("x"))
+    return channels, days, per_day
+
+def measure(function, repeat=1, memory=True):
+    # Best wall time over `repeat` untraced runs, plus the peak of one run under tracemalloc
+    # (tracing slows Python down, so it is never mixed into the timings).
+    result = None
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    peak = None
+    if memory:
+        tracemalloc.start()
+        try:
+            result = function()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return result, best, peak
+
+class TreeHarness:
+    # Drives IPTVPlayerApp.populate_channel_tree against a real ttk.Treeview without building the
+    # whole window (and without VLC). Returns None when no display is available.
+    @classmethod
+    def create(cls):
+        try:
+            import tkinter as tk
+            import tkinter.ttk as ttk
+            from iptv import IPTVPlayerApp
+            root = tk.Tk()
+        except Exception:
+            return None
+        root.withdraw()
+        app = object.__new__(IPTVPlayerApp)
+        app.master = root
+        app.channel_tree = ttk.Treeview(root)
+        app._tree_pending = {}
+        app._tree_fill_queue = []
+        app._tree_fill_job = None
+        app._probe_rows = {}
+        app.prober = None
+        harness = cls()
+        harness.root = root
+        harness.app = app
+        return harness
+
+    def populate(self, channels):
+        # Populates the tree, opens every category and pumps the event loop until it is filled
+        self.app.populate_channel_tree(channels)
+        for category_node in self.app.channel_tree.get_children():
+            self.app.channel_tree.item(category_node, open=True)
+            self.app.channel_tree.focus(category_node)
+            self.app.on_category_open(None)
+        while self.app._tree_fill_job is not None:
+            self.root.update()
+
+    def close(self):
+        self.root.destroy()
+
+def bench_playlist(results, base_url, workdir, entries, categories, seed, repeat, memory, harness):
+    path = write_m3u(os.path.join(workdir, f"playlist-{entries}.m3u"), entries, categories, seed)
+    url = f"{base_url}/{os.path.basename(path)}"
+    size = {"entries": entries, "bytes": os.path.getsize(path)}
+
+    def record(stage, seconds, peak, **extra):
+        results.append({"stage": stage, **size, "seconds": round(seconds, 6), "peak_bytes": peak, **extra})
+        print(f"  {stage:<24} {entries:>9} entries {seconds * 1000:>10.1f} ms"
+              + (f" {peak / 1048576:>9.1f} MiB" if peak is not None else ""))
+
+    def load():
+        model = PlaylistModel(tempfile.mkdtemp(dir=workdir))
+        model.load(url, "")
+        return model
+    model, seconds, peak = measure(load, repeat, memory)
+    record("load_m3u", seconds, peak)
+
+    def load_progressively():
+        # Time until the first rows could be shown, next to the time until the whole list is
+        # ready; the consumer stands in for the UI thread draining the queue
+        events = queue.Queue()
+        started = time.perf_counter()
+        worker = threading.Thread(target=PlaylistModel(tempfile.mkdtemp(dir=workdir)).load_progressively,
+                                  args=(url, "", events))
+        worker.start()
+        first_rows = complete = None
+        while True:
+            kind, value = events.get()
+            if kind == LOAD_ROWS and value and first_rows is None:
+                first_rows = time.perf_counter() - started
+            elif kind == LOAD_CHANNELS:
+                complete = time.perf_counter() - started
+            elif kind == LOAD_ERROR:
+                raise value
+            elif kind == LOAD_DONE:
+                break
+        worker.join()
+        return first_rows, complete
+    (first_rows, complete), _, _ = measure(load_progressively, repeat, memory=False)
+    record("progressive_first_rows", first_rows, None, channels_complete_seconds=round(complete, 6))
+
+    def parse_local():
+        local_model = PlaylistModel(workdir)
+        with open(path, "rb") as f:
+            local_model.parse_m3u(f)
+        return local_model
+    _, seconds, peak = measure(parse_local, repeat, memory)
+    record("parse_m3u", seconds, peak)
+
+    output = os.path.join(workdir, "filtered.m3u")
+    def batch_filter():
+        # The headless CLI: category filter plus URL dedup, streamed to a file
+        return cli_main([path, "--exclude-category", "*XXX*", "--dedup", "url", "--output", output, "--quiet"])
+    _, seconds, peak = measure(batch_filter, repeat, memory)
+    record("cli_filter", seconds, peak)
+
+    _, seconds, peak = measure(lambda: ChannelSearchIndex(model.channels).build_trigrams(), repeat, memory)
+    record("build_search_index", seconds, peak)
+
+    def type_queries():
+        # Simulates typing each query one character at a time, like filter_channels sees it
+        search_index = model.search_index
+        for query in SEARCH_QUERIES:
+            for end in range(1, len(query) + 1):
+                matches = search_index.search(query[:end])
+                if matches is not None:
+                    search_index.group_by_category(matches)
+        search_index.search("")
+    keystrokes = sum(len(query) for query in SEARCH_QUERIES)
+    _, seconds, peak = measure(type_queries, repeat, memory)
+    record("filter_channels", seconds, peak, keystrokes=keystrokes, per_keystroke_ms=round(seconds * 1000 / keystrokes, 4))
+
+    def revalidate():
+        return model.load(url, "")
+    changed, seconds, peak = measure(revalidate, repeat, memory)
+    record("revalidate_unchanged", seconds, peak, changed=changed)
+
+    # A refresh in which 1% of the channels were renamed, 1% removed and 1% added
+    channels = model.channels
+    fresh = ChannelTable()
+    for row in range(len(channels)):
+        if row % 100 == 1:
+            continue
+        name = channels.names[row] + (" HD" if row % 100 == 2 else "")
+        fresh.append(name, channels.urls[row], channels.tvg_ids[row], channels.category(row), channels.logos[row])
+        if row % 100 == 3:
+            fresh.append(name + " +1", channels.urls[row] + "?timeshift=1", None, channels.category(row))
+    (_, diff), seconds, peak = measure(lambda: channels.reconcile(fresh), repeat, memory)
+    record("reconcile_refresh", seconds, peak, added=len(diff.added), removed=len(diff.removed), changed=len(diff.changed))
+
+    def cached_start():
+        cached_model = PlaylistModel(model.source_cache.directory)
+        cached_model.load_cached(url, "")
+        return cached_model
+    _, seconds, peak = measure(cached_start, repeat, memory)
+    record("cached_start", seconds, peak)
+
+    if harness is not None:
+        _, seconds, _ = measure(lambda: harness.populate(model.channels.by_category()), repeat, memory=False)
+        record("populate_channel_tree", seconds, None)
+    else:
+        results.append({"stage": "populate_channel_tree", **size, "skipped": "no display"})
+
+def worst_ui_gap(function):
+    # Runs function on a worker thread while this thread wakes every UI_TICK_SECONDS, as the Tk
+    # main loop does for its timers, and returns the longest wait between two wake-ups; a
+    # worker holding the GIL shows up as a long gap
+    done = threading.Event()
+    worker = threading.Thread(target=lambda: (function(), done.set()))
+    worker.start()
+    worst = 0.0
+    last = time.perf_counter()
+    while not done.is_set():
+        time.sleep(UI_TICK_SECONDS)
+        now = time.perf_counter()
+        worst = max(worst, now - last - UI_TICK_SECONDS)
+        last = now
+    worker.join()
+    return worst
+
+def bench_epg(results, base_url, workdir, channels, days, per_day, seed, repeat, memory, compress):
+    name = f"guide-{channels}x{days}x{per_day}.xml" + (".gz" if compress else "")
+    path = write_xmltv(os.path.join(workdir, name), channels, days, per_day, seed, compress)
+    url = f"{base_url}/{name}"
+    size = {"channels": channels, "days": days, "programmes_per_day": per_day, "bytes": os.path.getsize(path)}
+
+    def record(stage, seconds, peak, **extra):
+        results.append({"stage": stage, **size, "seconds": round(seconds, 6), "peak_bytes": peak, **extra})
+        print(f"  {stage:<24} {channels}x{days}x{per_day} {seconds * 1000:>10.1f} ms"
+              + (f" {peak / 1048576:>9.1f} MiB" if peak is not None else ""))
+
+    def load():
+        model = PlaylistModel(tempfile.mkdtemp(dir=workdir))
+        model.epg_retention = None # The generated guides lie in the past
+        model.load("", url)
+        return model
+    model, seconds, peak = measure(load, repeat, memory)
+    programmes = sum(len(guide) for guide in model.epg_index.channels.values())
+    record("load_epg", seconds, peak, programmes=programmes)
+
+    def parse_local(epg_pool=None):
+        local_model = PlaylistModel(workdir)
+        local_model.epg_retention = None
+        local_model.epg_pool = epg_pool
+        with open(path, "rb") as f:
+            local_model.parse_epg(f)
+        return local_model
+    _, seconds, peak = measure(parse_local, repeat, memory)
+    record("parse_epg", seconds, peak, programmes=programmes, ui_gap_ms=round(worst_ui_gap(parse_local) * 1000, 3))
+    pool = default_pool()
+    _, seconds, peak = measure(lambda: parse_local(pool), repeat, memory)
+    record("parse_epg_processes", seconds, peak, programmes=programmes, processes=pool.processes,
+           ui_gap_ms=round(worst_ui_gap(lambda: parse_local(pool)) * 1000, 3))
+
+    # As if the player ran in the middle of the guide with the default retention window
+    now = EPG_ANCHOR + days * 86400 // 2
+    def parse_windowed():
+        windowed_model = PlaylistModel(workdir)
+        with open(path, "rb") as f:
+            windowed_model.epg_index = parse_epg(f, *windowed_model.epg_window(now))
+        return windowed_model
+    windowed_model, seconds, peak = measure(parse_windowed, repeat, memory)
+    kept = sum(len(guide) for guide in windowed_model.epg_index.channels.values())
+    record("parse_epg_windowed", seconds, peak, programmes=kept)
+
+    _, seconds, peak = measure(lambda: model.epg_index.evicted(now), repeat, memory)
+    record("evict_programmes", seconds, peak, programmes=programmes)
+
+    rng = random.Random(seed)
+    ids = channel_ids(channels)
+    lookups = [(rng.choice(ids), EPG_ANCHOR + rng.randrange(days * 86400)) for _ in range(EPG_LOOKUPS)]
+    def display_lookups():
+        # The work display_epg_info does per click, minus the Tk text widget
+        epg_index = model.epg_index
+        for channel_id, when in lookups:
+            guide = epg_index.get(channel_id)
+            if guide is not None:
+                guide.upcoming(when, limit=50)
+    _, seconds, peak = measure(display_lookups, repeat, memory)
+    record("display_epg_info", seconds, peak, lookups=EPG_LOOKUPS, per_lookup_us=round(seconds * 1e6 / EPG_LOOKUPS, 3))
+
+    def grid_frames():
+        # The layout work of scrolling the guide grid diagonally across the whole guide; the
+        # canvas item updates are proportional to the cells returned
+        grid_rows = [GridRow(None, channel_id, guide.display_name) for channel_id, guide in model.epg_index.channels.items()]
+        layout = GuideGridLayout(grid_rows, model.epg_index, EPG_ANCHOR, EPG_ANCHOR + days * 86400)
+        width, height = GRID_VIEWPORT
+        cells = 0
+        for frame in range(GRID_FRAMES):
+            left = (layout.width - width) * frame / GRID_FRAMES
+            top = (layout.height - height) * frame / GRID_FRAMES
+            for index in layout.rows_in(top, height):
+                cells += len(layout.cells(index, left, width))
+        return cells
+    cells, seconds, peak = measure(grid_frames, repeat, memory)
+    record("guide_grid_frames", seconds, peak, frames=GRID_FRAMES, cells=cells,
+           per_frame_us=round(seconds * 1e6 / GRID_FRAMES, 3))
+
+    def ingest_fresh():
+        database = ProgrammeDatabase(os.path.join(tempfile.mkdtemp(dir=workdir), "programmes.sqlite3"))
+        database.ingest(model.epg_index)
+        return database
+    database, seconds, peak = measure(ingest_fresh, repeat, memory)
+    record("ingest_programmes", seconds, peak, programmes=programmes)
+
+    _, seconds, peak = measure(lambda: database.ingest(model.epg_index), repeat, memory)
+    record("reingest_unchanged", seconds, peak, programmes=programmes)
+
+    def search_guide():
+        for query in GUIDE_QUERIES:
+            database.search(query, start=EPG_ANCHOR)
+    _, seconds, peak = measure(search_guide, repeat, memory)
+    record("search_programmes", seconds, peak, queries=len(GUIDE_QUERIES),
+           per_query_ms=round(seconds * 1000 / len(GUIDE_QUERIES), 3))
+
+def bench_logos(results, base_url, workdir, count, repeat):
+    # Thumbnails `count` distinct 400x300 logos: downloaded and scaled, then from the memory LRU,
+    # then from the disk cache of a fresh LogoCache, as after a restart
+    directory = os.path.join(workdir, "logos")
+    os.makedirs(directory, exist_ok=True)
+    urls = [f"{base_url}/logos/{i}.png" for i in range(count)]
+    for i in range(count):
+        write_png(os.path.join(directory, f"{i}.png"), seed=i)
+
+    def record(stage, seconds, **extra):
+        results.append({"stage": stage, "logos": count, "seconds": round(seconds, 6), **extra})
+        print(f"  {stage:<24} {count:>9} logos {seconds * 1000:>12.1f} ms")
+
+    def load_all(cache_dir):
+        done = threading.Event()
+        remaining = [len(urls)]
+        lock = threading.Lock()
+        def on_ready(url):
+            with lock:
+                remaining[0] -= 1
+                if not remaining[0]:
+                    done.set()
+        cache = LogoCache(cache_dir, on_ready=on_ready)
+        cache.request(urls)
+        done.wait()
+        cache.shutdown()
+        return cache
+
+    cache_dirs = []
+    def cold():
+        cache_dirs.append(tempfile.mkdtemp(dir=workdir))
+        return load_all(cache_dirs[-1])
+    cache, seconds, _ = measure(cold, repeat, memory=False)
+    loaded = sum(1 for url in urls if cache.get(url)[1] is not None)
+    record("logo_fetch_cold", seconds, loaded=loaded, memory_bytes=cache.memory_bytes)
+
+    _, seconds, _ = measure(lambda: [cache.get(url) for url in urls], repeat, memory=False)
+    record("logo_memory_hits", seconds)
+
+    _, seconds, _ = measure(lambda: load_all(cache_dirs[-1]), repeat, memory=False)
+    record("logo_disk_warm", seconds)
+
+def bench_probe(results, streams, repeat):
+    # Checks `streams` distinct URLs on the local stand-in origin with a fresh prober per run
+    stems = [kind.split(".") for kind in PROBE_KINDS]
+    with serve_streams() as base_url:
+        urls = []
+        for i in range(streams):
+            stem, extension = stems[i % len(stems)]
+            urls.append(f"{base_url}/{stem}-{i}.{extension}")
+
+        def probe_all():
+            prober = StreamProber()
+            try:
+                done = threading.Event()
+                remaining = [len(urls)]
+                lock = threading.Lock()
+                def on_result(url, result):
+                    with lock:
+                        remaining[0] -= 1
+                        if not remaining[0]:
+                            done.set()
+                prober.on_result = on_result
+                prober.submit(urls)
+                done.wait()
+                return prober
+            finally:
+                prober.shutdown()
+        prober, seconds, _ = measure(probe_all, repeat, memory=False)
+
+    statuses = {}
+    for url in urls:
+        status = prober.status(url)
+        statuses[status] = statuses.get(status, 0) + 1
+    results.append({"stage": "probe_streams", "streams": streams, "seconds": round(seconds, 6),
+                    "peak_bytes": None, "statuses": statuses})
+    print(f"  {'probe_streams':<24} {streams:>9} streams {seconds * 1000:>10.1f} ms")
+
+def bench_zapping(results, switches, startup_delay, media):
+    # Zaps through channels one after the other, once with only a single player and once with
+    # the next channel pre-warmed on the standby, and records the play -> playing latency.
+    # With `media` (local files) real libvlc runs with dummy audio/video output; otherwise
+    # FakeBackend simulates a connect and buffering time of `startup_delay` seconds.
+    if media:
+        backend = VLCBackend("--vout=dummy", "--aout=dummy", "--no-video-title-show")
+        urls = [os.path.abspath(path) for path in media]
+        source = "vlc"
+    else:
+        backend = FakeBackend(startup_delay)
+        urls = [f"http://zap.invalid/channel-{i}.m3u8" for i in range(switches)]
+        source = "fake"
+    channels = [urls[i % len(urls)] for i in range(switches)]
+
+    for mode, standby in (("cold", False), ("prewarmed", True)):
+        playing = threading.Event()
+        zapper = ChannelZapper(backend, standby=standby,
+                               on_event=lambda event, url, value: event == EVENT_PLAYING and playing.set())
+        try:
+            for i, url in enumerate(channels):
+                playing.clear()
+                zapper.play(url)
+                playing.wait(30)
+                if standby and i + 1 < len(channels):
+                    zapper.prewarm(channels[i + 1])
+                time.sleep(ZAP_DWELL if media else startup_delay * 2)
+        finally:
+            zapper.close()
+
+        seconds = [switch.seconds for switch in zapper.switches]
+        mean = sum(seconds) / len(seconds) if seconds else 0.0
+        warm = sum(1 for switch in zapper.switches if switch.warm)
+        results.append({"stage": f"channel_switch_{mode}", "switches": len(seconds), "backend": source,
+                        "seconds": round(mean, 6), "worst_seconds": round(max(seconds, default=0.0), 6),
+                        "warm_switches": warm, "peak_bytes": None})
+        print(f"  {'channel_switch_' + mode:<24} {len(seconds):>9} switches {mean * 1000:>9.1f} ms mean")
+
+def bench_buffering(results, plays, seed):
+    # Replays simulated plays of channels on hosts of differing quality through a BufferingPolicy,
+    # once with the learned caching and once with libvlc's fixed default, and records the mean
+    # start-up time (connect plus filling the buffer) and the stalls. No player runs; the events
+    # are fed to observe() with simulated timestamps.
+    for mode in ("fixed", "adaptive"):
+        policy = BufferingPolicy()
+        rng = random.Random(seed)
+        now = 0.0
+        startup = 0.0
+        stalls = 0
+        for i in range(plays):
+            host = rng.choice(sorted(BUFFERING_HOSTS))
+            connect, per_minute, longest = BUFFERING_HOSTS[host]
+            url = f"http://{host}/channel-{rng.randrange(20)}.m3u8"
+            caching = policy.caching_ms(url) if mode == "adaptive" else policy.caching_ms("")
+            policy.observe(EVENT_STARTING, url, False, now=now)
+            now += connect + caching / 1000
+            startup += connect + caching / 1000
+            policy.observe(EVENT_PLAYING, url, now=now)
+            end = now + BUFFERING_WATCH_SECONDS
+            for _ in range(per_minute * BUFFERING_WATCH_SECONDS // 60):
+                hiccup = rng.uniform(0, longest)
+                if hiccup > caching:
+                    now += rng.uniform(0, (end - now) / 2)
+                    stalls += 1
+                    policy.observe(EVENT_STALL, url, now=now)
+                    now += (hiccup - caching) / 1000
+                    policy.observe(EVENT_STALL_END, url, now=now)
+            now = max(now, end)
+            policy.observe(EVENT_STOPPED, url, now=now)
+
+        mean = startup / plays
+        results.append({"stage": f"buffering_{mode}", "plays": plays, "seconds": round(mean, 6), "stalls": stalls,
+                        "caching_ms": {host: policy.hosts[host].caching_ms for host in sorted(policy.hosts)}})
+        print(f"  {'buffering_' + mode:<24} {plays:>9} plays {mean * 1000:>12.1f} ms mean start, {stalls} stalls")
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+def compare(results, baseline_path, tolerance):
+    # Prints the ratio of every stage to the baseline run; returns False on a regression
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    def key(result):
+        return tuple(sorted((k, v) for k, v in result.items()
+                            if k in ("stage", "entries", "channels", "days", "programmes_per_day", "streams", "logos", "plays")))
+    previous = {key(result): result for result in baseline["results"] if "seconds" in result}
+
+    ok = True
+    print(f"\nCompared with {baseline_path} ({baseline.get('revision')}):")
+    for result in results:
+        before = previous.get(key(result))
+        if before is None or "seconds" not in result or not before["seconds"]:
+            continue
+        ratio = result["seconds"] / before["seconds"]
+        regressed = ratio > 1 + tolerance
+        ok = ok and not regressed
+        print(f"  {result['stage']:<24} {ratio:>6.2f}x" + ("  REGRESSION" if regressed else ""))
+    return ok
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the IPTV player core on synthetic inputs.")
+    parser.add_argument("--sizes", default="1k,10k,100k", help="playlist sizes, e.g. 1k,10k,100k,1m")
+    parser.add_argument("--categories", type=int, default=200, help="number of group-title values")
+    parser.add_argument("--epg", action="append", dest="epg_shapes",
+                        help=f"guide shape CHANNELSxDAYSxPROGRAMMES_PER_DAY, repeatable (default {DEFAULT_EPG_SHAPE})")
+    parser.add_argument("--epg-gzip", action="store_true", help="serve the guides gzip-compressed")
+    parser.add_argument("--logos", type=int, default=500, help="channel logos to thumbnail (0 to skip)")
+    parser.add_argument("--probe", type=int, default=500, help="stream URLs to health-check (0 to skip)")
+    parser.add_argument("--zap", type=int, default=10, help="channel switches to time (0 to skip)")
+    parser.add_argument("--zap-delay", type=float, default=0.25, help="simulated stream start-up time in seconds")
+    parser.add_argument("--zap-media", nargs="+", help="local media files to zap between with libvlc instead of the fake player")
+    parser.add_argument("--buffering", type=int, default=500, help="simulated plays to replay through the buffering policy (0 to skip)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=3, help="timing runs per stage (best is kept)")
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc run of each stage")
+    parser.add_argument("--output", default="bench_results.json", help="where to write the JSON results")
+    parser.add_argument("--baseline", help="previous results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown before a stage counts as regressed")
+    args = parser.parse_args(argv)
+
+    epg_shapes = args.epg_shapes or [DEFAULT_EPG_SHAPE]
+    results = []
+    memory = not args.no_memory
+    harness = TreeHarness.create()
+    with tempfile.TemporaryDirectory(prefix="iptv-bench-") as workdir, serve_directory(workdir) as base_url:
+        for size in args.sizes.split(","):
+            entries = parse_size(size)
+            print(f"Playlist, {entries} entries:")
+            bench_playlist(results, base_url, workdir, entries, args.categories, args.seed, args.repeat, memory, harness)
+        for shape in epg_shapes:
+            channels, days, per_day = parse_epg_shape(shape)
+            print(f"Guide, {channels} channels x {days} days x {per_day} programmes/day:")
+            bench_epg(results, base_url, workdir, channels, days, per_day, args.seed, args.repeat, memory, args.epg_gzip)
+        if args.logos:
+            print(f"Channel logos, {args.logos} images:")
+            bench_logos(results, base_url, workdir, args.logos, args.repeat)
+    if args.probe:
+        print(f"Stream health, {args.probe} streams:")
+        bench_probe(results, args.probe, args.repeat)
+    if args.zap:
+        print(f"Channel switching, {args.zap} switches:")
+        bench_zapping(results, args.zap, args.zap_delay, args.zap_media)
+    if args.buffering:
+        print(f"Adaptive buffering, {args.buffering} simulated plays:")
+        bench_buffering(results, args.buffering, args.seed)
+    if harness is not None:
+        harness.close()
+
+    document = {
+        "revision": git_revision(),
+        "timestamp": int(time.time()),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "arguments": vars(args),
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(document, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+    if args.baseline and not compare(results, args.baseline, args.tolerance):
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
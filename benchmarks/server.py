@@ -0,0 +1,66 @@
+import contextlib
+import functools
+import threading
+import time
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+class StreamStandInHandler(QuietHandler):
+    # Fake stream origin for health checks: /good.m3u8, /good.ts, /master.m3u8 answer at once,
+    # /slow.m3u8 after `slow_delay` seconds, /broken.m3u8 with a page that is not a manifest,
+    # /empty.ts with no body and anything else with 404. A numeric suffix is ignored
+    # (/good-17.m3u8 behaves like /good.m3u8) so many distinct channel URLs can be served.
+    slow_delay = 3.0
+
+    GOOD_MANIFEST = (b"#EXTM3U\n#EXT-X-VERSION:3\n#EXT-X-TARGETDURATION:6\n#EXT-X-MEDIA-SEQUENCE:1\n"
+                     b"#EXTINF:6.0,\nsegment1.ts\n#EXTINF:6.0,\nsegment2.ts\n")
+    MASTER_MANIFEST = b"#EXTM3U\n#EXT-X-STREAM-INF:BANDWIDTH=1280000\ngood.m3u8\n"
+
+    def do_GET(self):
+        path = self.path.split("?", 1)[0].lstrip("/")
+        stem, _, extension = path.rpartition(".")
+        kind = stem.split("-", 1)[0]
+        if kind == "slow":
+            time.sleep(self.slow_delay)
+        if kind in ("good", "slow") and extension == "m3u8":
+            self._reply(self.GOOD_MANIFEST, "application/vnd.apple.mpegurl")
+        elif kind == "master" and extension == "m3u8":
+            self._reply(self.MASTER_MANIFEST, "application/vnd.apple.mpegurl")
+        elif kind == "good" and extension == "ts":
+            self._reply((b"\x47" + bytes(187)) * 2, "video/mp2t")
+        elif kind == "broken":
+            self._reply(b"<html><body>Service unavailable</body></html>", "application/vnd.apple.mpegurl")
+        elif kind == "empty":
+            self._reply(b"", "video/mp2t")
+        else:
+            self.send_error(404)
+
+    def _reply(self, body, content_type):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+@contextlib.contextmanager
+def serve_streams():
+    # Serves StreamStandInHandler on an ephemeral localhost port, yielding the base URL
+    with serve_directory(".", StreamStandInHandler) as base_url:
+        yield base_url
+
+@contextlib.contextmanager
+def serve_directory(directory, handler_class=QuietHandler):
+    # Serves directory on an ephemeral localhost port for the duration of the with block,
+    # yielding the base URL. The standard handler answers If-Modified-Since with 304.
+    handler = functools.partial(handler_class, directory=str(directory))
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}"
+    finally:
+        server.shutdown()
+        server.server_close()
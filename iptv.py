@@ -1,15 +1,254 @@
 import tkinter as tk
 from tkinter import messagebox, scrolledtext, simpledialog
 import tkinter.ttk as ttk
-import requests
-import re
-import vlc
-import xml.etree.ElementTree as ET
+import tkinter.font as tkfont
+import base64
+import bisect
 import configparser
+import io
 import os
+import queue
+import sqlite3
 import threading
-import datetime
-import json
+import time
+from collections import OrderedDict
+
+from iptv_core import ChannelTable, PlaylistModel, FavouritesStore, atomic_write, describe_load_error
+from iptv_core.health import StreamProber, STATUS_OK, STATUS_SLOW, STATUS_BROKEN, STATUS_OFFLINE
+from iptv_core.player import ChannelZapper, VLCBackend, EVENT_PLAYING, EVENT_ERROR, standby_candidate
+from iptv_core.metrics import METRICS, timed
+from iptv_core.guide_grid import GuideGridLayout, GRID_SLOT_SECONDS
+from iptv_core.buffering import BufferingPolicy
+from iptv_core.loading import LoadManager
+from iptv_core.logos import LogoCache, LOGO_SIZE
+from iptv_core.model import (EPG_KEEP_PAST_HOURS, EPG_KEEP_FUTURE_HOURS, LOAD_TABLE, LOAD_ROWS, LOAD_PROGRESS,
+                             LOAD_CHANNELS, LOAD_GUIDE, LOAD_ERROR, LOAD_DONE)
+
+TREE_FILL_SLICE_MS = 15 # Main-thread time spent inserting tree rows before yielding back to Tk
+TREE_FILL_BATCH_SIZE = 64 # Rows inserted between two checks of the time slice
+TREE_AUTO_OPEN_LIMIT = 2000 # Category nodes start expanded when the tree shows at most this many channels
+EPG_DISPLAY_LIMIT = 50 # Upper bound on programmes rendered in the EPG panel per click
+SEARCH_DEBOUNCE_MS = 150 # Quiet period after the last keystroke before the channel list is filtered
+REFRESH_INTERVAL_MINUTES = 60 # Default period of the background playlist/EPG refresh, 0 disables it
+METRICS_DIR = "metrics" # Where metrics.jsonl and metrics.prom are written while metrics are enabled
+METRICS_EXPORT_SECONDS = 30 # Period of the metrics export
+DIAGNOSTICS_REFRESH_MS = 1000 # Update period of the open diagnostics window
+FAVOURITES_SAVE_DELAY_MS = 2000 # Favourite edits made within this period are written to disk together
+GUIDE_SEARCH_LIMIT = 200 # Programmes listed by the guide search window
+EPG_EVICT_MINUTES = 15 # Period of the pass dropping programmes that left the retention window
+GRID_NAME_WIDTH = 180 # Width of the channel name column of the guide grid
+GRID_HEADER_HEIGHT = 24 # Height of the time axis of the guide grid
+GRID_TEXT_PADDING = 4
+GRID_NOW_REFRESH_MS = 60000 # How often the "now" marker of an open guide grid moves
+LOAD_POLL_MS = 50 # How often the main loop takes new rows and progress from a running load
+LOGO_SCAN_DELAY_MS = 100 # Delay between a scroll (or a logo arriving) and updating the logos on screen
+LOGO_VISIBLE_LIMIT = 100 # Channel rows looked at per scan; more than fit on any screen
+LOGO_PHOTO_LIMIT = 300 # Tk images kept alive for logos, least recently shown dropped first
+
+class GuideGridView:
+    # Channels x time guide drawn on a Canvas that is only as large as the window. Scrolling
+    # moves a viewport over the layout's virtual surface and redraws it from a pool of canvas
+    # items that are moved and relabelled rather than created and deleted, so the number of
+    # items, and the drawing cost, follow what is on screen instead of the size of the guide.
+    def __init__(self, parent, on_select=None, on_activate=None):
+        self.on_select = on_select # on_select(grid_row, programme or None)
+        self.on_activate = on_activate # on_activate(grid_row), on double-click
+        self.frame = tk.Frame(parent)
+        self.canvas = tk.Canvas(self.frame, bg="white", highlightthickness=0)
+        self.yscroll = tk.Scrollbar(self.frame, orient=tk.VERTICAL, command=self.yview)
+        self.xscroll = tk.Scrollbar(self.frame, orient=tk.HORIZONTAL, command=self.xview)
+        self.canvas.grid(row=0, column=0, sticky="nsew")
+        self.yscroll.grid(row=0, column=1, sticky="ns")
+        self.xscroll.grid(row=1, column=0, sticky="ew")
+        self.frame.rowconfigure(0, weight=1)
+        self.frame.columnconfigure(0, weight=1)
+
+        self.layout = None
+        self.left = 0 # Viewport origin on the virtual surface of the layout
+        self.top = 0
+        self.selected = None # (row index, programme index or None)
+        self._char_width = max(1, tkfont.nametofont("TkDefaultFont").measure("n"))
+        self._pools = {"cell": [], "name": [], "slot": []} # [(rectangle, text)] per kind of item
+        self._shown = {"cell": 0, "name": 0, "slot": 0} # Items of each pool visible after the last draw
+        self._now_line = self.canvas.create_line(0, 0, 0, 0, fill="red", width=2, state="hidden")
+        self._redraw_job = None
+
+        self.canvas.bind("<Configure>", lambda event: self.schedule_redraw())
+        self.canvas.bind("<Button-1>", self._on_click)
+        self.canvas.bind("<Double-1>", self._on_double_click)
+        self.canvas.bind("<MouseWheel>", lambda event: self._scroll(-1 if event.delta > 0 else 1, "units", True))
+        self.canvas.bind("<Shift-MouseWheel>", lambda event: self._scroll(-1 if event.delta > 0 else 1, "units", False))
+        self.canvas.bind("<Button-4>", lambda event: self._scroll(-1, "units", True))
+        self.canvas.bind("<Button-5>", lambda event: self._scroll(1, "units", True))
+        self.canvas.bind("<Shift-Button-4>", lambda event: self._scroll(-1, "units", False))
+        self.canvas.bind("<Shift-Button-5>", lambda event: self._scroll(1, "units", False))
+        self.canvas.after(GRID_NOW_REFRESH_MS, self._tick)
+
+    def set_layout(self, layout):
+        # Shows a new layout, keeping the time and the rows in view where possible
+        previous = self.layout
+        if previous is not None:
+            self.left = layout.x_for(previous.time_for(self.left))
+        self.layout = layout
+        self.selected = None
+        self.schedule_redraw()
+
+    def scroll_to_time(self, when):
+        if self.layout is not None:
+            area_width, _ = self._area()
+            self.left = self.layout.x_for(when) - area_width // 8
+            self.schedule_redraw()
+
+    def _area(self):
+        # Size of the programme area (the canvas minus the name column and the time axis)
+        return (max(1, self.canvas.winfo_width() - GRID_NAME_WIDTH),
+                max(1, self.canvas.winfo_height() - GRID_HEADER_HEIGHT))
+
+    def yview(self, *args):
+        self._scroll_command(args, True)
+
+    def xview(self, *args):
+        self._scroll_command(args, False)
+
+    def _scroll_command(self, args, vertical):
+        # Scrollbar protocol: ("moveto", fraction) or ("scroll", amount, "units"/"pages")
+        if self.layout is None or not args:
+            return
+        if args[0] == "moveto":
+            total = self.layout.height if vertical else self.layout.width
+            if vertical:
+                self.top = float(args[1]) * total
+            else:
+                self.left = float(args[1]) * total
+            self.schedule_redraw()
+        elif args[0] == "scroll":
+            self._scroll(int(args[1]), args[2], vertical)
+
+    def _scroll(self, amount, what, vertical):
+        if self.layout is None:
+            return
+        area_width, area_height = self._area()
+        if vertical:
+            step = area_height * 0.9 if what == "pages" else self.layout.row_height
+            self.top += amount * step
+        else:
+            step = area_width * 0.9 if what == "pages" else self._slot_width() / 2
+            self.left += amount * step
+        self.schedule_redraw()
+
+    def _slot_width(self):
+        return GRID_SLOT_SECONDS * self.layout.pixels_per_second
+
+    def schedule_redraw(self):
+        # Scroll events arrive faster than frames are worth drawing; they are coalesced
+        if self._redraw_job is None:
+            self._redraw_job = self.canvas.after_idle(self.redraw)
+
+    def _tick(self):
+        if self.canvas.winfo_exists():
+            self.schedule_redraw()
+            self.canvas.after(GRID_NOW_REFRESH_MS, self._tick)
+
+    def _fit(self, text, pixels):
+        chars = int(pixels // self._char_width)
+        if len(text) <= chars:
+            return text
+        return text[:chars - 1] + "\u2026" if chars > 1 else ""
+
+    def _place(self, kind, used, x0, y0, x1, y1, text, fill):
+        # Moves the used-th item pair of a pool into place, creating it only if the pool is short
+        pool = self._pools[kind]
+        if used < len(pool):
+            rectangle, label = pool[used]
+            self.canvas.coords(rectangle, x0, y0, x1, y1)
+            self.canvas.coords(label, x0 + GRID_TEXT_PADDING, (y0 + y1) / 2)
+            self.canvas.itemconfigure(rectangle, fill=fill, state="normal")
+            self.canvas.itemconfigure(label, text=text, state="normal")
+        else:
+            rectangle = self.canvas.create_rectangle(x0, y0, x1, y1, fill=fill, outline="#b0b0b0")
+            label = self.canvas.create_text(x0 + GRID_TEXT_PADDING, (y0 + y1) / 2, text=text, anchor=tk.W)
+            pool.append((rectangle, label))
+        return used + 1
+
+    @timed("guide_grid_draw")
+    def redraw(self):
+        self._redraw_job = None
+        layout = self.layout
+        if layout is None:
+            return
+        area_width, area_height = self._area()
+        self.top = min(max(self.top, 0), max(0, layout.height - area_height))
+        self.left = min(max(self.left, 0), max(0, layout.width - area_width))
+        now = time.time()
+        now_x = layout.x_for(now)
+        used = {"cell": 0, "name": 0, "slot": 0}
+
+        for index in layout.rows_in(self.top, area_height):
+            y0 = GRID_HEADER_HEIGHT + index * layout.row_height - self.top
+            y1 = y0 + layout.row_height
+            row_selected = self.selected is not None and self.selected[0] == index
+            for cell in layout.cells(index, self.left, area_width):
+                x0 = GRID_NAME_WIDTH + max(cell.x0 - self.left, 0)
+                x1 = GRID_NAME_WIDTH + min(cell.x1 - self.left, area_width)
+                if row_selected and self.selected[1] == cell.programme:
+                    fill = "#9cc3ec"
+                elif cell.x0 <= now_x < cell.x1:
+                    fill = "#fff2c2"
+                else:
+                    fill = "#f4f4f4"
+                used["cell"] = self._place("cell", used["cell"], x0, y0, x1, y1,
+                                           self._fit(cell.title, x1 - x0 - 2 * GRID_TEXT_PADDING), fill)
+            used["name"] = self._place("name", used["name"], 0, y0, GRID_NAME_WIDTH, y1,
+                                       self._fit(layout.rows[index].name, GRID_NAME_WIDTH - 2 * GRID_TEXT_PADDING),
+                                       "#cfe0f3" if row_selected else "#e6e6e6")
+
+        for when in layout.slots(self.left, area_width):
+            x0 = GRID_NAME_WIDTH + layout.x_for(when) - self.left
+            x1 = min(x0 + self._slot_width(), GRID_NAME_WIDTH + area_width)
+            used["slot"] = self._place("slot", used["slot"], x0, 0, x1, GRID_HEADER_HEIGHT,
+                                       time.strftime('%a %H:%M', time.localtime(when)), "#d8d8d8")
+
+        for kind, pool in self._pools.items():
+            for rectangle, label in pool[used[kind]:self._shown[kind]]:
+                self.canvas.itemconfigure(rectangle, state="hidden")
+                self.canvas.itemconfigure(label, state="hidden")
+            self._shown[kind] = used[kind]
+
+        now_x = GRID_NAME_WIDTH + now_x - self.left
+        if GRID_NAME_WIDTH <= now_x <= GRID_NAME_WIDTH + area_width:
+            self.canvas.coords(self._now_line, now_x, 0, now_x, GRID_HEADER_HEIGHT + area_height)
+            self.canvas.itemconfigure(self._now_line, state="normal")
+            self.canvas.tag_raise(self._now_line)
+        else:
+            self.canvas.itemconfigure(self._now_line, state="hidden")
+
+        if layout.height:
+            self.yscroll.set(self.top / layout.height, min(1.0, (self.top + area_height) / layout.height))
+        if layout.width:
+            self.xscroll.set(self.left / layout.width, min(1.0, (self.left + area_width) / layout.width))
+
+    def _hit(self, event):
+        # (row index, programme index or None) under the pointer
+        if self.layout is None or event.y < GRID_HEADER_HEIGHT:
+            return None
+        y = self.top + event.y - GRID_HEADER_HEIGHT
+        if event.x < GRID_NAME_WIDTH:
+            index = int(y // self.layout.row_height)
+            return (index, None) if 0 <= index < len(self.layout) else None
+        return self.layout.cell_at(self.left + event.x - GRID_NAME_WIDTH, y)
+
+    def _on_click(self, event):
+        self.selected = self._hit(event)
+        self.schedule_redraw()
+        if self.selected is not None and self.on_select is not None:
+            index, programme = self.selected
+            guide = self.layout.guides[index]
+            self.on_select(self.layout.rows[index], guide[programme] if programme is not None else None)
+
+    def _on_double_click(self, event):
+        hit = self._hit(event)
+        if hit is not None and self.on_activate is not None:
+            self.on_activate(self.layout.rows[hit[0]])
 
 class IPTVPlayerApp:
     def __init__(self, master):
@@ -18,40 +257,80 @@ class IPTVPlayerApp:
         master.state('zoomed') # Maximize the window on load
 
         self.config_file = "config.ini"
+        self.favourites_file = "favourites.json"
+        self.playback_stats_file = os.path.join("cache", "playback.json")
+        self._favourites_save_job = None
         self.m3u_url = ""
         self.epg_url = ""
-        self.channels = {} # Stores all original channels: {category: [{name, url, tvg_id, category}, ...]}
-        self.epg_data = {}
-        self.favourite_channel_keys = set() # Stores a set of (channel_name, category) tuples for quick lookup
-        self.favourites = {} # Stores actual favourite channel data: {category: [{name, url, tvg_id, category}, ...]}
+        self.model = PlaylistModel("cache") # Channels, EPG index, search index and favourites
+        self._tree_pending = {} # Category nodes whose channels are not inserted yet: {node: [rows, next_index]}
+        self._tree_fill_queue = [] # Open category nodes waiting to be filled, most urgent first
+        self._tree_fill_job = None
+        self._filter_job = None
+        self._applied_filter_text = ""
+        self.prober = None # Created when stream health checks are switched on
+        self._probe_rows = {} # {url: rows shown in the channel tree} for routing probe results
+        self.refresh_interval_minutes = REFRESH_INTERVAL_MINUTES
+        self._refresh_job = None
+        self._metrics_export_job = None
+        self.metrics_export_error = None # Why the last export failed, shown in the Diagnostics window
+        self.loads = LoadManager() # The running load or refresh; starting another one cancels it
+        self._load_table = None # The ChannelTable that load fills
+        self._load_nodes = None # {category: (node, rows)} while the tree follows a load, else None
+        self._load_categories = [] # Sorted categories of _load_nodes, matching the tree's node order
+        self._loaded_rows = 0 # Rows of _load_table already handed to the tree
+        self._load_previous = None # (channels, search index) to restore if the load fails
+        self._load_started = 0.0
+        self._channels_loaded = False
+        self.logos = LogoCache(os.path.join("cache", "logos"),
+                               on_ready=lambda url: self.master.after(0, self._schedule_logo_scan))
+        self._logo_photos = OrderedDict() # {logo url: tk.PhotoImage}, in least recently shown order
+        self._logo_scan_job = None
+        self._epg_logo_url = None # Logo of the channel whose guide is shown
 
         self.vlc_instance_created = False
-        self.player = None
-        try:
-            self.instance = vlc.Instance()
-            self.player = self.instance.media_player_new()
-            self.vlc_instance_created = True
+        self.zapper = None # Active player plus the standby player used for fast zapping
+        self.buffering = BufferingPolicy.load(self.playback_stats_file) # Per-channel caching learned from past plays
+        self._video_surfaces = {} # {player: video frame it renders into}
+        self._playing_item = None # (tree, item id) of the channel last started, for picking neighbours
 
-            if self.player:
-                event_manager = self.player.event_manager()
-                event_manager.event_attach(vlc.EventType.MediaPlayerEncounteredError, self._on_vlc_error)
+        self.create_widgets()
+        self.load_config() # Load config, including the favourite channel keys
 
-        except vlc.VlcError as e:
-            messagebox.showerror("VLC Error", f"Failed to initialize VLC: {e}\nPlease ensure VLC Media Player is installed and correctly configured.")
-            master.destroy()
-            return
+        self.master.after(EPG_EVICT_MINUTES * 60000, self._evict_expired_programmes)
 
-        self.create_widgets()
-        self.load_config() # Load config, including favourite_channel_keys
+        # libvlc is loaded once the window is up instead of delaying the first paint
+        self.master.after_idle(self._init_vlc)
 
         if not self.m3u_url:
             self.master.after(100, self.open_url_input_popup)
         else:
             self.master.after(100, lambda: self._start_initial_data_load())
 
+    def _init_vlc(self):
+        try:
+            self.zapper = ChannelZapper(VLCBackend(), on_event=self._on_player_event,
+                                        options_for=self.buffering.media_options)
+            self.vlc_instance_created = True
+        except Exception as e:
+            messagebox.showerror("VLC Error", f"Failed to initialize VLC: {e}\nPlease ensure VLC Media Player is installed and correctly configured.")
+            self.master.destroy()
+            return
+
+        if self.master.winfo_exists():
+            # Both players render into their own frame; the active one is raised above the other
+            active_surface, standby_surface = self.video_surfaces
+            self.zapper.set_outputs(active_surface.winfo_id(), standby_surface.winfo_id())
+            self._video_surfaces = {self.zapper.active: active_surface, self.zapper.standby: standby_surface}
+
     def _start_initial_data_load(self):
-        self.show_loading_popup("Loading channels and EPG...")
-        threading.Thread(target=self._load_data_in_thread, daemon=True).start()
+        # Serve the UI from the local snapshot straight away and revalidate it in the background
+        if self.model.load_cached(self.m3u_url, self.epg_url):
+            self._show_loaded_data()
+            self.start_background_refresh(initial=True)
+            return
+
+        self.start_progressive_load()
 
     def create_widgets(self):
         # Top Frame for controls (only for the Load/Update URL button now)
@@ -60,6 +339,36 @@ class IPTVPlayerApp:
 
         tk.Button(top_frame, text="Load/Update URLs", command=self.open_url_input_popup).pack(side=tk.LEFT, padx=5)
 
+        # Stream health options
+        self.check_health_var = tk.BooleanVar(value=False)
+        self.hide_offline_var = tk.BooleanVar(value=False)
+        self.sort_by_health_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(top_frame, text="Check stream health", variable=self.check_health_var,
+                       command=self.on_health_check_toggle).pack(side=tk.LEFT, padx=5)
+        tk.Checkbutton(top_frame, text="Hide offline", variable=self.hide_offline_var,
+                       command=self.on_health_view_toggle).pack(side=tk.LEFT, padx=5)
+
+        # Fast zapping keeps the likely next channel warming up on a muted standby player
+        self.fast_zap_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(top_frame, text="Fast zapping", variable=self.fast_zap_var,
+                       command=self.on_fast_zap_toggle).pack(side=tk.LEFT, padx=5)
+        self.switch_time_label = tk.Label(top_frame, text="")
+        self.switch_time_label.pack(side=tk.LEFT, padx=5)
+
+        self.metrics_var = tk.BooleanVar(value=False)
+        tk.Button(top_frame, text="Diagnostics", command=self.open_diagnostics_window).pack(side=tk.RIGHT, padx=5)
+        tk.Button(top_frame, text="Search guide", command=self.open_guide_search_window).pack(side=tk.RIGHT, padx=5)
+        tk.Button(top_frame, text="TV guide", command=self.open_guide_grid_window).pack(side=tk.RIGHT, padx=5)
+        tk.Checkbutton(top_frame, text="Sort by health", variable=self.sort_by_health_var,
+                       command=self.on_health_view_toggle).pack(side=tk.LEFT, padx=5)
+
+        # Status bar with the progress of a running load
+        status_frame = tk.Frame(self.master)
+        status_frame.pack(side=tk.BOTTOM, fill=tk.X, padx=5, pady=(0, 5))
+        self.load_progress_bar = ttk.Progressbar(status_frame, orient="horizontal", length=200, mode="determinate")
+        self.load_status_label = tk.Label(status_frame, text="", anchor="w")
+        self.load_status_label.pack(side=tk.LEFT, fill=tk.X, expand=True)
+
         # Main content frame
         main_frame = tk.Frame(self.master)
         main_frame.pack(side=tk.TOP, fill=tk.BOTH, expand=True, padx=5, pady=5)
@@ -96,17 +405,22 @@ class IPTVPlayerApp:
         tk.Label(search_filter_frame, text="Search Channel:").pack(side=tk.LEFT, padx=(0, 2))
         self.search_entry = ttk.Entry(search_filter_frame, width=30)
         self.search_entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(0, 5))
-        self.search_entry.bind("<KeyRelease>", self.filter_channels)
+        self.search_entry.bind("<KeyRelease>", self.on_search_key)
 
         # Scrollbar for the main channel Treeview
         scrollbar = ttk.Scrollbar(channel_list_frame, orient="vertical")
         scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.channel_tree_scrollbar = scrollbar
 
-        self.channel_tree = ttk.Treeview(channel_list_frame, show="tree headings",
-                                         yscrollcommand=scrollbar.set)
+        # Rows are tall enough for a logo thumbnail next to the name
+        ttk.Style(self.master).configure("Channels.Treeview", rowheight=LOGO_SIZE[1] + 4)
+        self.channel_tree = ttk.Treeview(channel_list_frame, show="tree headings", columns=("health",),
+                                         style="Channels.Treeview", yscrollcommand=self._on_channel_tree_scroll)
 
         self.channel_tree.heading("#0", text="Channel Name")
         self.channel_tree.column("#0", width=300, minwidth=200, stretch=True)
+        self.channel_tree.heading("health", text="Health")
+        self.channel_tree.column("health", width=90, minwidth=60, stretch=False)
 
         self.channel_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
 
@@ -115,6 +429,7 @@ class IPTVPlayerApp:
         self.channel_tree.bind("<ButtonRelease-1>", self.on_channel_select)
         self.channel_tree.bind("<Double-1>", self.on_channel_double_click)
         self.channel_tree.bind("<Button-3>", self.on_channel_right_click)
+        self.channel_tree.bind("<<TreeviewOpen>>", self.on_category_open)
 
         # Right: Video Player and EPG Info
         right_frame = tk.Frame(main_frame)
@@ -122,65 +437,93 @@ class IPTVPlayerApp:
 
         self.video_frame = tk.Frame(right_frame, bg="black")
         self.video_frame.pack(side=tk.TOP, fill=tk.BOTH, expand=True)
+        self.video_surfaces = []
+        for _ in range(2):
+            surface = tk.Frame(self.video_frame, bg="black")
+            surface.place(relx=0, rely=0, relwidth=1, relheight=1)
+            self.video_surfaces.append(surface)
+        self.video_surfaces[0].lift()
 
         epg_info_frame = tk.LabelFrame(right_frame, text="EPG Information")
         epg_info_frame.pack(side=tk.BOTTOM, fill=tk.X, pady=5)
 
+        self.epg_logo_label = tk.Label(epg_info_frame)
+        self.epg_logo_label.pack(side=tk.LEFT, anchor="n", padx=5, pady=5)
         self.epg_text = scrolledtext.ScrolledText(epg_info_frame, height=5, wrap=tk.WORD, state=tk.DISABLED)
         self.epg_text.pack(fill=tk.BOTH, expand=True)
 
-        if self.vlc_instance_created and self.player:
-            if self.master.winfo_exists():
-                self.player.set_hwnd(self.video_frame.winfo_id())
-
     def load_config(self):
+        self.model.favourites = FavouritesStore.load(self.favourites_file)
         config = configparser.ConfigParser()
         if os.path.exists(self.config_file):
             config.read(self.config_file)
             if 'Settings' in config:
                 self.m3u_url = config['Settings'].get('m3u_url', '')
                 self.epg_url = config['Settings'].get('epg_url', '')
-                fav_keys_str = config['Settings'].get('favourite_channel_keys', '[]')
+                if 'favourite_channel_keys' in config['Settings'] and not os.path.exists(self.favourites_file):
+                    # Favourites used to live in config.ini; move them to their own file
+                    fav_keys_str = config['Settings'].get('favourite_channel_keys', '[]')
+                    self.model.favourites = FavouritesStore.from_json(fav_keys_str)
+                    self.model.favourites.dirty = True
+                    self.save_favourites()
+                self.check_health_var.set(config['Settings'].getboolean('check_stream_health', False))
+                self.hide_offline_var.set(config['Settings'].getboolean('hide_offline_channels', False))
+                self.sort_by_health_var.set(config['Settings'].getboolean('sort_by_health', False))
+                self.fast_zap_var.set(config['Settings'].getboolean('fast_zapping', False))
+                self.metrics_var.set(config['Settings'].getboolean('metrics_enabled', False))
+                self.on_metrics_toggle()
                 try:
-                    loaded_fav_keys = json.loads(fav_keys_str)
-                    self.favourite_channel_keys = set(tuple(item) for item in loaded_fav_keys)
-                except json.JSONDecodeError:
-                    self.favourite_channel_keys = set()
+                    self.refresh_interval_minutes = max(0, config['Settings'].getint('refresh_interval_minutes', REFRESH_INTERVAL_MINUTES))
+                except ValueError:
+                    self.refresh_interval_minutes = REFRESH_INTERVAL_MINUTES
+                self.model.epg_retention = (self._config_hours(config['Settings'], 'epg_keep_past_hours', EPG_KEEP_PAST_HOURS),
+                                            self._config_hours(config['Settings'], 'epg_keep_future_hours', EPG_KEEP_FUTURE_HOURS))
+                self.model.epg_playlist_channels_only = config['Settings'].getboolean('epg_playlist_channels_only', False)
+                if self.check_health_var.get():
+                    self.on_health_check_toggle()
+
+    def _config_hours(self, settings, key, default):
+        # An empty value means no limit
+        value = settings.get(key, str(default)).strip()
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            return default
 
     def save_config(self):
         config = configparser.ConfigParser()
         config['Settings'] = {
             'm3u_url': self.m3u_url,
             'epg_url': self.epg_url,
-            'favourite_channel_keys': json.dumps(list(self.favourite_channel_keys))
+            'check_stream_health': str(self.check_health_var.get()),
+            'hide_offline_channels': str(self.hide_offline_var.get()),
+            'sort_by_health': str(self.sort_by_health_var.get()),
+            'fast_zapping': str(self.fast_zap_var.get()),
+            'refresh_interval_minutes': str(self.refresh_interval_minutes),
+            'metrics_enabled': str(self.metrics_var.get()),
+            'epg_keep_past_hours': '' if self.model.epg_retention[0] is None else str(self.model.epg_retention[0]),
+            'epg_keep_future_hours': '' if self.model.epg_retention[1] is None else str(self.model.epg_retention[1]),
+            'epg_playlist_channels_only': str(self.model.epg_playlist_channels_only),
         }
-        with open(self.config_file, 'w') as configfile:
-            config.write(configfile)
-
-    def show_loading_popup(self, message="Loading..."):
-        self.loading_popup = tk.Toplevel(self.master)
-        self.loading_popup.title("Loading Data")
-        self.loading_popup.geometry("300x100")
-        self.loading_popup.transient(self.master)
-        self.loading_popup.grab_set()
-        self.loading_popup.protocol("WM_DELETE_WINDOW", lambda: None)
-
-        tk.Label(self.loading_popup, text=message, pady=10).pack()
-
-        self.progress_bar = ttk.Progressbar(self.loading_popup, orient="horizontal", length=200, mode="indeterminate")
-        self.progress_bar.pack(pady=10)
-        self.progress_bar.start(10)
-
-        self.loading_popup.update_idletasks()
-        x = self.master.winfo_x() + (self.master.winfo_width() // 2) - (self.loading_popup.winfo_width() // 2)
-        y = self.master.winfo_y() + (self.master.winfo_height() // 2) - (self.loading_popup.winfo_height() // 2)
-        self.loading_popup.geometry(f"+{x}+{y}")
-
-    def hide_loading_popup(self):
-        if hasattr(self, 'loading_popup') and self.loading_popup.winfo_exists():
-            self.progress_bar.stop()
-            self.loading_popup.destroy()
-            self.master.grab_release()
+        text = io.StringIO()
+        config.write(text)
+        atomic_write(self.config_file, text.getvalue().encode("utf-8"))
+
+    def schedule_favourites_save(self):
+        # Coalesces bursts of favourite edits into one write
+        if self._favourites_save_job is None:
+            self._favourites_save_job = self.master.after(FAVOURITES_SAVE_DELAY_MS, self.save_favourites)
+
+    def save_favourites(self):
+        if self._favourites_save_job is not None:
+            self.master.after_cancel(self._favourites_save_job)
+            self._favourites_save_job = None
+        try:
+            self.model.favourites.save(self.favourites_file)
+        except OSError as e:
+            messagebox.showerror("Error", f"Could not save favourites: {e}")
 
     def open_url_input_popup(self):
         if hasattr(self, 'url_input_popup') and self.url_input_popup.winfo_exists():
@@ -188,16 +531,17 @@ class IPTVPlayerApp:
 
         self.url_input_popup = tk.Toplevel(self.master)
         self.url_input_popup.title("Enter/Update URLs")
-        self.url_input_popup.geometry("400x200")
+        self.url_input_popup.geometry("400x230")
         self.url_input_popup.transient(self.master)
         self.url_input_popup.grab_set()
 
-        tk.Label(self.url_input_popup, text="M3U URL:").pack(pady=5)
+        tk.Label(self.url_input_popup, text="Separate several URLs with spaces; earlier ones take precedence.").pack(pady=(5, 0))
+        tk.Label(self.url_input_popup, text="M3U URL(s):").pack(pady=5)
         self.m3u_entry = tk.Entry(self.url_input_popup, width=50)
         self.m3u_entry.pack(pady=5)
         self.m3u_entry.insert(0, self.m3u_url)
 
-        tk.Label(self.url_input_popup, text="EPG URL:").pack(pady=5)
+        tk.Label(self.url_input_popup, text="EPG URL(s):").pack(pady=5)
         self.epg_entry = tk.Entry(self.url_input_popup, width=50)
         self.epg_entry.pack(pady=5)
         self.epg_entry.insert(0, self.epg_url)
@@ -213,7 +557,7 @@ class IPTVPlayerApp:
         self.url_input_popup.geometry(f"+{x}+{y}")
 
     def _on_url_popup_close_attempt(self):
-        if not self.m3u_url and not (hasattr(self, 'loading_popup') and self.loading_popup.winfo_exists()):
+        if not self.m3u_url and not self.loads.running:
             if messagebox.askyesno("Exit Application?", "No M3U URL loaded. Do you want to exit the application?"):
                 self.master.destroy()
         else:
@@ -221,8 +565,8 @@ class IPTVPlayerApp:
             self.master.grab_release()
 
     def _start_loading_from_popup(self):
-        new_m3u_url = self.m3u_entry.get()
-        new_epg_url = self.epg_entry.get()
+        new_m3u_url = self.m3u_entry.get().strip()
+        new_epg_url = self.epg_entry.get().strip()
 
         if not new_m3u_url:
             messagebox.showerror("Error", "M3U URL cannot be empty.")
@@ -234,108 +578,488 @@ class IPTVPlayerApp:
 
         self.m3u_url = new_m3u_url
         self.epg_url = new_epg_url
+        self.start_progressive_load()
 
-        self.show_loading_popup("Loading channels and EPG...")
-
-        threading.Thread(target=self._load_data_in_thread, daemon=True).start()
-
-    def _load_data_in_thread(self):
-        success = False
-        error_message = ""
-        try:
-            self.channels = {}
-            self.epg_data = {}
-
-            m3u_content = requests.get(self.m3u_url, timeout=20).text
-            self.parse_m3u(m3u_content)
-
-            if self.epg_url:
-                epg_content = requests.get(self.epg_url, timeout=20).text
-                self.parse_epg(epg_content)
-            success = True
+    def _close_url_popup(self):
+        if hasattr(self, 'url_input_popup') and self.url_input_popup.winfo_exists():
+            self.url_input_popup.destroy()
+            self.master.grab_release()
 
-        except requests.exceptions.Timeout:
-            error_message = "Request timed out. Please check the URL or your internet connection."
-        except requests.exceptions.RequestException as e:
-            error_message = f"Could not fetch data: {e}"
-        except Exception as e:
-            error_message = f"An error occurred during parsing: {e}"
-        finally:
-            self.master.after(0, self._on_load_data_complete, success, error_message)
+    def _show_loaded_data(self):
+        self.filter_channels()
+        self.model.favourites.resolve(self.model.channels)
+        self.populate_favourites_tree(self.model.favourites.by_category)
+
+    def start_progressive_load(self):
+        # Loads the configured sources when there is no snapshot to show first. The model streams
+        # them on a worker thread; channels are added to the tree batch by batch while the
+        # playlist is still downloading, and the guide follows once the channel list is complete.
+        # A load or refresh still running is superseded: its downloads are cancelled and
+        # whatever it already showed is rolled back.
+        if self._load_nodes is not None:
+            self._restore_channels_before_load()
+        job = self.loads.begin()
+        self._load_table = None
+        self._loaded_rows = 0
+        self._load_previous = None
+        self._channels_loaded = False
+        self._load_started = time.perf_counter()
+        self.search_entry.delete(0, tk.END)
+        self._set_load_status("Connecting...", 0)
+        threading.Thread(target=self.model.load_progressively,
+                         args=(self.m3u_url, self.epg_url, job.events, job.cancel_event), daemon=True).start()
+        self.master.after(LOAD_POLL_MS, self._poll_load_events, job)
+
+    def _poll_load_events(self, job):
+        # Takes what the load produced since the last poll, for at most one tree fill slice;
+        # of the progress reports only the latest matters. A superseded job is no longer polled,
+        # so none of its events reach the UI.
+        deadline = time.perf_counter() + TREE_FILL_SLICE_MS / 1000
+        progress = None
+        while self.loads.is_current(job) and time.perf_counter() < deadline:
+            try:
+                kind, value = job.events.get_nowait()
+            except queue.Empty:
+                break
+            if kind == LOAD_PROGRESS:
+                progress = value
+            elif kind == LOAD_TABLE:
+                self._load_table = value
+            elif kind == LOAD_ROWS:
+                self._append_loaded_rows(value)
+            elif kind == LOAD_CHANNELS:
+                self.loads.publish(job, self._on_channels_loaded, value)
+            elif kind == LOAD_GUIDE:
+                self.loads.publish(job, self.apply_model_update, value)
+            elif kind == LOAD_ERROR:
+                self._on_load_error(value)
+            elif kind == LOAD_DONE:
+                self._on_load_done(job)
+                return
+        if not self.loads.is_current(job):
+            return
+        if progress is not None:
+            self._show_load_progress(progress)
+        self.master.after(LOAD_POLL_MS, self._poll_load_events, job)
+
+    def _set_load_status(self, text, percent=None):
+        # percent=None when the size is unknown: the bar then just shows activity
+        self.load_status_label.config(text=text)
+        if not self.load_progress_bar.winfo_ismapped():
+            self.load_progress_bar.pack(side=tk.RIGHT, padx=5, before=self.load_status_label)
+        if percent is None:
+            self.load_progress_bar.config(mode="indeterminate")
+            self.load_progress_bar.step(5)
+        else:
+            self.load_progress_bar.config(mode="determinate", value=percent)
 
-    def _on_load_data_complete(self, success, error_message):
-        self.hide_loading_popup()
+    def _show_load_progress(self, progress):
+        if progress.stage == "channels":
+            text = "Loading channels" + (f" ({progress.source}/{progress.sources})" if progress.sources > 1 else "")
+        else:
+            text = "Loading guide"
+        percent = None
+        if progress.total:
+            percent = min(100.0, progress.received * 100 / progress.total)
+            text += f": {percent:.0f}%"
+        else:
+            text += f": {progress.received / 1048576:.1f} MB"
+        if self._loaded_rows:
+            text += f", {self._loaded_rows} channels"
+        self._set_load_status(text, percent)
+
+    def _switch_to_loading_table(self):
+        # Called with the first rows of a load: from now on the tree and model.channels follow the
+        # table being filled. Favourites are matched against it once it is complete.
+        self._load_previous = (self.model.channels, self.model.search_index)
+        self.model.channels = self._load_table
+        self.model.favourites.resolve(ChannelTable())
+        self._cancel_tree_fill()
+        self.channel_tree.delete(*self.channel_tree.get_children())
+        self._tree_pending = {}
+        self._probe_rows = {}
+        self._load_nodes = {}
+        self._load_categories = []
+        self._applied_filter_text = ""
+        self.favourites_tree.delete(*self.favourites_tree.get_children())
+        self.favourites_tree.insert("", "end", text="Loading...")
+        if self._guide_grid_open():
+            self.guide_grid.set_layout(GuideGridLayout.for_playlist(ChannelTable(), self.model.epg_index))
+        self._close_url_popup()
+        METRICS.observe("load_first_visible", time.perf_counter() - self._load_started)
+
+    def _append_loaded_rows(self, count):
+        # Shows the rows of the loading table up to `count`. A new category gets its node at its
+        # sorted place; rows of a known category extend the list its node fills from, so open
+        # nodes keep filling in time slices while closed ones cost nothing until opened.
+        if count <= self._loaded_rows:
+            return
+        if self._load_nodes is None:
+            self._switch_to_loading_table()
+        tree = self.channel_tree
+        for category, rows in self._load_table.group_rows(range(self._loaded_rows, count)).items():
+            entry = self._load_nodes.get(category)
+            if entry is None:
+                index = bisect.bisect(self._load_categories, category)
+                self._load_categories.insert(index, category)
+                node = tree.insert("", index, text=category, open=False)
+                tree.insert(node, "end", text="Loading...", tags=("placeholder",))
+                self._load_nodes[category] = (node, rows)
+                self._tree_pending[node] = [rows, 0]
+                continue
+            node, category_rows = entry
+            if node not in self._tree_pending:
+                # Already filled: continue after the rows it shows
+                self._tree_pending[node] = [category_rows, len(category_rows)]
+                if tree.item(node, "open"):
+                    self._tree_fill_queue.append(node)
+            category_rows.extend(rows)
+        self._loaded_rows = count
+        if self._tree_fill_queue and self._tree_fill_job is None:
+            self._fill_tree_slice()
+
+    def _on_channels_loaded(self, update):
+        # The table is complete; the tree already shows it unless a search or health view has to
+        # be applied, or the list is small enough to show every category expanded. With several
+        # playlists the rows that arrived ahead of an earlier playlist's duplicates come as a diff.
+        diff = self.model.apply(update)
+        self._channels_loaded = True
+        following = self._load_nodes is not None
+        replaced = diff is None and update.channels is not self._load_table
+        self._load_nodes = None
+        self._load_previous = None
+        if (not following or replaced or self.search_entry.get() or len(self.model.channels) <= TREE_AUTO_OPEN_LIMIT
+                or (self.prober is not None and (self.hide_offline_var.get() or self.sort_by_health_var.get()))):
+            self.filter_channels()
+        elif diff is not None:
+            self._refresh_channel_tree(self._channel_view(), diff.changed)
+        self._refresh_favourites_tree()
+        if self._guide_grid_open():
+            self.guide_grid.set_layout(GuideGridLayout.for_playlist(self.model.channels, self.model.epg_index))
+        self._close_url_popup()
+        self.save_config()
+        self.search_entry.focus_set()
+        self._schedule_refresh()
+
+    def _on_load_error(self, error):
+        error_message = describe_load_error(error)
+        if self._channels_loaded:
+            messagebox.showwarning("Warning", f"The channels were loaded, but not the guide.\n{error_message}")
+            return
 
+        if self._load_nodes is not None:
+            self._restore_channels_before_load()
         if hasattr(self, 'url_input_popup') and self.url_input_popup.winfo_exists():
             self.m3u_entry.config(state=tk.NORMAL)
             self.epg_entry.config(state=tk.NORMAL)
             self.load_save_button.config(state=tk.NORMAL)
-            self.url_input_popup.destroy()
-            self.master.grab_release()
-
-        if success:
-            self.populate_channel_tree(self.channels)
-            self._rebuild_favourites_from_all_channels()
-            self.populate_favourites_tree(self.favourites)
-            self.save_config()
-            self.search_entry.delete(0, tk.END)
-            self.search_entry.focus_set()
+        messagebox.showerror("Error", error_message)
+        if not self.m3u_url:
+            self.open_url_input_popup()
         else:
-            messagebox.showerror("Error", error_message)
-            if not self.m3u_url:
-                self.open_url_input_popup()
-            else:
-                messagebox.showwarning("Warning", "Previous URLs might still be in use if you don't update.")
-
-    def parse_m3u(self, m3u_content):
-        lines = m3u_content.strip().split('\n')
-        current_channel_info = {}
-
-        parsed_channels_temp = {}
-
-        for line in lines:
-            line = line.strip()
-            if line.startswith("#EXTINF:"):
-                match = re.search(r'group-title="([^"]*)"', line)
-                category = match.group(1) if match else "Uncategorized"
-
-                match = re.search(r',(.+)$', line)
-                channel_name = match.group(1).strip() if match else "Unknown Channel"
-
-                tvg_id_match = re.search(r'tvg-id="([^"]*)"', line)
-                tvg_id = tvg_id_match.group(1) if tvg_id_match else None
-
-                current_channel_info = {
-                    "name": channel_name,
-                    "category": category, 
-                    "tvg_id": tvg_id,
-                }
-            elif line and not line.startswith("#"):
-                if current_channel_info:
-                    channel_url = line
-                    # Get category from current_channel_info, where it's correctly stored
-                    category = current_channel_info["category"]
-                    channel_name = current_channel_info["name"]
-                    tvg_id = current_channel_info["tvg_id"]
-
-                    if category not in parsed_channels_temp:
-                        parsed_channels_temp[category] = []
-                    parsed_channels_temp[category].append({
-                        "name": channel_name,
-                        "url": channel_url,
-                        "tvg_id": tvg_id,
-                        "category": category # Ensures category is part of the final channel dict
-                    })
-                current_channel_info = {}
-        self.channels = parsed_channels_temp
+            messagebox.showwarning("Warning", "Previous URLs might still be in use if you don't update.")
+
+    def _restore_channels_before_load(self):
+        # Goes back to the channels shown before the load the tree was following
+        self.model.channels, self.model.search_index = self._load_previous
+        self._load_nodes = None
+        self._load_previous = None
+        self.filter_channels()
+        self._refresh_favourites_tree()
+        if self._guide_grid_open():
+            self.guide_grid.set_layout(GuideGridLayout.for_playlist(self.model.channels, self.model.epg_index))
+
+    def _on_load_done(self, job):
+        self.loads.finish(job)
+        self._load_table = None
+        self.load_progress_bar.pack_forget()
+        self.load_status_label.config(text="")
+
+    def _schedule_refresh(self):
+        if self._refresh_job is not None:
+            self.master.after_cancel(self._refresh_job)
+            self._refresh_job = None
+        if self.refresh_interval_minutes > 0:
+            self._refresh_job = self.master.after(self.refresh_interval_minutes * 60000, self.start_background_refresh)
+
+    def start_background_refresh(self, initial=False):
+        # Revalidates every source on a worker thread while the UI stays fully usable. The new
+        # data is diffed against what is shown and applied in one step on the Tk thread. A
+        # refresh is a load job like any other, so loading new URLs cancels it.
+        self._refresh_job = None
+        if self.loads.running or not self.m3u_url:
+            self._schedule_refresh()
+            return
+        job = self.loads.begin()
+        sources = (self.m3u_url, self.epg_url)
+        threading.Thread(target=self._refresh_in_thread, args=(job, sources, initial), daemon=True).start()
 
+    def _refresh_in_thread(self, job, sources, initial):
+        update = None
+        error_message = ""
+        try:
+            with METRICS.timer("refresh"):
+                update = self.model.fetch(*sources, reconcile=True, cancel=job.cancel_event)
+        except Exception as e:
+            error_message = describe_load_error(e)
+        finally:
+            self.master.after(0, self._on_refresh_complete, job, update, error_message, initial)
+
+    def _on_refresh_complete(self, job, update, error_message, initial):
+        if not self.loads.finish(job):
+            return # Superseded by a load of other URLs; its data is outdated
+        self._schedule_refresh()
+        if error_message:
+            if initial:
+                messagebox.showwarning("Warning", f"Could not refresh channels, showing cached data.\n{error_message}")
+            return
+        if update:
+            self.apply_model_update(update)
+
+    def apply_model_update(self, update):
+        # Swaps a fetched update into the model and brings the trees in line with it. Channels
+        # keep their row ids (= item ids) across a reconciled update, so only the added, removed
+        # and changed channels cost tree work; selection, scroll position and playback stay put.
+        diff = self.model.apply(update)
+        if update.channels is not None:
+            if diff is None:
+                self.filter_channels()
+            else:
+                self._refresh_channel_tree(self._channel_view(), diff.changed)
+            self._refresh_favourites_tree()
+
+        selected = self.channel_tree.selection() or self.favourites_tree.selection()
+        row = self._row_for_item(selected[0]) if selected else None
+        if row is not None and not self.model.channels.is_hole(row):
+            tvg_id = self.model.channels.tvg_ids[row]
+            if update.channels is not None or (update.epg_index is not None and
+                                               (update.epg_changed is None or tvg_id in update.epg_changed)):
+                self.display_epg_info(tvg_id)
+
+        if (update.channels is not None or update.epg_index is not None) and self._guide_grid_open():
+            self.guide_grid.set_layout(GuideGridLayout.for_playlist(self.model.channels, self.model.epg_index))
+
+    def _evict_expired_programmes(self):
+        # Keeps the in-memory guide to the retention window over long sessions
+        if self.model.evict_expired() and self._guide_grid_open():
+            self.guide_grid.set_layout(GuideGridLayout.for_playlist(self.model.channels, self.model.epg_index))
+        self.master.after(EPG_EVICT_MINUTES * 60000, self._evict_expired_programmes)
+
+    def _refresh_favourites_tree(self):
+        selection = self.favourites_tree.selection()
+        self.model.favourites.resolve(self.model.channels)
+        self.populate_favourites_tree(self.model.favourites.by_category)
+        kept = [item for item in selection if self.favourites_tree.exists(item)]
+        if kept:
+            self.favourites_tree.selection_set(kept)
+
+    @timed("refresh_channel_tree")
+    def _refresh_channel_tree(self, channels_to_display, changed_rows):
+        # Edits the channel tree in place to show channels_to_display. Categories whose rows did
+        # not change are left alone; categories that are not filled yet just get new pending rows.
+        tree = self.channel_tree
+        first_visible = tree.yview()[0]
+        names = self.model.channels.names
+        nodes = {tree.item(node, "text"): node for node in tree.get_children()}
+
+        for category, node in nodes.items():
+            if category not in channels_to_display:
+                self._forget_category_node(node)
+                tree.delete(node)
+
+        # First drop stale rows everywhere, so a channel that moved category can be re-inserted
+        filled = {}
+        for category, node in nodes.items():
+            rows = channels_to_display.get(category)
+            if rows is None:
+                continue
+            if node in self._tree_pending:
+                pending = self._tree_pending[node]
+                if pending[1] == 0:
+                    pending[0] = rows
+                else:
+                    self._reset_category_node(node, rows)
+                continue
+            children = [int(item) for item in tree.get_children(node)]
+            if children == list(rows):
+                continue
+            wanted = set(rows)
+            stale = [row for row in children if row not in wanted]
+            if stale:
+                tree.delete(*stale)
+            filled[node] = ([row for row in children if row in wanted], rows)
+
+        inserted_urls = []
+        for node, (kept, rows) in filled.items():
+            present = set(kept)
+            if kept != [row for row in rows if row in present]:
+                self._reset_category_node(node, rows) # Reordered: cheaper to refill than to move
+                continue
+            for index, row in enumerate(rows):
+                if row not in present:
+                    self._insert_channel_item(node, index, row, inserted_urls)
+
+        categories = sorted(channels_to_display)
+        for index, category in enumerate(categories):
+            if category not in nodes:
+                node = tree.insert("", index, text=category, open=False)
+                tree.insert(node, "end", text="Loading...", tags=("placeholder",))
+                self._tree_pending[node] = [channels_to_display[category], 0]
+
+        for row in changed_rows:
+            if tree.exists(row):
+                tree.item(row, text=names[row])
+
+        tree.yview_moveto(first_visible)
+        if self.prober is not None and inserted_urls:
+            self.prober.submit(inserted_urls)
+        if self._tree_fill_queue and self._tree_fill_job is None:
+            self._fill_tree_slice()
+
+    def _forget_category_node(self, node):
+        self._tree_pending.pop(node, None)
+        if node in self._tree_fill_queue:
+            self._tree_fill_queue.remove(node)
+
+    def _reset_category_node(self, node, rows):
+        # Empties a category node and lets the time-sliced fill insert rows again
+        self.channel_tree.delete(*self.channel_tree.get_children(node))
+        self.channel_tree.insert(node, "end", text="Loading...", tags=("placeholder",))
+        self._tree_pending[node] = [rows, 0]
+        if self.channel_tree.item(node, "open") and node not in self._tree_fill_queue:
+            self._tree_fill_queue.append(node)
+
+    def _insert_channel_item(self, category_node, index, row, inserted_urls):
+        # The item id is the channel's row id; nothing else is copied into Tk
+        url = self.model.channels.urls[row]
+        self.channel_tree.insert(category_node, index, iid=row, text=self.model.channels.names[row],
+                                 values=(self._health_label(url),))
+        self._probe_rows.setdefault(url, []).append(row)
+        inserted_urls.append(url)
+
+    @timed("populate_channel_tree")
     def populate_channel_tree(self, channels_to_display):
+        # channels_to_display maps each category to the row ids (in self.model.channels) to show.
+        # Only category nodes are created here; a category's channels are inserted when it is
+        # opened, in time-sliced batches, so large playlists never freeze the main loop.
+        self._cancel_tree_fill()
         self.channel_tree.delete(*self.channel_tree.get_children())
+        self._tree_pending = {}
+        self._probe_rows = {}
+
+        open_all = sum(len(rows) for rows in channels_to_display.values()) <= TREE_AUTO_OPEN_LIMIT
         for category in sorted(channels_to_display.keys()):
-            category_node = self.channel_tree.insert("", "end", text=category, open=True)
-            for channel in channels_to_display[category]:
-                self.channel_tree.insert(category_node, "end", text=channel["name"],
-                                         tags=(channel["url"], channel["tvg_id"], channel["category"], channel["name"]))
+            category_node = self.channel_tree.insert("", "end", text=category, open=open_all)
+            self.channel_tree.insert(category_node, "end", text="Loading...", tags=("placeholder",))
+            self._tree_pending[category_node] = [channels_to_display[category], 0]
+            if open_all:
+                self._tree_fill_queue.append(category_node)
+
+        if self._tree_fill_queue:
+            self._fill_tree_slice()
+
+    def on_category_open(self, event):
+        category_node = self.channel_tree.focus()
+        if category_node not in self._tree_pending:
+            return
+        if category_node in self._tree_fill_queue:
+            self._tree_fill_queue.remove(category_node)
+        self._tree_fill_queue.insert(0, category_node)
+        if self._tree_fill_job is None:
+            self._fill_tree_slice()
+
+    def _cancel_tree_fill(self):
+        if self._tree_fill_job is not None:
+            self.master.after_cancel(self._tree_fill_job)
+            self._tree_fill_job = None
+        self._tree_fill_queue = []
+
+    @timed("tree_fill_slice")
+    def _fill_tree_slice(self):
+        self._tree_fill_job = None
+        deadline = time.perf_counter() + TREE_FILL_SLICE_MS / 1000
+        inserted_urls = []
+
+        while self._tree_fill_queue and time.perf_counter() < deadline:
+            category_node = self._tree_fill_queue[0]
+            rows, position = self._tree_pending[category_node]
+            if position == 0:
+                self.channel_tree.delete(*self.channel_tree.get_children(category_node))
+
+            end = len(rows)
+            while position < end:
+                batch_end = min(position + TREE_FILL_BATCH_SIZE, end)
+                for row in rows[position:batch_end]:
+                    self._insert_channel_item(category_node, "end", row, inserted_urls)
+                position = batch_end
+                if time.perf_counter() >= deadline:
+                    break
+
+            if position < end:
+                self._tree_pending[category_node][1] = position
+            else:
+                del self._tree_pending[category_node]
+                self._tree_fill_queue.pop(0)
+
+        if self.prober is not None and inserted_urls:
+            self.prober.submit(inserted_urls) # Only channels that made it into the tree get checked
+
+        if self._tree_fill_queue:
+            self._tree_fill_job = self.master.after(1, self._fill_tree_slice)
+
+    def _health_label(self, url):
+        if self.prober is None:
+            return ""
+        result = self.prober.result(url)
+        if result is None:
+            return ""
+        if result.status == STATUS_OK:
+            return f"\u25cf {result.ttfb * 1000:.0f} ms"
+        if result.status == STATUS_SLOW:
+            return f"slow {result.ttfb:.1f} s"
+        if result.status == STATUS_BROKEN:
+            return "broken"
+        return "offline"
+
+    def on_health_check_toggle(self):
+        if self.check_health_var.get():
+            if self.prober is None:
+                self.prober = StreamProber(on_result=lambda url, result: self.master.after(0, self._on_probe_result, url))
+            self.prober.submit(list(self._probe_rows))
+        elif self.prober is not None:
+            self.prober.shutdown()
+            self.prober = None
+            for rows in self._probe_rows.values():
+                for row in rows:
+                    self.channel_tree.set(row, "health", "")
+
+    def on_health_view_toggle(self):
+        self.filter_channels()
+
+    def _on_probe_result(self, url):
+        label = self._health_label(url)
+        for row in self._probe_rows.get(url, ()):
+            if self.channel_tree.exists(row):
+                self.channel_tree.set(row, "health", label)
+
+    def _apply_health_view(self, channels_to_display):
+        # Hides unusable streams and/or orders each category by health, as far as results exist
+        hide_offline = self.hide_offline_var.get()
+        sort_by_health = self.sort_by_health_var.get()
+        if self.prober is None or not (hide_offline or sort_by_health):
+            return channels_to_display
+
+        urls = self.model.channels.urls
+        prober = self.prober
+        view = {}
+        for category, rows in channels_to_display.items():
+            if hide_offline:
+                rows = [row for row in rows if prober.status(urls[row]) not in (STATUS_OFFLINE, STATUS_BROKEN)]
+            if sort_by_health:
+                rows = sorted(rows, key=lambda row: prober.rank(urls[row]))
+            if rows:
+                view[category] = rows
+        return view
 
     def populate_favourites_tree(self, favourites_to_display):
         self.favourites_tree.delete(*self.favourites_tree.get_children())
@@ -343,138 +1067,110 @@ class IPTVPlayerApp:
             self.favourites_tree.insert("", "end", text="No favourites added yet.")
             return
 
+        names = self.model.channels.names
         for category in sorted(favourites_to_display.keys()):
             category_node = self.favourites_tree.insert("", "end", text=category, open=True)
-            for channel in favourites_to_display[category]:
-                self.favourites_tree.insert(category_node, "end", text=channel["name"],
-                                           tags=(channel["url"], channel["tvg_id"], channel["category"], channel["name"]))
-
-    def parse_epg(self, epg_content):
-        try:
-            root = ET.fromstring(epg_content)
-            for channel_elem in root.findall('channel'):
-                channel_id = channel_elem.get('id')
-                if channel_id:
-                    self.epg_data[channel_id] = []
-                    for display_name_elem in channel_elem.findall('display-name'):
-                        if display_name_elem.text:
-                            self.epg_data[channel_id].append({"display_name": display_name_elem.text.strip()})
-
-            for programme_elem in root.findall('programme'):
-                channel_id = programme_elem.get('channel')
-                if channel_id in self.epg_data:
-                    title_elem = programme_elem.find('title')
-                    desc_elem = programme_elem.find('desc')
-                    start_time = programme_elem.get('start')
-                    stop_time = programme_elem.get('stop')
-
-                    program_info = {
-                        "title": title_elem.text if title_elem is not None and title_elem.text else "N/A",
-                        "description": desc_elem.text if desc_elem is not None and desc_elem.text else "No description",
-                        "start": start_time,
-                        "stop": stop_time,
-                    }
-                    if program_info["title"] != "N/A" or program_info["description"] != "No description":
-                        self.epg_data[channel_id].append(program_info)
-        except ET.ParseError as e:
-            raise ValueError(f"EPG XML parsing error: {e}")
-        except Exception as e:
-            raise ValueError(f"General EPG parsing error: {e}")
-
+            for row in favourites_to_display[category]:
+                self.favourites_tree.insert(category_node, "end", iid=row, text=names[row])
+
+    def on_search_key(self, event=None):
+        # Keystrokes are debounced: only the text present once typing pauses is searched
+        if self._filter_job is not None:
+            self.master.after_cancel(self._filter_job)
+            self._filter_job = None
+        if self.search_entry.get() != self._applied_filter_text:
+            self._filter_job = self.master.after(SEARCH_DEBOUNCE_MS, self.filter_channels)
+
+    @timed("filter_channels")
     def filter_channels(self, event=None):
-        filter_text = self.search_entry.get().strip().lower()
-        filtered_channels_temp = {}
-
-        if not filter_text:
-            self.populate_channel_tree(self.channels)
-            return
-
-        for category, channels_list in self.channels.items():
-            for channel in channels_list:
-                if filter_text in channel["name"].lower():
-                    if category not in filtered_channels_temp:
-                        filtered_channels_temp[category] = []
-                    filtered_channels_temp[category].append(channel)
-
-        self.populate_channel_tree(filtered_channels_temp)
-
-    def _rebuild_favourites_from_all_channels(self):
-        self.favourites = {}
-        for category_name, channels_list in self.channels.items(): # 'category_name' is the key
-            for channel in channels_list: # 'channel' is a dict containing 'category'
-                # Use channel["category"] to form the key, which is now consistently available
-                channel_key = (channel["name"], channel["category"])
-                if channel_key in self.favourite_channel_keys:
-                    if category_name not in self.favourites:
-                        self.favourites[category_name] = []
-                    # Add the full channel dict to favourites
-                    self.favourites[category_name].append(channel)
-
-    def add_to_favourites(self, channel_info):
-        channel_name = channel_info["name"]
-        category = channel_info["category"]
-        channel_key = (channel_name, category)
-
-        if channel_key not in self.favourite_channel_keys:
-            self.favourite_channel_keys.add(channel_key)
-            if category not in self.favourites:
-                self.favourites[category] = []
-            self.favourites[category].append(channel_info)
-            self.populate_favourites_tree(self.favourites)
-            self.save_config()
+        self._filter_job = None
+        if self._load_nodes is not None:
+            return # The tree is following a load; the view is applied once the list is complete
+        self._applied_filter_text = self.search_entry.get()
+        self.populate_channel_tree(self._channel_view())
+
+    def _channel_view(self):
+        # {category: rows} the channel tree should show for the applied search and health options
+        search_index = self.model.search_index
+        matches = search_index.search(self._applied_filter_text)
+        if matches is None:
+            channels_to_display = self.model.channels.by_category()
+        else:
+            channels_to_display = search_index.group_by_category(matches)
+        return self._apply_health_view(channels_to_display)
+
+    def add_to_favourites(self, row):
+        channel_name = self.model.channels.names[row]
+        if self.model.favourites.add(row):
+            self.populate_favourites_tree(self.model.favourites.by_category)
+            self.schedule_favourites_save()
             messagebox.showinfo("favourites", f"'{channel_name}' added to favourites.")
         else:
             messagebox.showinfo("favourites", f"'{channel_name}' is already in favourites.")
 
-    def remove_from_favourites(self, channel_info):
-        channel_name = channel_info["name"]
-        category = channel_info["category"]
-        channel_key = (channel_name, category)
-
-        if channel_key in self.favourite_channel_keys:
-            self.favourite_channel_keys.remove(channel_key)
-            if category in self.favourites:
-                self.favourites[category] = [
-                    c for c in self.favourites[category]
-                    if not (c["name"] == channel_name and c["category"] == category)
-                ]
-                if not self.favourites[category]:
-                    del self.favourites[category]
-            self.populate_favourites_tree(self.favourites)
-            self.save_config()
+    def remove_from_favourites(self, row):
+        channel_name = self.model.channels.names[row]
+        if self.model.favourites.remove(row):
+            self.populate_favourites_tree(self.model.favourites.by_category)
+            self.schedule_favourites_save()
             messagebox.showinfo("favourites", f"'{channel_name}' removed from favourites.")
         else:
             messagebox.showinfo("favourites", f"'{channel_name}' is not in favourites.")
 
-    def _on_vlc_error(self, event):
-        self.master.after(0, self._handle_vlc_error_on_main_thread)
+    def _on_player_event(self, event, url, value=None):
+        # Called from libvlc's event thread
+        self.buffering.observe(event, url, value)
+        if event == EVENT_ERROR:
+            self.master.after(0, self._handle_vlc_error_on_main_thread)
+        elif event == EVENT_PLAYING:
+            self.master.after(0, self._on_playing_on_main_thread, url)
+
+    def _on_playing_on_main_thread(self, url):
+        if not self.zapper or self.zapper.current_url != url:
+            return
+        if self.zapper.switches and self.zapper.switches[-1].url == url:
+            switch = self.zapper.switches[-1]
+            self.switch_time_label.config(text=f"Switch: {switch.seconds * 1000:.0f} ms" + (" (warm)" if switch.warm else ""))
+        # Only start warming the next channel once the current one no longer competes for bandwidth
+        self._prewarm_next_channel()
 
     def _handle_vlc_error_on_main_thread(self):
-        if self.player:
-            self.player.stop()
+        if self.zapper:
+            self.zapper.stop()
 
         messagebox.showerror("Stream Error", "The selected stream encountered an error and could not be played. Please try another channel.")
         self.display_epg_info(None)
 
+    def _row_for_item(self, item_id):
+        # Channel items of both trees use their row id in self.model.channels as item id;
+        # category nodes and placeholders have Tk-generated ids instead
+        return int(item_id) if item_id.isdigit() else None
+
     def on_channel_select(self, event):
         widget = event.widget
         selected_items = widget.selection()
         if not selected_items:
             self.display_epg_info(None)
+            self._show_channel_logo(None)
             return
 
         item_id = selected_items[0]
 
         if not widget.parent(item_id):
             self.display_epg_info(None)
+            self._show_channel_logo(None)
             return
 
-        item_tags = widget.item(item_id, "tags")
-        if item_tags and len(item_tags) > 1:
-            tvg_id = item_tags[1]
-            self.display_epg_info(tvg_id)
+        row = self._row_for_item(item_id)
+        if row is not None:
+            self.display_epg_info(self.model.channels.tvg_ids[row])
+            self._show_channel_logo(self.model.channels.logos[row])
+            if self.zapper and self.fast_zap_var.get():
+                # A click usually precedes the double-click that plays the channel
+                self.zapper.prewarm(self.model.channels.urls[row])
         else:
             self.display_epg_info(None)
+            self._show_channel_logo(None)
 
     def on_channel_double_click(self, event):
         widget = event.widget
@@ -483,11 +1179,10 @@ class IPTVPlayerApp:
             messagebox.showinfo("Info", "Please double-click a channel, not a category.")
             return
 
-        item_tags = widget.item(item_id, "tags")
-
-        if item_tags:
-            channel_url = item_tags[0]
-            self.play_stream(channel_url)
+        row = self._row_for_item(item_id)
+        if row is not None:
+            self._playing_item = (widget, item_id)
+            self.play_stream(self.model.channels.urls[row])
         else:
             messagebox.showinfo("Info", "Could not retrieve channel information.")
 
@@ -500,110 +1195,379 @@ class IPTVPlayerApp:
 
         widget.selection_set(item_id)
 
-        item_tags = widget.item(item_id, "tags")
-        if not item_tags or len(item_tags) < 4:
-            return
-
-        channel_info = {
-            "name": item_tags[3],
-            "url": item_tags[0],
-            "tvg_id": item_tags[1],
-            "category": item_tags[2]
-        }
+        row = self._row_for_item(item_id)
+        if row is None or self._load_nodes is not None:
+            return # Favourites are only matched against a complete channel list
 
         context_menu = tk.Menu(self.master, tearoff=0)
-        channel_key = (channel_info["name"], channel_info["category"])
 
-        if channel_key in self.favourite_channel_keys:
+        if row in self.model.favourites:
             context_menu.add_command(label="Remove from favourites",
-                                      command=lambda: self.remove_from_favourites(channel_info))
+                                      command=lambda: self.remove_from_favourites(row))
         else:
             context_menu.add_command(label="Add to favourites",
-                                      command=lambda: self.add_to_favourites(channel_info))
+                                      command=lambda: self.add_to_favourites(row))
 
         context_menu.post(event.x_root, event.y_root)
 
+    @timed("play_stream")
     def play_stream(self, url):
-        if not self.player:
+        if not self.zapper:
             messagebox.showerror("Playback Error", "VLC player not initialized. Cannot play stream.")
             return
 
-        if self.player.is_playing():
-            self.player.stop()
+        self.switch_time_label.config(text="")
+        if self.zapper.play(url):
+            self._video_surfaces[self.zapper.active].lift()
 
-        media = self.instance.media_new(url)
-        self.player.set_media(media)
-        self.player.play()
+    def on_fast_zap_toggle(self):
+        if not self.zapper:
+            return
+        if self.fast_zap_var.get():
+            self._prewarm_next_channel()
+        else:
+            self.zapper.cancel_prewarm()
 
+    def _prewarm_next_channel(self):
+        if not self.zapper or not self.fast_zap_var.get():
+            return
+        neighbours = []
+        if self._playing_item is not None:
+            tree, item_id = self._playing_item
+            if tree.exists(item_id):
+                for sibling in (tree.next(item_id), tree.prev(item_id)):
+                    row = self._row_for_item(sibling) if sibling else None
+                    if row is not None:
+                        neighbours.append(self.model.channels.urls[row])
+        favourites = [self.model.channels.urls[row]
+                      for rows in self.model.favourites.by_category.values() for row in rows]
+        url = standby_candidate(self.zapper.current_url, neighbours, self.zapper.recent, favourites)
+        if url:
+            self.zapper.prewarm(url)
+
+    @timed("display_epg_info")
     def display_epg_info(self, tvg_id):
         self.epg_text.config(state=tk.NORMAL)
         self.epg_text.delete(1.0, tk.END)
 
-        if tvg_id and tvg_id in self.epg_data:
-            info = self.epg_data[tvg_id]
+        guide = self.model.epg_index.get(tvg_id) if tvg_id else None
+        if guide is not None:
             epg_display_text = ""
-            current_time = datetime.datetime.now(datetime.timezone.utc) # Get current UTC time
-
-            display_name = None
-            programs_to_display = []
-            for item in info:
-                if "display_name" in item:
-                    display_name = item["display_name"]
-                elif "title" in item:
-                    try:
-                        start_dt = datetime.datetime.strptime(item['start'][:14], "%Y%m%d%H%M%S")
-                        stop_dt = datetime.datetime.strptime(item['stop'][:14], "%Y%m%d%H%M%S")
-
-                        start_dt = start_dt.replace(tzinfo=datetime.timezone.utc)
-                        stop_dt = stop_dt.replace(tzinfo=datetime.timezone.utc)
-
-                        if stop_dt >= current_time:
-                            programs_to_display.append(item)
-
-                    except ValueError:
-                        pass
-            
-            if display_name:
-                epg_display_text += f"Channel: {display_name}\n\n"
-
-            if not programs_to_display: # Use programs_to_display after filtering
+            now = int(time.time())
+
+            if guide.display_name:
+                epg_display_text += f"Channel: {guide.display_name}\n\n"
+
+            programmes_to_display = guide.upcoming(now, limit=EPG_DISPLAY_LIMIT)
+            if not programmes_to_display:
                 epg_display_text += "No current or upcoming EPG program data available for this channel."
             else:
-                # Sort programs by start time
-                programs_to_display.sort(key=lambda x: datetime.datetime.strptime(x['start'][:14], "%Y%m%d%H%M%S"))
+                for programme in programmes_to_display:
+                    if programme.start <= now < programme.stop:
+                        epg_display_text += "--- NOW PLAYING ---\n"
+
+                    local_start = time.strftime('%H:%M', time.localtime(programme.start))
+                    local_stop = time.strftime('%H:%M', time.localtime(programme.stop))
+                    epg_display_text += f"  Title: {programme.title}\n"
+                    epg_display_text += f"  Time: {local_start} - {local_stop} (Local Time)\n"
+                    epg_display_text += f"  Desc: {programme.description}\n\n"
+        else:
+            epg_display_text = "No EPG data available for this channel or Stream Error."
 
-                for item in programs_to_display:
-                    try:
-                        start_dt = datetime.datetime.strptime(item['start'][:14], "%Y%m%d%H%M%S")
-                        stop_dt = datetime.datetime.strptime(item['stop'][:14], "%Y%m%d%H%M%S")
+        self.epg_text.insert(tk.END, epg_display_text)
+        self.epg_text.config(state=tk.DISABLED)
 
-                        start_dt = start_dt.replace(tzinfo=datetime.timezone.utc)
-                        stop_dt = stop_dt.replace(tzinfo=datetime.timezone.utc)
+    def _on_channel_tree_scroll(self, first, last):
+        self.channel_tree_scrollbar.set(first, last)
+        self._schedule_logo_scan()
+
+    def _schedule_logo_scan(self):
+        # Coalesces scrolling, opening categories and arriving logos into one scan
+        if self._logo_scan_job is None:
+            self._logo_scan_job = self.master.after(LOGO_SCAN_DELAY_MS, self._update_visible_logos)
+
+    def _show_channel_logo(self, url):
+        self._epg_logo_url = url
+        if self._logo_scan_job is not None:
+            self.master.after_cancel(self._logo_scan_job)
+        self._update_visible_logos()
+
+    def _visible_channel_rows(self):
+        # Row ids of the channel items on screen, top to bottom
+        tree = self.channel_tree
+        rows = []
+        item = ""
+        for y in range(1, 64, 4): # The first row starts below the heading
+            item = tree.identify_row(y)
+            if item:
+                break
+        while item and len(rows) < LOGO_VISIBLE_LIMIT and tree.bbox(item):
+            row = self._row_for_item(item)
+            if row is not None:
+                rows.append(row)
+            # Next item in display order: first child of an open node, else the next sibling of
+            # the item or of its closest ancestor that has one
+            children = tree.get_children(item) if tree.item(item, "open") else ()
+            if children:
+                item = children[0]
+                continue
+            while item and not tree.next(item):
+                item = tree.parent(item)
+            item = tree.next(item) if item else ""
+        return rows
+
+    def _logo_photo(self, url):
+        # Tk image of a logo that is in memory, or None while it is not (or cannot be had)
+        photo = self._logo_photos.get(url)
+        if photo is not None:
+            self._logo_photos.move_to_end(url)
+            return photo
+        _, logo = self.logos.get(url)
+        if logo is None:
+            return None
+        photo = tk.PhotoImage(data=base64.b64encode(logo.data))
+        if logo.subsample > 1:
+            photo = photo.subsample(logo.subsample)
+        self._logo_photos[url] = photo
+        if len(self._logo_photos) > LOGO_PHOTO_LIMIT:
+            self._logo_photos.popitem(last=False) # Items still showing it are refreshed by the next scan
+        return photo
+
+    @timed("update_visible_logos")
+    def _update_visible_logos(self):
+        # Shows the logos that are in memory for the EPG panel and the rows on screen, and
+        # requests the others in that order; rows scrolled away meanwhile are not fetched
+        self._logo_scan_job = None
+        wanted = []
+        photo = self._logo_photo(self._epg_logo_url) if self._epg_logo_url else None
+        self.epg_logo_label.config(image=photo or "")
+        if self._epg_logo_url and photo is None:
+            wanted.append(self._epg_logo_url)
+        logos = self.model.channels.logos
+        for row in self._visible_channel_rows():
+            url = logos[row]
+            if not url:
+                continue
+            photo = self._logo_photo(url)
+            if photo is None:
+                wanted.append(url)
+            else:
+                self.channel_tree.item(row, image=photo)
+        self.logos.request(wanted)
+
+    def _guide_grid_open(self):
+        return hasattr(self, 'guide_grid_window') and self.guide_grid_window.winfo_exists()
 
-                        is_current = start_dt <= current_time < stop_dt
-                        if is_current:
-                            epg_display_text += "--- NOW PLAYING ---\n"
+    def open_guide_grid_window(self):
+        if self._guide_grid_open():
+            self.guide_grid_window.lift()
+            return
 
-                        local_timezone = datetime.datetime.now().astimezone().tzinfo
-                        local_start = start_dt.astimezone(local_timezone)
-                        local_stop = stop_dt.astimezone(local_timezone)
+        self.guide_grid_window = tk.Toplevel(self.master)
+        self.guide_grid_window.title("TV guide")
+        self.guide_grid_window.geometry("1100x600")
+
+        controls = tk.Frame(self.guide_grid_window)
+        controls.pack(side=tk.TOP, fill=tk.X, padx=5, pady=5)
+        tk.Button(controls, text="Now", command=lambda: self.guide_grid.scroll_to_time(time.time())).pack(side=tk.LEFT)
+        self.guide_grid_label = tk.Label(controls, text="Double-click a channel to play it.", anchor=tk.W)
+        self.guide_grid_label.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+
+        self.guide_grid = GuideGridView(self.guide_grid_window, on_select=self._on_guide_grid_select,
+                                        on_activate=self._on_guide_grid_activate)
+        self.guide_grid.frame.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+        self.guide_grid.set_layout(GuideGridLayout.for_playlist(self.model.channels, self.model.epg_index))
+        self.guide_grid_window.update_idletasks() # The viewport size is needed to place "now"
+        self.guide_grid.scroll_to_time(time.time())
+
+    def _on_guide_grid_select(self, grid_row, programme):
+        if programme is None:
+            self.guide_grid_label.config(text=grid_row.name)
+            return
+        local_start = time.strftime('%a %H:%M', time.localtime(programme.start))
+        local_stop = time.strftime('%H:%M', time.localtime(programme.stop))
+        self.guide_grid_label.config(text=f"{grid_row.name}  {local_start}-{local_stop}  {programme.title}: "
+                                          f"{programme.description}")
+
+    def _on_guide_grid_activate(self, grid_row):
+        url = self.model.channels.urls[grid_row.row]
+        if url is None:
+            return # Dropped by a refresh since the grid was drawn
+        self._playing_item = None
+        self.display_epg_info(grid_row.channel_id)
+        self.play_stream(url)
+
+    def open_guide_search_window(self):
+        if hasattr(self, 'guide_search_window') and self.guide_search_window.winfo_exists():
+            self.guide_search_window.lift()
+            return
 
-                        epg_display_text += f"  Title: {item['title']}\n"
-                        epg_display_text += f"  Time: {local_start.strftime('%H:%M')} - {local_stop.strftime('%H:%M')} (Local Time)\n"
-                    except ValueError:
-                        epg_display_text += f"  Title: {item['title']}\n"
-                        epg_display_text += f"  Time: N/A (Format Error)\n"
+        self.guide_search_window = tk.Toplevel(self.master)
+        self.guide_search_window.title("Search guide")
+        self.guide_search_window.geometry("720x420")
+        self._guide_search_job = None
+        self._guide_matches = []
+
+        controls = tk.Frame(self.guide_search_window)
+        controls.pack(side=tk.TOP, fill=tk.X, padx=5, pady=5)
+        self.guide_search_var = tk.StringVar()
+        entry = tk.Entry(controls, textvariable=self.guide_search_var)
+        entry.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        entry.bind("<KeyRelease>", self.on_guide_search_key)
+        entry.focus_set()
+        self.guide_include_past_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(controls, text="Include past", variable=self.guide_include_past_var,
+                       command=self.search_guide).pack(side=tk.LEFT, padx=5)
+        tk.Button(controls, text="Play", command=self.play_guide_match).pack(side=tk.LEFT, padx=5)
+
+        self.guide_results = ttk.Treeview(self.guide_search_window, columns=("channel", "time", "title"), show="headings")
+        self.guide_results.heading("channel", text="Channel")
+        self.guide_results.heading("time", text="Time")
+        self.guide_results.heading("title", text="Title")
+        self.guide_results.column("channel", width=160)
+        self.guide_results.column("time", width=150)
+        self.guide_results.column("title", width=380)
+        self.guide_results.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+        self.guide_results.bind("<Double-1>", self.play_guide_match)
+        self.guide_status_label = tk.Label(self.guide_search_window, text="", anchor=tk.W)
+        self.guide_status_label.pack(side=tk.BOTTOM, fill=tk.X, padx=5)
+
+    def on_guide_search_key(self, event=None):
+        if self._guide_search_job is not None:
+            self.master.after_cancel(self._guide_search_job)
+        self._guide_search_job = self.master.after(SEARCH_DEBOUNCE_MS, self.search_guide)
+
+    @timed("search_guide")
+    def search_guide(self):
+        self._guide_search_job = None
+        start = None if self.guide_include_past_var.get() else int(time.time())
+        try:
+            self._guide_matches = self.model.programme_db.search(self.guide_search_var.get(), start=start,
+                                                                 limit=GUIDE_SEARCH_LIMIT)
+        except sqlite3.Error as e:
+            self._guide_matches = []
+            self.guide_status_label.config(text=f"Guide search failed: {e}")
+            return
 
-                    epg_display_text += f"  Desc: {item['description']}\n\n"
+        self.guide_results.delete(*self.guide_results.get_children())
+        for index, match in enumerate(self._guide_matches):
+            when = time.strftime('%a %d %b %H:%M', time.localtime(match.start))
+            when += time.strftime('-%H:%M', time.localtime(match.stop))
+            self.guide_results.insert("", tk.END, iid=str(index),
+                                      values=(match.display_name or match.channel_id, when, match.title))
+        count = len(self._guide_matches)
+        text = f"{count} programmes" + (" (first ones only)" if count >= GUIDE_SEARCH_LIMIT else "")
+        if self.model.programme_error is not None:
+            text += f"; the guide database could not be updated and may be outdated: {self.model.programme_error}"
+        self.guide_status_label.config(text=text)
+
+    def play_guide_match(self, event=None):
+        selection = self.guide_results.selection()
+        if not selection:
+            return
+        match = self._guide_matches[int(selection[0])]
+        if self._load_nodes is not None:
+            messagebox.showinfo("Info", "The channel list is still loading.", parent=self.guide_search_window)
+            return
+        channels = self.model.channels
+        rows = [row for row in channels.rows_for_tvg_id(match.channel_id) if channels.urls[row]]
+        if not rows:
+            messagebox.showinfo("Info", f"{match.display_name or match.channel_id} is not in the playlist.",
+                                parent=self.guide_search_window)
+            return
+        self._playing_item = None
+        self.display_epg_info(match.channel_id)
+        self.play_stream(channels.urls[rows[0]])
+
+    def on_metrics_toggle(self):
+        METRICS.enabled = self.metrics_var.get()
+        if self._metrics_export_job is not None:
+            self.master.after_cancel(self._metrics_export_job)
+            self._metrics_export_job = None
+        if METRICS.enabled:
+            self._metrics_export_job = self.master.after(METRICS_EXPORT_SECONDS * 1000, self._export_metrics)
+
+    def _export_metrics(self):
+        self._metrics_export_job = None
+        try:
+            METRICS.flush_journal(os.path.join(METRICS_DIR, "metrics.jsonl"))
+            METRICS.write_prometheus(os.path.join(METRICS_DIR, "metrics.prom"))
+            self.metrics_export_error = None
+        except OSError as e:
+            self.metrics_export_error = str(e)
+            METRICS.increment("metrics_export_errors")
+        if METRICS.enabled:
+            self._metrics_export_job = self.master.after(METRICS_EXPORT_SECONDS * 1000, self._export_metrics)
+
+    def open_diagnostics_window(self):
+        if hasattr(self, 'diagnostics_window') and self.diagnostics_window.winfo_exists():
+            self.diagnostics_window.lift()
+            return
+
+        self.diagnostics_window = tk.Toplevel(self.master)
+        self.diagnostics_window.title("Diagnostics")
+        self.diagnostics_window.geometry("640x420")
+
+        controls = tk.Frame(self.diagnostics_window)
+        controls.pack(side=tk.TOP, fill=tk.X, padx=5, pady=5)
+        tk.Checkbutton(controls, text="Collect metrics", variable=self.metrics_var,
+                       command=self._on_diagnostics_metrics_toggle).pack(side=tk.LEFT)
+        tk.Button(controls, text="Reset", command=METRICS.reset).pack(side=tk.LEFT, padx=5)
+        self.diagnostics_export_label = tk.Label(controls, anchor=tk.W)
+        self.diagnostics_export_label.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+
+        self.diagnostics_text = scrolledtext.ScrolledText(self.diagnostics_window, wrap=tk.NONE, font=("Courier", 9))
+        self.diagnostics_text.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+        self._update_diagnostics()
+
+    def _on_diagnostics_metrics_toggle(self):
+        self.on_metrics_toggle()
+        self.save_config()
+
+    def _update_diagnostics(self):
+        if not (hasattr(self, 'diagnostics_window') and self.diagnostics_window.winfo_exists()):
+            return
+        if not METRICS.enabled:
+            text = "Metrics are disabled. Tick \"Collect metrics\" to start measuring."
         else:
-            epg_display_text = "No EPG data available for this channel or Stream Error."
+            lines = [f"{'Metric':<34} {'Count':>7} {'Last':>10} {'Mean':>10} {'Max':>10}"]
+            for kind, name, labels, values in METRICS.snapshot():
+                label = name + ("{" + ",".join(f"{k}={v}" for k, v in labels.items()) + "}" if labels else "")
+                if kind == "timer":
+                    lines.append(f"{label:<34} {values['count']:>7} {values['last'] * 1000:>8.1f}ms "
+                                 f"{values['mean'] * 1000:>8.1f}ms {values['max'] * 1000:>8.1f}ms")
+                else:
+                    lines.append(f"{label:<34} {values['value']:>7}")
+            text = "\n".join(lines)
+        if self.metrics_export_error is not None:
+            self.diagnostics_export_label.config(text=f"Export failed: {self.metrics_export_error}")
+        else:
+            self.diagnostics_export_label.config(text=f"Exported to {os.path.abspath(METRICS_DIR)}")
 
-        self.epg_text.insert(tk.END, epg_display_text)
-        self.epg_text.config(state=tk.DISABLED)
+        yview = self.diagnostics_text.yview()[0]
+        self.diagnostics_text.config(state=tk.NORMAL)
+        self.diagnostics_text.delete(1.0, tk.END)
+        self.diagnostics_text.insert(tk.END, text)
+        self.diagnostics_text.config(state=tk.DISABLED)
+        self.diagnostics_text.yview_moveto(yview)
+        self.master.after(DIAGNOSTICS_REFRESH_MS, self._update_diagnostics)
 
     def on_closing(self):
-        if self.player and self.player.is_playing():
-            self.player.stop()
+        self.loads.cancel()
+        self.logos.shutdown()
+        self.save_favourites()
+        if METRICS.enabled:
+            self._export_metrics()
+        if self._refresh_job is not None:
+            self.master.after_cancel(self._refresh_job)
+        if self.prober is not None:
+            self.prober.shutdown()
+        if self.zapper:
+            self.zapper.close()
+        try:
+            self.buffering.save(self.playback_stats_file)
+        except OSError:
+            pass # Only costs the learned caching; the next start uses the defaults
         self.master.destroy()
 
 if __name__ == "__main__":
@@ -0,0 +1,21 @@
+# GUI-free core of the IPTV player: playlist and XMLTV parsing, the EPG index, channel search,
+# favourites, stream health checks, channel logos, the player abstraction and the local source
+# cache. Nothing here imports tkinter, and requests, xml.etree, Pillow and vlc are only imported
+# once a download, a guide parse, a logo or a VLC player actually happens.
+from .buffering import BufferingPolicy, StreamStats
+from .cache import SourceCache, atomic_open, atomic_write
+from .channels import Channel, ChannelDiff, ChannelTable
+from .epg import ChannelGuide, EPGIndex, Programme, parse_xmltv_time
+from .epg_pool import EPGProcessPool, default_pool
+from .favourites import FavouritesStore
+from .guide_grid import GridCell, GridRow, GuideGridLayout
+from .health import ProbeResult, StreamProber, probe_stream
+from .loading import LoadJob, LoadManager
+from .logos import LogoCache, LogoImage, make_thumbnail
+from .metrics import METRICS, Metrics, timed
+from .m3u import iter_m3u_channels, parse_extinf
+from .player import ChannelZapper, FakeBackend, VLCBackend, standby_candidate
+from .programmes import ProgrammeDatabase, ProgrammeMatch, fts_query
+from .model import LoadCancelled, LoadProgress, ModelUpdate, PlaylistModel, describe_load_error, parse_m3u, parse_epg, split_urls
+from .search import ChannelSearchIndex, normalize_search_text
+from .xmltv import iter_xmltv, open_decompressed_stream
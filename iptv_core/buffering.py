@@ -0,0 +1,227 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlsplit
+
+from .cache import atomic_write
+from .metrics import METRICS
+from .player import EVENT_ERROR, EVENT_PLAYING, EVENT_STALL, EVENT_STALL_END, EVENT_STARTING, EVENT_STOPPED
+
+CACHING_DEFAULT_MS = 1000 # libvlc's own network-caching, used for sources nothing is known about
+CACHING_MIN_MS = 300 # Floor for fast, stable sources; lower values stall on ordinary jitter
+CACHING_MAX_MS = 10000
+CACHING_STALL_FACTOR = 1.5 # Growth of the caching on every stall, on top of the stall's length
+CACHING_CALM_FACTOR = 0.85 # Reduction earned by each CALM_SECONDS without a stall
+CALM_SECONDS = 120 # Stall-free playback that lowers the caching one step
+FAST_START_SECONDS = 1.0 # A start reaching EVENT_PLAYING this quickly...
+FAST_START_CREDIT = 30 # ...counts as this many seconds of stall-free playback
+STARTUP_SMOOTHING = 0.3 # Weight of the latest start-up time in its moving average
+STATS_LIMIT = 2000 # Channels remembered, least recently played dropped first
+
+class StreamStats:
+    # Playback history of one channel or one host, and the caching it has earned
+    def __init__(self, caching_ms=CACHING_DEFAULT_MS):
+        self.plays = 0 # Starts that reached EVENT_PLAYING
+        self.errors = 0
+        self.startup_seconds = None # Moving average over cold starts
+        self.stalls = 0
+        self.stall_seconds = 0.0
+        self.watched_seconds = 0.0
+        self.caching_ms = caching_ms
+        self.calm_seconds = 0.0 # Stall-free playback not yet turned into a reduction
+
+    def started(self, seconds):
+        if self.startup_seconds is None:
+            self.startup_seconds = seconds
+        else:
+            self.startup_seconds += STARTUP_SMOOTHING * (seconds - self.startup_seconds)
+        if seconds <= FAST_START_SECONDS:
+            self.calm(FAST_START_CREDIT)
+
+    def calm(self, seconds):
+        self.calm_seconds += seconds
+        while self.calm_seconds >= CALM_SECONDS:
+            self.calm_seconds -= CALM_SECONDS
+            self.caching_ms = max(CACHING_MIN_MS, int(self.caching_ms * CACHING_CALM_FACTOR))
+
+    def stalled(self, seconds):
+        # A stall (or a playing stream failing) raises the caching enough to have ridden it out
+        self.stalls += 1
+        self.stall_seconds += seconds
+        self.calm_seconds = 0.0
+        self.caching_ms = min(CACHING_MAX_MS, int(self.caching_ms * CACHING_STALL_FACTOR + seconds * 1000))
+
+    def to_dict(self):
+        return dict(vars(self))
+
+    @classmethod
+    def from_dict(cls, values):
+        stats = cls()
+        for name, value in values.items():
+            if name in vars(stats):
+                setattr(stats, name, value)
+        return stats
+
+class _Session:
+    # The play of one url on the active player, from EVENT_STARTING to EVENT_STOPPED
+    def __init__(self, url, started, warm):
+        self.url = url
+        self.started = started
+        self.warm = warm
+        self.playing_since = None # Start of the current stretch of uninterrupted playback
+        self.stalled_since = None
+
+def host_of(url):
+    return urlsplit(url).hostname or ""
+
+class BufferingPolicy:
+    # Chooses libvlc's network-caching and live-caching per channel from how its earlier plays
+    # went. observe() takes the ChannelZapper events of the active player (EVENT_STARTING,
+    # EVENT_PLAYING, EVENT_STALL, EVENT_STALL_END, EVENT_ERROR, EVENT_STOPPED) and keeps
+    # StreamStats per channel url and per host; media_options() turns them into options for the
+    # next play. Every stall multiplies the caching by CACHING_STALL_FACTOR and adds its length;
+    # every CALM_SECONDS of stall-free playback (fast starts count for FAST_START_CREDIT) takes
+    # CACHING_CALM_FACTOR off it. A channel never played yet gets its host's value, so a new
+    # channel of a flaky provider starts with a deep buffer.
+    # observe() may be called from libvlc's event thread; pass `now` to replay a recorded or
+    # simulated event stream.
+    def __init__(self, channels=None, hosts=None, clock=time.monotonic):
+        self.channels = OrderedDict(channels or {}) # {url: StreamStats}, least recently played first
+        self.hosts = dict(hosts or {}) # {host: StreamStats}
+        self.clock = clock
+        self.dirty = False
+        self._session = None
+        self._lock = threading.Lock()
+
+    def caching_ms(self, url):
+        with self._lock:
+            stats = self.channels.get(url)
+            if stats is None or not stats.plays:
+                stats = self.hosts.get(host_of(url))
+            return stats.caching_ms if stats is not None and stats.plays else CACHING_DEFAULT_MS
+
+    def media_options(self, url):
+        # libvlc media options for playing url
+        caching = self.caching_ms(url)
+        return (f":network-caching={caching}", f":live-caching={caching}")
+
+    def _stats(self, url):
+        # (channel stats, host stats) of url, created as needed; called with the lock held
+        host = host_of(url)
+        host_stats = self.hosts.get(host)
+        if host_stats is None:
+            host_stats = self.hosts[host] = StreamStats()
+        stats = self.channels.get(url)
+        if stats is None:
+            stats = self.channels[url] = StreamStats(host_stats.caching_ms if host_stats.plays else CACHING_DEFAULT_MS)
+            if len(self.channels) > STATS_LIMIT:
+                self.channels.popitem(last=False)
+        else:
+            self.channels.move_to_end(url)
+        return stats, host_stats
+
+    def observe(self, event, url, value=None, now=None):
+        if now is None:
+            now = self.clock()
+        with self._lock:
+            session = self._session
+            if event == EVENT_STARTING:
+                # value: True if a warmed-up standby was swapped in, so start-up was not measured
+                self._end_session(now)
+                self._session = _Session(url, now, bool(value))
+                return
+            if session is None or session.url != url:
+                return
+            if event == EVENT_STOPPED:
+                self._end_session(now)
+                return
+
+            both = self._stats(url)
+            if event == EVENT_PLAYING:
+                if session.playing_since is not None:
+                    return
+                session.playing_since = now
+                for stats in both:
+                    stats.plays += 1
+                    if not session.warm:
+                        stats.started(now - session.started)
+            elif event == EVENT_STALL:
+                self._played(session, both, now)
+                session.stalled_since = now
+            elif event == EVENT_STALL_END:
+                seconds = value if value is not None else now - (session.stalled_since or now)
+                session.stalled_since = None
+                session.playing_since = now
+                for stats in both:
+                    stats.stalled(seconds)
+                METRICS.increment("buffering_adjustments", reason="stall")
+            elif event == EVENT_ERROR:
+                for stats in both:
+                    stats.errors += 1
+                if session.playing_since is not None:
+                    # Dropping out mid-play is a stall that never recovered
+                    self._played(session, both, now)
+                    for stats in both:
+                        stats.stalled(0.0)
+                    METRICS.increment("buffering_adjustments", reason="error")
+                self._session = None
+            self.dirty = True
+
+    def _played(self, session, both, now):
+        # Credits the playback since the last start or stall; called with the lock held
+        if session.playing_since is None:
+            return
+        seconds = now - session.playing_since
+        session.playing_since = None
+        for stats in both:
+            stats.watched_seconds += seconds
+            stats.calm(seconds)
+
+    def _end_session(self, now):
+        session, self._session = self._session, None
+        if session is None or (session.playing_since is None and session.stalled_since is None):
+            return
+        both = self._stats(session.url)
+        if session.stalled_since is not None:
+            # Switched away while rebuffering; that wait counts as a stall
+            for stats in both:
+                stats.stalled(now - session.stalled_since)
+        else:
+            self._played(session, both, now)
+        self.dirty = True
+
+    def to_json(self):
+        with self._lock:
+            return json.dumps({"channels": {url: stats.to_dict() for url, stats in self.channels.items()},
+                               "hosts": {host: stats.to_dict() for host, stats in self.hosts.items()}})
+
+    @classmethod
+    def from_json(cls, text):
+        try:
+            data = json.loads(text)
+            return cls({url: StreamStats.from_dict(values) for url, values in data["channels"].items()},
+                       {host: StreamStats.from_dict(values) for host, values in data["hosts"].items()})
+        except (json.JSONDecodeError, TypeError, KeyError, AttributeError):
+            return cls()
+
+    @classmethod
+    def load(cls, path):
+        # A policy without history if path does not exist or cannot be read
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return cls.from_json(f.read())
+        except OSError:
+            return cls()
+
+    def save(self, path):
+        # Writes the statistics to path (temp file + rename) if they changed since the last save
+        if not self.dirty:
+            return False
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        atomic_write(path, self.to_json().encode("utf-8"))
+        self.dirty = False
+        return True
@@ -0,0 +1,84 @@
+import contextlib
+import os
+import time
+import json
+import hashlib
+import pickle
+import tempfile
+
+CACHE_FORMAT_VERSION = 4 # Bump whenever the pickled channel/EPG structures change shape
+
+def _current_umask():
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+_FILE_MODE = 0o666 & ~_current_umask() # What open() would have created the file with
+
+@contextlib.contextmanager
+def atomic_open(path, mode="wb", **kwargs):
+    # Yields a fresh temp file next to path, opened with mode, and renames it into place once
+    # the with block completes, so readers never see a torn file and concurrent writers of path
+    # never share a temp file. If the block raises, path is left as it was.
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=os.path.basename(path) + ".",
+                                    suffix=".tmp")
+    try:
+        with os.fdopen(fd, mode, **kwargs) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_path, _FILE_MODE) # mkstemp() makes it private
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+def atomic_write(path, data):
+    with atomic_open(path) as f:
+        f.write(data)
+
+class SourceCache:
+    # Local snapshots of parsed playlists/guides, one pickle per source URL, stored next to the
+    # HTTP validators (ETag/Last-Modified) needed to revalidate them with a conditional request.
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _path(self, url, suffix):
+        return os.path.join(self.directory, hashlib.sha1(url.encode("utf-8")).hexdigest() + suffix)
+
+    def _metadata(self, url):
+        try:
+            with open(self._path(url, ".json"), "r", encoding="utf-8") as f:
+                metadata = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return metadata if metadata.get("version") == CACHE_FORMAT_VERSION and metadata.get("url") == url else {}
+
+    def conditional_headers(self, url):
+        metadata = self._metadata(url)
+        headers = {}
+        if metadata.get("etag"):
+            headers["If-None-Match"] = metadata["etag"]
+        if metadata.get("last_modified"):
+            headers["If-Modified-Since"] = metadata["last_modified"]
+        return headers
+
+    def load(self, url):
+        # Returns the cached parsed data for url, or None on a miss or an unreadable snapshot
+        if not url or not self._metadata(url):
+            return None
+        try:
+            with open(self._path(url, ".pickle"), "rb") as f:
+                return pickle.load(f)
+        except Exception:
+            return None
+
+    def store(self, url, payload, etag=None, last_modified=None):
+        os.makedirs(self.directory, exist_ok=True)
+        atomic_write(self._path(url, ".pickle"), pickle.dumps(payload, protocol=pickle.HIGHEST_PROTOCOL))
+        metadata = {"version": CACHE_FORMAT_VERSION, "url": url, "etag": etag,
+                    "last_modified": last_modified, "stored_at": int(time.time())}
+        atomic_write(self._path(url, ".json"), json.dumps(metadata).encode("utf-8"))
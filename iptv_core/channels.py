@@ -0,0 +1,227 @@
+from array import array
+from collections import namedtuple
+
+Channel = namedtuple("Channel", ["row", "name", "url", "tvg_id", "category", "tvg_logo"])
+
+# Row ids (in the reconciled table) of the channels that were added or changed by a refresh, and
+# of the channels that disappeared, whose rows are now holes
+ChannelDiff = namedtuple("ChannelDiff", ["added", "removed", "changed"])
+
+# Attributes that get their own column; everything else from the #EXTINF line goes to `extras`
+_COLUMN_KEYS = frozenset(("name", "url", "tvg_id", "category", "tvg_logo", "tvg_name"))
+
+class ChannelTable:
+    # All channels of a playlist stored column-wise and addressed by a small integer row id.
+    # Category strings are interned once and referenced by index, so a channel costs a few list
+    # slots instead of a dict, and the GUI only has to remember the row id of each tree item.
+    def __init__(self):
+        self.names = []
+        self.urls = []
+        self.tvg_ids = [] # None when the entry has no tvg-id
+        self.logos = [] # None when the entry has no tvg-logo
+        self.category_ids = array("I")
+        self.categories = [] # Interned category names, indexed by category id
+        self.category_rows = [] # Row ids of each category, indexed by category id, in playlist order
+        self.extras = {} # {row: {attribute: value}} for the rarer attributes (catchup, tvg-chno, ...)
+        self.holes = 0 # Rows of removed channels left behind by reconcile(): empty name, url None
+        self._category_lookup = {}
+        self._tvg_rows = None # {tvg_id: row, or [rows] when shared}, built by build_lookup()
+        self._name_rows = None # {(name, category id): first row}, built by build_lookup()
+
+    def __len__(self):
+        # Number of row ids, including holes
+        return len(self.names)
+
+    def is_hole(self, row):
+        return self.urls[row] is None
+
+    @classmethod
+    def from_channels(cls, channels):
+        # Builds a table from channel dicts such as the ones yielded by iter_m3u_channels
+        table = cls()
+        for channel in channels:
+            table.append_channel(channel)
+        return table
+
+    def category_id(self, category):
+        category_id = self._category_lookup.get(category)
+        if category_id is None:
+            category_id = self._category_lookup[category] = len(self.categories)
+            self.categories.append(category)
+            self.category_rows.append(array("I"))
+        return category_id
+
+    def append(self, name, url, tvg_id=None, category="Uncategorized", tvg_logo=None, extras=None):
+        row = len(self.names)
+        category_id = self.category_id(category)
+        self.names.append(name)
+        self.urls.append(url)
+        self.tvg_ids.append(tvg_id or None)
+        self.logos.append(tvg_logo or None)
+        self.category_ids.append(category_id)
+        self.category_rows[category_id].append(row)
+        if extras:
+            self.extras[row] = extras
+        self._tvg_rows = self._name_rows = None
+        return row
+
+    def append_channel(self, channel):
+        extras = {key: value for key, value in channel.items() if key not in _COLUMN_KEYS}
+        if channel.get("tvg_name") and channel["tvg_name"] != channel["name"]:
+            extras["tvg_name"] = channel["tvg_name"]
+        return self.append(channel["name"], channel["url"], channel.get("tvg_id"), channel["category"],
+                           channel.get("tvg_logo"), extras)
+
+    def category(self, row):
+        return self.categories[self.category_ids[row]]
+
+    def channel(self, row):
+        return Channel(row, self.names[row], self.urls[row], self.tvg_ids[row], self.category(row), self.logos[row])
+
+    def as_dict(self, row):
+        # Flat attribute dict of one row, in the shape iter_m3u_channels yields
+        channel = {"name": self.names[row], "url": self.urls[row], "tvg_id": self.tvg_ids[row],
+                   "category": self.category(row)}
+        if self.logos[row]:
+            channel["tvg_logo"] = self.logos[row]
+        channel.update(self.extras.get(row, ()))
+        return channel
+
+    def build_lookup(self):
+        # Indexes rows by tvg-id and by (name, category) for rows_for_tvg_id()/row_for_name().
+        # Costs one pass over the table, so callers on the Tk thread should find it built
+        # already (PlaylistModel.fetch() builds it on its worker thread).
+        tvg_rows = {}
+        for row, tvg_id in enumerate(self.tvg_ids):
+            if tvg_id is None: # Also true for holes
+                continue
+            existing = tvg_rows.get(tvg_id)
+            if existing is None:
+                tvg_rows[tvg_id] = row
+            elif isinstance(existing, list):
+                existing.append(row)
+            else:
+                tvg_rows[tvg_id] = [existing, row]
+        # Built back to front so the first row of a duplicated name wins
+        keys = list(zip(self.names, self.category_ids))
+        name_rows = dict(zip(reversed(keys), range(len(keys) - 1, -1, -1)))
+        for row in range(len(keys)) if self.holes else ():
+            if self.urls[row] is None and name_rows.get(keys[row]) == row:
+                del name_rows[keys[row]]
+        self._tvg_rows = tvg_rows
+        self._name_rows = name_rows
+        return self
+
+    def rows_for_tvg_id(self, tvg_id):
+        if self._tvg_rows is None:
+            self.build_lookup()
+        rows = self._tvg_rows.get(tvg_id)
+        if rows is None:
+            return ()
+        return rows if isinstance(rows, list) else (rows,)
+
+    def row_for_name(self, name, category):
+        if self._name_rows is None:
+            self.build_lookup()
+        category_id = self._category_lookup.get(category)
+        return None if category_id is None else self._name_rows.get((name, category_id))
+
+    def __getstate__(self):
+        # The lookup indexes are cheap to rebuild and not worth storing in snapshots
+        state = self.__dict__.copy()
+        state["_tvg_rows"] = state["_name_rows"] = None
+        return state
+
+    def by_category(self):
+        # {category: row ids} for every non-empty category, in playlist order
+        return {category: rows for category, rows in zip(self.categories, self.category_rows) if rows}
+
+    def group_rows(self, rows):
+        # Groups an iterable of row ids as {category: [row, ...]}, keeping their order
+        grouped = {}
+        categories = self.categories
+        category_ids = self.category_ids
+        for row in rows:
+            category = categories[category_ids[row]]
+            if category not in grouped:
+                grouped[category] = []
+            grouped[category].append(row)
+        return grouped
+
+    @classmethod
+    def merge(cls, tables):
+        # Combines the tables of several playlists, earlier ones taking precedence. A channel is
+        # dropped if its URL was already seen, or if an earlier playlist already had its tvg-id
+        # (variants sharing a tvg-id inside one playlist, such as HD/SD feeds, are all kept).
+        if len(tables) == 1:
+            return tables[0]
+        merged = cls()
+        seen_urls = set()
+        seen_tvg_ids = set()
+        for table in tables:
+            for row in range(len(table)):
+                url = table.urls[row]
+                tvg_id = table.tvg_ids[row]
+                if url is None or url in seen_urls or (tvg_id is not None and tvg_id in seen_tvg_ids):
+                    continue
+                seen_urls.add(url)
+                merged.append(table.names[row], url, tvg_id, table.category(row), table.logos[row],
+                              table.extras.get(row))
+            seen_tvg_ids.update(tvg_id for tvg_id in table.tvg_ids if tvg_id is not None)
+        return merged
+
+    def reconcile(self, fresh):
+        # Returns (table, diff): a table with the channels and order of `fresh` in which every
+        # channel whose URL was already in self keeps its row id, so views keyed by row id only
+        # have to touch the rows listed in the diff. Removed channels become holes. self is not
+        # modified, so this can run off the Tk thread while the UI keeps reading self.
+        table = ChannelTable()
+        table.names = list(self.names)
+        table.urls = list(self.urls)
+        table.tvg_ids = list(self.tvg_ids)
+        table.logos = list(self.logos)
+        table.category_ids = array("I", self.category_ids)
+        for category in self.categories:
+            table.category_id(category)
+
+        # First occurrence wins for URLs listed twice; later duplicates are re-added as new rows
+        old_rows = {url: row for row, url in reversed(list(enumerate(self.urls))) if url is not None}
+        added = []
+        changed = []
+        for fresh_row in range(len(fresh)):
+            url = fresh.urls[fresh_row]
+            if url is None:
+                continue
+            name = fresh.names[fresh_row]
+            tvg_id = fresh.tvg_ids[fresh_row]
+            logo = fresh.logos[fresh_row]
+            category_id = table.category_id(fresh.category(fresh_row))
+            extras = fresh.extras.get(fresh_row)
+            row = old_rows.pop(url, None)
+            if row is None:
+                row = len(table.names)
+                table.names.append(name)
+                table.urls.append(url)
+                table.tvg_ids.append(tvg_id)
+                table.logos.append(logo)
+                table.category_ids.append(category_id)
+                added.append(row)
+            elif (table.names[row] != name or table.tvg_ids[row] != tvg_id or table.logos[row] != logo
+                  or table.category_ids[row] != category_id or self.extras.get(row) != extras):
+                table.names[row] = name
+                table.tvg_ids[row] = tvg_id
+                table.logos[row] = logo
+                table.category_ids[row] = category_id
+                changed.append(row)
+            table.category_rows[category_id].append(row)
+            if extras:
+                table.extras[row] = extras
+
+        removed = sorted(old_rows.values())
+        for row in removed:
+            table.names[row] = ""
+            table.urls[row] = None
+            table.tvg_ids[row] = None
+            table.logos[row] = None
+        table.holes = self.holes + len(removed)
+        return table, ChannelDiff(added, removed, changed)
@@ -0,0 +1,272 @@
+import argparse
+import contextlib
+import fnmatch
+import functools
+import hashlib
+import itertools
+import json
+import os
+import re
+import stat
+import sys
+import time
+from collections import Counter, deque
+
+from .cache import atomic_open
+from .health import PROBE_PER_HOST, PROBE_TIMEOUT, PROBE_WORKERS, STATUS_OK, STATUS_SLOW, StreamProber
+from .m3u import M3U_CHUNK_SIZE, iter_m3u_channels
+from .model import HTTP_TIMEOUT, create_session
+
+# Streams playlists through filter stages and writes the survivors, without the GUI or libvlc:
+#
+#   python -m iptv_core provider.m3u --category "Sport*" --exclude-category "*XXX*" \
+#       --dedup url --output sport.m3u
+#   python -m iptv_core http://example.com/a.m3u http://example.com/b.m3u --dedup tvg-id \
+#       --check-health --format json --output checked.json
+#
+# Every stage is a generator passing on one (channel dict, original text) pair at a time, so
+# memory does not grow with the playlist; only deduplication keeps something per entry (a 128-bit
+# digest of its key). M3U output copies each surviving entry's original lines, #EXTVLCOPT and
+# other directives included, under the first input's #EXTM3U line. Filters and inputs are
+# checked before the output is created, and an output file is only replaced once it is complete.
+
+OUTPUT_FORMATS = ("m3u", "json", "jsonl")
+DEDUP_KEYS = {"url": "url", "tvg-id": "tvg_id", "name": "name"}
+HEALTH_READ_AHEAD = 4 # Entries queued per health-check worker; bounds memory while keeping workers busy
+OUTPUT_BUFFER_BYTES = 1024 * 1024
+
+def _is_url(source):
+    return source.startswith(("http://", "https://"))
+
+def open_source(source, stack, session=None):
+    # Lines of a playlist given as a local path, "-" for stdin or an http(s) URL. The file is
+    # opened, or the response received and its status checked, before this returns, so a bad
+    # input fails here; the file or response is closed with the ExitStack.
+    if source == "-":
+        return sys.stdin
+    if _is_url(source):
+        response = stack.enter_context(session.get(source, timeout=HTTP_TIMEOUT, stream=True))
+        response.raise_for_status()
+        return response.iter_lines(chunk_size=M3U_CHUNK_SIZE)
+    return stack.enter_context(open(source, "r", encoding="utf-8", errors="replace"))
+
+def iter_source_lines(source, session=None):
+    # Lines of a playlist, which is only opened once the first line is wanted
+    with contextlib.ExitStack() as stack:
+        yield from open_source(source, stack, session)
+
+def open_sources(sources, stack, session_factory=create_session):
+    # Line iterables of every source, in order. Local files, stdin and the first source are
+    # opened right away; the other URLs are requested when their turn comes, so only one
+    # download is open at a time. A session is only created for URLs.
+    session = None
+    opened = []
+    for position, source in enumerate(sources):
+        if session is None and _is_url(source):
+            session = stack.enter_context(session_factory())
+        if position == 0 or not _is_url(source):
+            opened.append(open_source(source, stack, session))
+        else:
+            opened.append(iter_source_lines(source, session))
+    return opened
+
+def read_header(lines):
+    # Splits a playlist's #EXTM3U line (which may carry url-tvg and other attributes) off its
+    # lines; returns (the line or None, the remaining lines)
+    lines = iter(lines)
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode("utf-8", errors="replace")
+        line = line.strip()
+        if line:
+            break
+    else:
+        return None, lines
+    if line.startswith("#EXTM3U"):
+        return line, lines
+    return None, itertools.chain([line], lines)
+
+def iter_sources(sources, stats):
+    # (channel, text) entries of every source (an iterable of lines) in turn
+    for lines in sources:
+        for entry in iter_m3u_channels(lines, raw=True):
+            stats["read"] += 1
+            yield entry
+
+def _patterns(patterns):
+    # Shell-style, case-insensitive category patterns ("Sport*", "*News*") as one regex
+    if not patterns:
+        return None
+    return re.compile("|".join(fnmatch.translate(pattern) for pattern in patterns), re.IGNORECASE)
+
+def filter_categories(entries, stats, include=(), exclude=()):
+    # Not a generator itself, so the patterns are compiled (and fail) when the pipeline is built
+    include = _patterns(include)
+    exclude = _patterns(exclude)
+    def kept():
+        for entry in entries:
+            category = entry[0]["category"] or ""
+            if (include is not None and not include.match(category)) or (exclude is not None and exclude.match(category)):
+                stats["dropped_category"] += 1
+                continue
+            yield entry
+    return kept()
+
+def filter_names(entries, stats, pattern=None, exclude_pattern=None):
+    # Regular expressions searched (case-insensitively) anywhere in the channel name; like
+    # filter_categories(), compiled when the pipeline is built, so a bad one fails there
+    pattern = re.compile(pattern, re.IGNORECASE) if pattern else None
+    exclude_pattern = re.compile(exclude_pattern, re.IGNORECASE) if exclude_pattern else None
+    def kept():
+        for entry in entries:
+            name = entry[0]["name"]
+            if (pattern is not None and not pattern.search(name)) or (exclude_pattern is not None and exclude_pattern.search(name)):
+                stats["dropped_name"] += 1
+                continue
+            yield entry
+    return kept()
+
+def deduplicate(entries, stats, key="url"):
+    # Keeps the first entry per key. Only a 128-bit BLAKE2 digest of each key is remembered, so
+    # a million entries cost a few dozen MB however long the URLs, and unlike hash() two keys
+    # never collide in practice; entries without the key (no tvg-id) are all kept.
+    seen = set()
+    field = DEDUP_KEYS[key]
+    for entry in entries:
+        value = entry[0].get(field)
+        if value:
+            digest = hashlib.blake2b(value.encode("utf-8"), digest_size=16).digest()
+            if digest in seen:
+                stats["dropped_duplicate"] += 1
+                continue
+            seen.add(digest)
+        yield entry
+
+def check_health(entries, stats, prober, keep=(STATUS_OK, STATUS_SLOW)):
+    # Probes entries concurrently on the prober's workers but yields them in input order,
+    # holding at most HEALTH_READ_AHEAD entries per worker in flight
+    window = prober.workers * HEALTH_READ_AHEAD
+    pending = deque()
+    def drain(limit):
+        while len(pending) > limit:
+            entry, future = pending.popleft()
+            result = future.result()
+            stats[f"health_{result.status}"] += 1
+            if result.status in keep:
+                yield entry
+            else:
+                stats["dropped_health"] += 1
+    try:
+        for entry in entries:
+            pending.append((entry, prober.check(entry[0]["url"], False)))
+            yield from drain(window)
+        yield from drain(0)
+    finally:
+        prober.shutdown()
+
+def write_m3u(entries, out, header=None):
+    # header is the #EXTM3U line to start with, attributes included
+    out.write((header or "#EXTM3U") + "\n")
+    written = 0
+    for _, text in entries:
+        out.write(text)
+        written += 1
+    return written
+
+def write_json(entries, out):
+    # One JSON array of channel dicts, written entry by entry
+    written = 0
+    out.write("[")
+    for channel, _ in entries:
+        out.write(",\n" if written else "\n")
+        out.write(json.dumps(channel, ensure_ascii=False))
+        written += 1
+    out.write("\n]\n")
+    return written
+
+def write_jsonl(entries, out):
+    written = 0
+    for channel, _ in entries:
+        out.write(json.dumps(channel, ensure_ascii=False) + "\n")
+        written += 1
+    return written
+
+WRITERS = {"m3u": write_m3u, "json": write_json, "jsonl": write_jsonl}
+
+def open_output(path):
+    # A file is written next to path and renamed over it once complete, so a failed run leaves
+    # the previous output in place; devices and pipes (/dev/null, a FIFO) are written directly
+    try:
+        special = not stat.S_ISREG(os.stat(path).st_mode)
+    except FileNotFoundError:
+        special = False
+    kwargs = dict(encoding="utf-8", newline="\n", buffering=OUTPUT_BUFFER_BYTES)
+    return open(path, "w", **kwargs) if special else atomic_open(path, "w", **kwargs)
+
+def build_pipeline(args, sources, stats):
+    # Filters are compiled here, so a bad pattern raises re.error before anything is read
+    entries = iter_sources(sources, stats)
+    if args.category or args.exclude_category:
+        entries = filter_categories(entries, stats, args.category, args.exclude_category)
+    if args.name or args.exclude_name:
+        entries = filter_names(entries, stats, args.name, args.exclude_name)
+    if args.dedup != "none":
+        entries = deduplicate(entries, stats, args.dedup)
+    if args.check_health:
+        prober = StreamProber(workers=args.health_workers, per_host=args.health_per_host, timeout=args.health_timeout)
+        keep = (STATUS_OK,) if args.drop_slow else (STATUS_OK, STATUS_SLOW)
+        entries = check_health(entries, stats, prober, keep)
+    return entries
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m iptv_core",
+                                     description="Filter, deduplicate and convert M3U playlists without the GUI.")
+    parser.add_argument("inputs", nargs="+", help="playlist files, http(s) URLs or - for stdin, read in order")
+    parser.add_argument("-o", "--output", default="-", help="where to write the result (default: stdout)")
+    parser.add_argument("-f", "--format", choices=OUTPUT_FORMATS, help="output format (default: from the output "
+                        "file name, else m3u)")
+    parser.add_argument("--category", action="append", help="keep only categories matching this shell-style "
+                        "pattern, repeatable")
+    parser.add_argument("--exclude-category", action="append", help="drop categories matching this pattern, repeatable")
+    parser.add_argument("--name", help="keep only channels whose name matches this regular expression")
+    parser.add_argument("--exclude-name", help="drop channels whose name matches this regular expression")
+    parser.add_argument("--dedup", choices=sorted(DEDUP_KEYS) + ["none"], default="url",
+                        help="keep the first entry per URL, tvg-id or name (default: url)")
+    parser.add_argument("--check-health", action="store_true", help="probe every stream and drop broken and offline ones")
+    parser.add_argument("--drop-slow", action="store_true", help="with --check-health, also drop slow streams")
+    parser.add_argument("--health-workers", type=int, default=PROBE_WORKERS, help="streams probed at the same time")
+    parser.add_argument("--health-per-host", type=int, default=PROBE_PER_HOST, help="concurrent probes per host")
+    parser.add_argument("--health-timeout", type=float, default=PROBE_TIMEOUT, help="seconds before a stream counts as offline")
+    parser.add_argument("-q", "--quiet", action="store_true", help="do not print the summary to stderr")
+    args = parser.parse_args(argv)
+
+    output_format = args.format
+    if output_format is None:
+        extension = args.output.rsplit(".", 1)[-1].lower() if "." in args.output else ""
+        output_format = extension if extension in OUTPUT_FORMATS else "m3u"
+
+    stats = Counter()
+    started = time.perf_counter()
+    try:
+        with contextlib.ExitStack() as stack:
+            sources = open_sources(args.inputs, stack)
+            header, sources[0] = read_header(sources[0])
+            entries = build_pipeline(args, sources, stats)
+            writer = WRITERS[output_format]
+            if output_format == "m3u":
+                writer = functools.partial(write_m3u, header=header)
+            if args.output == "-":
+                written = writer(entries, sys.stdout)
+                sys.stdout.flush()
+            else:
+                with open_output(args.output) as out:
+                    written = writer(entries, out)
+    except (OSError, re.error) as e: # requests' exceptions are OSErrors too
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+
+    if not args.quiet:
+        dropped = ", ".join(f"{count} {reason[8:]}" for reason, count in sorted(stats.items()) if reason.startswith("dropped_"))
+        print(f"{stats['read']} entries read, {written} written" + (f" (dropped: {dropped})" if dropped else "")
+              + f" in {time.perf_counter() - started:.2f}s", file=sys.stderr)
+    return 0
@@ -0,0 +1,355 @@
+import calendar
+import re
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+
+Programme = namedtuple("Programme", ["start", "stop", "title", "description"])
+
+XMLTV_TIME_RE = re.compile(r"\s*(\d{8})(\d\d)(\d\d)(\d\d)?\d*") # Date, hours, minutes and optional seconds
+DAY_CACHE_SIZE = 4096 # Distinct dates whose midnight is remembered; a guide spans a few dozen
+_DAY_STARTS = {} # "YYYYMMDD" -> epoch seconds of midnight UTC, None for an invalid date
+
+def parse_xmltv_time(value):
+    # Converts an XMLTV timestamp such as "20240131203000 +0100" to UTC epoch seconds.
+    # Seconds may be omitted and a missing offset means UTC. Returns None if unparsable.
+    # Runs twice per programme, so the date is only converted once per day it names.
+    if not value:
+        return None
+    match = XMLTV_TIME_RE.match(value)
+    if match is None:
+        return None
+    date, hours, minutes, seconds = match.groups()
+    day = _DAY_STARTS.get(date, False)
+    if day is False:
+        try:
+            day = calendar.timegm((int(date[0:4]), int(date[4:6]), int(date[6:8]), 0, 0, 0))
+        except (ValueError, OverflowError):
+            day = None
+        if len(_DAY_STARTS) < DAY_CACHE_SIZE:
+            _DAY_STARTS[date] = day
+    if day is None:
+        return None
+    epoch = day + int(hours) * 3600 + int(minutes) * 60 + (int(seconds) if seconds else 0)
+
+    offset = value[match.end():].strip()
+    if len(offset) == 5 and offset[0] in "+-" and offset[1:].isdigit():
+        offset_seconds = int(offset[1:3]) * 3600 + int(offset[3:5]) * 60
+        epoch += -offset_seconds if offset[0] == "+" else offset_seconds
+    return epoch
+
+class NumberedStrings:
+    # Strings given as int32 numbers into a shared table of distinct strings (titles)
+    __slots__ = ("table", "numbers")
+
+    def __init__(self, table, numbers):
+        self.table = table
+        self.numbers = numbers
+
+    def __len__(self):
+        return len(self.numbers)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return NumberedStrings(self.table, self.numbers[i])
+        return self.table[self.numbers[i]]
+
+    def __iter__(self):
+        return map(self.table.__getitem__, self.numbers)
+
+class PackedStrings:
+    # Strings packed into one blob of NUL-terminated UTF-8, decoded when read (descriptions).
+    # offsets[i] - base is where string i starts in blob; the last offset is the end of blob.
+    __slots__ = ("blob", "offsets", "base")
+
+    def __init__(self, blob, offsets, base=0):
+        self.blob = blob
+        self.offsets = offsets
+        self.base = base
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            start, stop, step = i.indices(len(self))
+            if step != 1:
+                return list(self)[i]
+            return PackedStrings(self.blob, self.offsets[start:max(start, stop) + 1], self.base)
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("PackedStrings index out of range")
+        return str(self.blob[self.offsets[i] - self.base:self.offsets[i + 1] - self.base - 1], "utf-8")
+
+    def __iter__(self):
+        blob, offsets, base = self.blob, self.offsets, self.base
+        return (str(blob[offsets[i] - base:offsets[i + 1] - base - 1], "utf-8") for i in range(len(offsets) - 1))
+
+class StringColumn:
+    # Read-only sequence of strings made of parts (lists, NumberedStrings, PackedStrings) that
+    # are appended whole. Guides parsed by worker processes are merged this way, without an
+    # object per programme; a column that has to change is turned back into a list.
+    __slots__ = ("parts", "ends")
+    __hash__ = None
+
+    def __init__(self, parts=()):
+        self.parts = []
+        self.ends = [] # Length of the column up to and including each part
+        for part in parts:
+            self.append(part)
+
+    def append(self, part):
+        if len(part):
+            self.parts.append(part)
+            self.ends.append(len(self) + len(part))
+
+    def __len__(self):
+        return self.ends[-1] if self.ends else 0
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            start, stop, step = i.indices(len(self))
+            if step != 1:
+                return list(self)[i]
+            column = StringColumn()
+            first = 0
+            for part, end in zip(self.parts, self.ends):
+                if start < end and stop > first:
+                    column.append(part[max(start - first, 0):stop - first])
+                first = end
+            return column
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("StringColumn index out of range")
+        n = bisect_right(self.ends, i)
+        return self.parts[n][i - self.ends[n - 1] if n else i]
+
+    def __iter__(self):
+        for part in self.parts:
+            yield from part
+
+    def __eq__(self, other):
+        if not isinstance(other, (list, StringColumn)):
+            return NotImplemented
+        return other is self or (len(self) == len(other) and list(self) == list(other))
+
+class ChannelGuide:
+    # Programmes of one channel held as parallel columns sorted by start time.
+    # Start and stop are epoch seconds in compact int64 arrays, so lookups are a bisect.
+    __slots__ = ("display_name", "starts", "stops", "titles", "descriptions")
+
+    def __init__(self, display_name=None):
+        self.display_name = display_name
+        self.starts = array("q")
+        self.stops = array("q")
+        self.titles = []
+        self.descriptions = []
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __getitem__(self, i):
+        return Programme(self.starts[i], self.stops[i], self.titles[i], self.descriptions[i])
+
+    def add(self, start, stop, title, description):
+        if type(self.titles) is not list:
+            self.titles = list(self.titles)
+        if type(self.descriptions) is not list:
+            self.descriptions = list(self.descriptions)
+        self.starts.append(start)
+        self.stops.append(stop)
+        self.titles.append(title)
+        self.descriptions.append(description)
+
+    def extend(self, starts, stops, titles, descriptions):
+        # Appends programmes given as columns: starts and stops are native int64 buffers, titles
+        # and descriptions sequences of strings that become part of a StringColumn as they are
+        self.starts.frombytes(starts)
+        self.stops.frombytes(stops)
+        if type(self.titles) is not StringColumn:
+            self.titles = StringColumn([self.titles])
+        if type(self.descriptions) is not StringColumn:
+            self.descriptions = StringColumn([self.descriptions])
+        self.titles.append(titles)
+        self.descriptions.append(descriptions)
+
+    def finalize(self):
+        # Guides are usually already in order, so only pay for a sort when they are not.
+        # Programmes sharing a start time are collapsed to the first one seen.
+        starts = self.starts
+        if all(starts[i] < starts[i + 1] for i in range(len(starts) - 1)):
+            return
+        order = sorted(range(len(starts)), key=starts.__getitem__)
+        keep = [i for n, i in enumerate(order) if n == 0 or starts[i] != starts[order[n - 1]]]
+        self.starts = array("q", (starts[i] for i in keep))
+        self.stops = array("q", (self.stops[i] for i in keep))
+        titles, descriptions = list(self.titles), list(self.descriptions)
+        self.titles = [titles[i] for i in keep]
+        self.descriptions = [descriptions[i] for i in keep]
+
+    def index_at(self, when):
+        # Index of the programme airing at `when`, or of the next one if nothing is airing.
+        i = bisect_right(self.starts, when) - 1
+        if i < 0 or self.stops[i] > when:
+            return max(i, 0)
+        return i + 1
+
+    def now_next(self, when):
+        i = self.index_at(when)
+        current = self[i] if i < len(self) and self.starts[i] <= when else None
+        if current is not None:
+            i += 1
+        upcoming = self[i] if i < len(self) else None
+        return current, upcoming
+
+    def upcoming(self, when, limit=None):
+        # Programme airing at `when` followed by the ones after it.
+        start = self.index_at(when)
+        end = len(self) if limit is None else min(len(self), start + limit)
+        return [self[i] for i in range(start, end)]
+
+    def window(self, start, stop):
+        # Programmes overlapping the [start, stop) time range.
+        first = self.index_at(start)
+        last = bisect_left(self.starts, stop)
+        return [self[i] for i in range(first, last)]
+
+    def overlaps(self, start, stop):
+        i = self.index_at(start)
+        return i < len(self) and self.starts[i] < stop
+
+    def trimmed(self, before):
+        # This guide without the programmes that ended by `before`; self if there are none
+        first = self.index_at(before)
+        if not first:
+            return self
+        guide = ChannelGuide(self.display_name)
+        guide.starts = self.starts[first:]
+        guide.stops = self.stops[first:]
+        guide.titles = self.titles[first:]
+        guide.descriptions = self.descriptions[first:]
+        return guide
+
+    def same_programmes(self, other):
+        # Array and list comparisons run in C; only a guide that changed gets past the first test
+        return (self.starts == other.starts and self.stops == other.stops and self.titles == other.titles
+                and self.descriptions == other.descriptions and self.display_name == other.display_name)
+
+def _tightest(pick, bounds):
+    # The narrowest of several window bounds (pick is max for starts, min for ends); None is no bound
+    bounds = [bound for bound in bounds if bound is not None]
+    return pick(bounds) if bounds else None
+
+class EPGIndex:
+    # Time-indexed guide keyed by XMLTV channel id (the playlist's tvg-id).
+    # Timestamps are parsed once at ingest; queries never touch strings again.
+    # Programmes outside [keep_from, keep_until) are dropped as they are added.
+    def __init__(self, keep_from=None, keep_until=None):
+        self.channels = {}
+        self.keep_from = keep_from
+        self.keep_until = keep_until
+        self._titles = {} # Interns repeated titles ("News", "Weather", ...)
+
+    def __contains__(self, channel_id):
+        return channel_id in self.channels
+
+    def __len__(self):
+        return len(self.channels)
+
+    def get(self, channel_id):
+        return self.channels.get(channel_id)
+
+    def add_channel(self, channel_id, display_names):
+        guide = self.channels.get(channel_id)
+        if guide is None:
+            self.channels[channel_id] = ChannelGuide(display_names[-1] if display_names else None)
+        elif display_names:
+            guide.display_name = display_names[-1]
+
+    def intern(self, title):
+        # The copy of title already held by this index, so repeated titles share one string
+        return self._titles.setdefault(title, title)
+
+    def intern_all(self, titles):
+        # intern() of every title, as a list
+        return list(map(self._titles.setdefault, titles, titles))
+
+    def add_programme(self, channel_id, start, stop, title, description):
+        # Programmes of undeclared channels, with broken timestamps or outside the retention
+        # window are dropped.
+        guide = self.channels.get(channel_id)
+        if guide is None or start is None or stop is None:
+            return False
+        if (self.keep_from is not None and stop <= self.keep_from) or (self.keep_until is not None and start >= self.keep_until):
+            return False
+        guide.add(start, stop, self.intern(title), description)
+        return True
+
+    def finalize(self):
+        for guide in self.channels.values():
+            guide.finalize()
+        self._titles = {}
+
+    @classmethod
+    def merge(cls, indexes):
+        # Combines several guides channel by channel. Earlier guides take precedence; a later
+        # guide only fills the gaps, i.e. contributes programmes that overlap nothing already there.
+        # The guides passed in are consumed: their ChannelGuide objects are reused, not copied.
+        # The result keeps the window all of them were retained to.
+        if len(indexes) == 1:
+            return indexes[0]
+        merged = cls(_tightest(max, [index.keep_from for index in indexes]),
+                     _tightest(min, [index.keep_until for index in indexes]))
+        for index in indexes:
+            for channel_id, guide in index.channels.items():
+                existing = merged.channels.get(channel_id)
+                if existing is None:
+                    merged.channels[channel_id] = guide
+                    continue
+                additions = [guide[i] for i in range(len(guide)) if not existing.overlaps(guide.starts[i], guide.stops[i])]
+                for programme in additions:
+                    existing.add(*programme)
+                if additions:
+                    existing.finalize()
+                if existing.display_name is None:
+                    existing.display_name = guide.display_name
+        return merged
+
+    def evicted(self, before):
+        # (copy without the programmes that ended by `before`, number of programmes dropped).
+        # Guides with nothing to drop are shared with self rather than copied.
+        index = EPGIndex(_tightest(max, [self.keep_from, before]), self.keep_until)
+        dropped = 0
+        for channel_id, guide in self.channels.items():
+            trimmed = guide.trimmed(before)
+            dropped += len(guide) - len(trimmed)
+            index.channels[channel_id] = trimmed
+        return index, dropped
+
+    def restricted(self, channel_ids):
+        # Copy holding only the guides of channel_ids, e.g. the tvg-ids of the playlist
+        index = EPGIndex(self.keep_from, self.keep_until)
+        index.channels = {channel_id: guide for channel_id, guide in self.channels.items() if channel_id in channel_ids}
+        return index
+
+    def changed_channels(self, previous):
+        # Channel ids whose guide was added, dropped or has different programmes than in previous
+        changed = {channel_id for channel_id in previous.channels if channel_id not in self.channels}
+        for channel_id, guide in self.channels.items():
+            old = previous.channels.get(channel_id)
+            if old is None or not guide.same_programmes(old):
+                changed.add(channel_id)
+        return changed
+
+    def now_next(self, channel_id, when=None):
+        guide = self.channels.get(channel_id)
+        if guide is None:
+            return None, None
+        return guide.now_next(int(time.time()) if when is None else when)
+
+    def window(self, channel_id, start, stop):
+        guide = self.channels.get(channel_id)
+        return guide.window(start, stop) if guide is not None else []
@@ -0,0 +1,296 @@
+import os
+import struct
+import threading
+from array import array
+from collections import deque
+from itertools import accumulate
+
+from .epg import NumberedStrings, PackedStrings, parse_xmltv_time
+from .metrics import METRICS
+
+EPG_PROCESSES = min(os.cpu_count() or 1, 4) # Worker processes parsing guides; the merge is serial, so more add memory, not speed
+EPG_CHUNK_BYTES = 4 * 1024 * 1024 # Decompressed XML handed to one worker, cut at a <programme> tag
+EPG_IN_FLIGHT_BYTES = 32 * 1024 * 1024 # XML handed to workers and not merged yet, whatever the number of workers
+EPG_POOL_MIN_BYTES = 16 * 1024 * 1024 # Decompressed guides smaller than this are parsed faster on the calling thread
+EPG_READ_BYTES = 1024 * 1024 # Read size while cutting the guide into chunks
+EPG_FEED_BYTES = 256 * 1024 # Slice fed to a worker's parser between two drains of its events
+
+# Shared-memory result of one chunk: this header, then the int64 columns starts, stops and
+# description offsets (one more than there are programmes), then the int32 columns title (name
+# numbers), channel runs (pairs of a channel id name number and a programme count) and declared
+# channels (pairs of id and last display name numbers, -1 for none), and finally two blobs: the
+# names (channel ids, display names, titles) NUL-separated, and the descriptions, NUL-terminated,
+# in programme order. Programmes are grouped by channel, so the parent appends every run with
+# a few slice copies and the descriptions of a channel stay packed in their slice of the blob.
+_HEADER = struct.Struct("<6q") # programmes, runs, declared channels, name blob and description blob sizes, name count
+_TAG_END = (b" ", b"\t", b"\r", b"\n", b">")
+
+def _last_boundary(data):
+    # Offset of the last "<programme" tag in data after its first byte, or -1
+    end = len(data)
+    while True:
+        position = data.rfind(b"<programme", 1, end)
+        if position < 0 or data[position + 10:position + 11] in _TAG_END:
+            return position
+        end = position
+
+class _Strings:
+    # Numbers distinct strings in order of appearance
+    def __init__(self):
+        self.numbers = {}
+
+    def number(self, value):
+        number = self.numbers.get(value)
+        if number is None:
+            number = self.numbers[value] = len(self.numbers)
+        return number
+
+    def blob(self):
+        return "\0".join(self.numbers).encode("utf-8") # XML text cannot contain NUL
+
+def _element_text(elem, tag):
+    child = elem.find(tag)
+    return child.text if child is not None and child.text else None
+
+def parse_chunk(data, prefix=b"", last=True, keep_from=None, keep_until=None):
+    # Runs in a worker process: parses one chunk of an XMLTV document (prefix supplies the XML
+    # declaration and an opening <tv> for chunks after the first) and returns the name of a
+    # SharedMemory block laid out as described above, which the caller must unlink.
+    # Programmes with broken timestamps or outside [keep_from, keep_until) are dropped here.
+    import xml.etree.ElementTree as ET
+    from multiprocessing import shared_memory
+
+    names = _Strings()
+    declared = array("i")
+    programmes = {} # {channel id number: ([start], [stop], [title number], [UTF-8 description])}
+    parser = ET.XMLPullParser(events=("start", "end"))
+    root = None
+
+    def drain():
+        nonlocal root
+        for event, elem in parser.read_events():
+            if event == "start":
+                if root is None:
+                    root = elem
+                continue
+            if elem.tag == "programme":
+                channel = elem.get("channel")
+                title = _element_text(elem, "title")
+                description = _element_text(elem, "desc")
+                start = parse_xmltv_time(elem.get("start"))
+                stop = parse_xmltv_time(elem.get("stop"))
+                if (channel is not None and (title is not None or description is not None)
+                        and start is not None and stop is not None
+                        and (keep_from is None or stop > keep_from) and (keep_until is None or start < keep_until)):
+                    channel = names.number(channel)
+                    columns = programmes.get(channel)
+                    if columns is None:
+                        columns = programmes[channel] = ([], [], [], [])
+                    columns[0].append(start)
+                    columns[1].append(stop)
+                    columns[2].append(names.number(title or "N/A"))
+                    columns[3].append((description or "No description").encode("utf-8"))
+                root.clear()
+            elif elem.tag == "channel":
+                channel_id = elem.get("id")
+                if channel_id:
+                    display_names = [name.text.strip() for name in elem.findall("display-name") if name.text]
+                    declared.append(names.number(channel_id))
+                    declared.append(names.number(display_names[-1]) if display_names else -1)
+                root.clear()
+
+    parser.feed(prefix)
+    with memoryview(data) as view:
+        for offset in range(0, len(data), EPG_FEED_BYTES):
+            parser.feed(view[offset:offset + EPG_FEED_BYTES])
+            drain()
+    if last:
+        parser.close() # Reports a truncated document
+        drain()
+
+    starts, stops, titles, runs, texts = array("q"), array("q"), array("i"), array("i"), []
+    for channel, (channel_starts, channel_stops, channel_titles, channel_texts) in programmes.items():
+        starts.extend(channel_starts)
+        stops.extend(channel_stops)
+        titles.extend(channel_titles)
+        texts.extend(channel_texts)
+        runs.append(channel)
+        runs.append(len(channel_starts))
+    offsets = array("q", accumulate((len(text) + 1 for text in texts), initial=0))
+    name_blob = names.blob()
+    description_blob = b"\0".join(texts) + b"\0" if texts else b""
+    parts = [_HEADER.pack(len(starts), len(runs) // 2, len(declared) // 2, len(name_blob), len(description_blob),
+                          len(names.numbers)),
+             starts, stops, offsets, titles, runs, declared, name_blob, description_blob]
+    size = sum(len(part) if isinstance(part, bytes) else len(part) * part.itemsize for part in parts)
+    block = shared_memory.SharedMemory(create=True, size=size)
+    offset = 0
+    for part in parts:
+        part = part if isinstance(part, bytes) else part.tobytes()
+        block.buf[offset:offset + len(part)] = part
+        offset += len(part)
+    name = block.name
+    block.close()
+    return name
+
+def _free_result(name):
+    from multiprocessing import shared_memory
+
+    block = shared_memory.SharedMemory(name=name)
+    block.close()
+    block.unlink()
+
+def _merge_chunk(epg_index, name):
+    # Adds the result of parse_chunk() to epg_index and frees its shared memory
+    from multiprocessing import shared_memory
+
+    block = shared_memory.SharedMemory(name=name)
+    try:
+        _merge_block(epg_index, block.buf)
+    finally:
+        block.unlink()
+        block.close()
+
+def _merge_block(epg_index, buf):
+    # The columns are read in place: only what ends up in the guides is copied out of buf, and
+    # the work done here is per channel, not per programme. Slices of buf are never kept, since
+    # the block cannot be closed while one is alive.
+    count, run_count, declared_count, name_bytes, description_bytes, name_count = _HEADER.unpack_from(buf)
+    starts_at = _HEADER.size
+    stops_at = starts_at + 8 * count
+    offsets_at = stops_at + 8 * count
+    titles_at = offsets_at + 8 * (count + 1)
+    runs_at = titles_at + 4 * count
+    declared_at = runs_at + 8 * run_count
+    names_at = declared_at + 8 * declared_count
+    texts_at = names_at + name_bytes
+    offsets, runs, declared = array("q"), array("i"), array("i")
+    offsets.frombytes(buf[offsets_at:titles_at])
+    runs.frombytes(buf[runs_at:declared_at])
+    declared.frombytes(buf[declared_at:names_at])
+    names = epg_index.intern_all(str(buf[names_at:texts_at], "utf-8").split("\0")) if name_count else []
+
+    for i in range(0, len(declared), 2):
+        display_name = declared[i + 1]
+        epg_index.add_channel(names[declared[i]], [names[display_name]] if display_name >= 0 else [])
+    first = 0
+    for i in range(0, len(runs), 2):
+        guide = epg_index.get(names[runs[i]])
+        last = first + runs[i + 1]
+        if guide is not None: # Programmes of undeclared channels are dropped, as by add_programme()
+            titles = array("i")
+            titles.frombytes(buf[titles_at + 4 * first:titles_at + 4 * last])
+            texts = PackedStrings(bytes(buf[texts_at + offsets[first]:texts_at + offsets[last]]),
+                                  offsets[first:last + 1], offsets[first])
+            guide.extend(buf[starts_at + 8 * first:starts_at + 8 * last], buf[stops_at + 8 * first:stops_at + 8 * last],
+                         NumberedStrings(names, titles), texts)
+        first = last
+
+class EPGProcessPool:
+    # Worker processes for parsing guides, started on first use. They are started by a fork
+    # server (or spawned), never forked from the caller, whose threads may hold Tk, libvlc or
+    # HTTP locks; like any multiprocessing code, scripts using them need an
+    # `if __name__ == "__main__":` guard.
+    def __init__(self, processes=EPG_PROCESSES):
+        self.processes = processes
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def submit(self, *args):
+        # Runs parse_chunk(*args) in a worker; returns its Future
+        with self._lock:
+            if self._executor is None:
+                import multiprocessing
+                from concurrent.futures import ProcessPoolExecutor
+
+                method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+                self._executor = ProcessPoolExecutor(self.processes, mp_context=multiprocessing.get_context(method))
+            return self._executor.submit(parse_chunk, *args)
+
+    def shutdown(self):
+        # Stops the workers; the next submit() starts new ones
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+_default_pool = None
+_default_pool_lock = threading.Lock()
+
+def default_pool():
+    # The EPGProcessPool shared by every model of this process. One pool lives until exit,
+    # rather than one per model: its workers are only started once, and an executor dropped
+    # without shutdown() upsets concurrent.futures' exit handler.
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None:
+            _default_pool = EPGProcessPool()
+        return _default_pool
+
+def _chunk_prefix(first_chunk):
+    # What the chunks after the first are parsed behind: the XML declaration, which names the
+    # encoding, and an opening <tv> for their elements to sit in
+    start = first_chunk[3:] if first_chunk.startswith(b"\xef\xbb\xbf") else first_chunk
+    declaration = start[:start.find(b"?>") + 2] if start.startswith(b"<?xml") else b""
+    return declaration + b"<tv>"
+
+def _discard_result(future):
+    if future.cancelled() or future.exception() is not None:
+        return
+    try:
+        _free_result(future.result())
+    except OSError:
+        pass
+
+def ingest_in_processes(stream, epg_index, pool, chunk_bytes=EPG_CHUNK_BYTES, head=b""):
+    # Fills epg_index from a decompressed XMLTV stream (after `head`, what was already read of
+    # it) with the processes of `pool`: this thread only cuts the guide into chunks at
+    # <programme> tags and merges the columnar results the workers leave in shared memory, so
+    # neither the parsing nor the per-programme objects hold the GIL the UI needs. Results are
+    # merged in document order as they complete; reading waits while EPG_IN_FLIGHT_BYTES of XML
+    # are being parsed, so memory stays bounded for any guide size and number of workers.
+    # Errors of the workers (ParseError, BrokenProcessPool) and of the stream are raised as
+    # they are.
+    from concurrent.futures.process import BrokenProcessPool
+
+    in_flight = deque() # (future, size of its chunk)
+    in_flight_bytes = 0
+    pending = bytearray(head)
+    prefix = b"" # The first chunk is the start of the document itself
+    try:
+        while True:
+            block = stream.read(EPG_READ_BYTES)
+            pending += block
+            if block:
+                if len(pending) < chunk_bytes:
+                    continue
+                cut = _last_boundary(pending)
+                if cut < 0:
+                    continue # No tag to cut at yet; read on
+            else:
+                cut = len(pending)
+            chunk = bytes(pending[:cut])
+            del pending[:cut]
+            while in_flight and in_flight_bytes + len(chunk) > EPG_IN_FLIGHT_BYTES:
+                future, size = in_flight.popleft()
+                in_flight_bytes -= size
+                _merge_chunk(epg_index, future.result())
+            in_flight.append((pool.submit(chunk, prefix, not block, epg_index.keep_from, epg_index.keep_until), len(chunk)))
+            in_flight_bytes += len(chunk)
+            METRICS.increment("epg_chunks")
+            if not block:
+                break
+            if not prefix:
+                prefix = _chunk_prefix(chunk)
+        while in_flight:
+            _merge_chunk(epg_index, in_flight.popleft()[0].result())
+    except BrokenProcessPool:
+        pool.shutdown() # A worker died; start afresh next time
+        raise
+    finally:
+        for future, _ in in_flight:
+            # Abandoned after an error or cancellation: chunks still being parsed free their
+            # result once done, without making the caller wait for them
+            if not future.cancel():
+                future.add_done_callback(_discard_result)
+    return epg_index
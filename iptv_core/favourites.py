@@ -0,0 +1,118 @@
+import json
+import os
+
+from .cache import atomic_write
+
+def _identity(tvg_id, name, category):
+    # Channels with a tvg-id are recognised by it (plus the name, which tells HD/SD variants
+    # sharing one tvg-id apart); the others by name and category
+    if tvg_id:
+        return ("tvg", tvg_id, name)
+    return ("name", name, category)
+
+class FavouritesStore:
+    # Favourite channels, indexed by a stable channel identity so they survive playlist reloads.
+    # resolve() looks every favourite up in the table's tvg-id and name indexes, so it costs
+    # O(favourites) rather than a scan of the playlist. Rows refer to the ChannelTable last
+    # passed to resolve(). Edits only mark the store dirty; save() writes it atomically.
+    def __init__(self, entries=()):
+        self.entries = {} # {identity: {"tvg_id", "name", "category"}}, in the order they were added
+        for entry in entries:
+            if isinstance(entry, dict):
+                entry = {"tvg_id": entry.get("tvg_id") or None, "name": entry["name"], "category": entry["category"]}
+            else:
+                name, category = entry # (name, category) pairs written by older versions
+                entry = {"tvg_id": None, "name": name, "category": category}
+            self.entries[_identity(entry["tvg_id"], entry["name"], entry["category"])] = entry
+        self.table = None
+        self.by_category = {} # {category: [row, ...]} for the favourites found in the playlist
+        self._rows = {} # {row: identity} of the resolved favourites
+        self.dirty = False
+
+    def identity_for(self, row):
+        table = self.table
+        return _identity(table.tvg_ids[row], table.names[row], table.category(row))
+
+    def __contains__(self, row):
+        return row in self._rows
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _find(self, table, entry):
+        if entry["tvg_id"]:
+            rows = table.rows_for_tvg_id(entry["tvg_id"])
+            for row in rows:
+                if table.names[row] == entry["name"]:
+                    return row
+            if rows:
+                return rows[0] # Renamed, but still the same tvg-id
+        return table.row_for_name(entry["name"], entry["category"])
+
+    def resolve(self, table):
+        # Matches the favourites against a freshly loaded channel table
+        self.table = table
+        self._rows = {}
+        for identity, entry in self.entries.items():
+            row = self._find(table, entry)
+            if row is not None and row not in self._rows:
+                self._rows[row] = identity
+        self.by_category = table.group_rows(sorted(self._rows))
+
+    def add(self, row):
+        # Returns False if the channel already was a favourite
+        identity = self.identity_for(row)
+        if identity in self.entries or row in self._rows:
+            return False
+        table = self.table
+        category = table.category(row)
+        self.entries[identity] = {"tvg_id": table.tvg_ids[row], "name": table.names[row], "category": category}
+        self._rows[row] = identity
+        self.by_category.setdefault(category, []).append(row)
+        self.dirty = True
+        return True
+
+    def remove(self, row):
+        # Returns False if the channel was not a favourite
+        identity = self._rows.pop(row, None)
+        if identity is None:
+            return False
+        del self.entries[identity]
+        category = self.table.category(row)
+        rows = self.by_category.get(category)
+        if rows is not None:
+            rows.remove(row)
+            if not rows:
+                del self.by_category[category]
+        self.dirty = True
+        return True
+
+    def to_json(self):
+        return json.dumps(list(self.entries.values()))
+
+    @classmethod
+    def from_json(cls, text):
+        try:
+            return cls(json.loads(text))
+        except (json.JSONDecodeError, TypeError, KeyError, ValueError):
+            return cls()
+
+    @classmethod
+    def load(cls, path):
+        # An empty store if path does not exist or cannot be read
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return cls.from_json(f.read())
+        except OSError:
+            return cls()
+
+    def save(self, path):
+        # Writes the favourites to path (temp file + rename) if they changed since the last save
+        if not self.dirty:
+            return False
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        atomic_write(path, self.to_json().encode("utf-8"))
+        self.dirty = False
+        return True
@@ -0,0 +1,101 @@
+from bisect import bisect_left
+from collections import namedtuple
+
+GRID_ROW_HEIGHT = 28 # Pixels per channel row
+GRID_PIXELS_PER_MINUTE = 4 # Horizontal scale; two hours are about 480 pixels
+GRID_SLOT_SECONDS = 1800 # Time labels, and the edges of the grid, fall on half hours
+
+GridRow = namedtuple("GridRow", ["row", "channel_id", "name"]) # row: playlist row id, or None
+GridCell = namedtuple("GridCell", ["index", "programme", "x0", "x1", "title"])
+
+class GuideGridLayout:
+    # Geometry of a channels x time guide grid, in pixels of a virtual surface of
+    # width x height. Nothing is precomputed per programme: rows_in() and cells() answer "what
+    # is inside this viewport" from the row arithmetic and a bisect on each visible channel's
+    # start times, so the cost of drawing a frame depends on the viewport, not on the guide.
+    def __init__(self, rows, epg_index, start, stop, row_height=GRID_ROW_HEIGHT,
+                 pixels_per_minute=GRID_PIXELS_PER_MINUTE):
+        self.rows = rows
+        self.guides = [epg_index.get(row.channel_id) for row in rows]
+        self.start = start
+        self.stop = max(stop, start + GRID_SLOT_SECONDS)
+        self.row_height = row_height
+        self.pixels_per_second = pixels_per_minute / 60
+
+    @classmethod
+    def for_playlist(cls, channels, epg_index, **options):
+        # One row per playlist channel that has a guide, in playlist order, spanning every
+        # programme of those channels
+        rows = []
+        start = stop = None
+        for row, (name, url, tvg_id) in enumerate(zip(channels.names, channels.urls, channels.tvg_ids)):
+            if url is None or tvg_id is None:
+                continue
+            guide = epg_index.get(tvg_id)
+            if guide is None or not len(guide):
+                continue
+            rows.append(GridRow(row, tvg_id, name))
+            start = guide.starts[0] if start is None else min(start, guide.starts[0])
+            stop = guide.stops[-1] if stop is None else max(stop, guide.stops[-1])
+        if start is None:
+            start = stop = 0
+        start -= start % GRID_SLOT_SECONDS
+        stop += -stop % GRID_SLOT_SECONDS
+        return cls(rows, epg_index, start, stop, **options)
+
+    def __len__(self):
+        return len(self.rows)
+
+    @property
+    def width(self):
+        return round((self.stop - self.start) * self.pixels_per_second)
+
+    @property
+    def height(self):
+        return len(self.rows) * self.row_height
+
+    def x_for(self, when):
+        return (when - self.start) * self.pixels_per_second
+
+    def time_for(self, x):
+        return self.start + x / self.pixels_per_second
+
+    def rows_in(self, top, height):
+        # Indexes of the rows at least partly inside [top, top + height)
+        first = max(0, int(top // self.row_height))
+        last = min(len(self.rows), int(-(-(top + height) // self.row_height)))
+        return range(first, max(first, last))
+
+    def cells(self, index, left, width):
+        # The programmes of row `index` overlapping [left, left + width), with their x range
+        # on the virtual surface (not clipped to the viewport)
+        guide = self.guides[index]
+        if guide is None:
+            return []
+        window_start = self.time_for(left)
+        window_stop = self.time_for(left + width)
+        scale = self.pixels_per_second
+        starts, stops, titles = guide.starts, guide.stops, guide.titles
+        first = guide.index_at(window_start)
+        last = bisect_left(starts, window_stop)
+        return [GridCell(index, i, (starts[i] - self.start) * scale, (stops[i] - self.start) * scale, titles[i])
+                for i in range(first, last)]
+
+    def cell_at(self, x, y):
+        # (row index, programme index) under a point of the virtual surface, or None
+        index = int(y // self.row_height)
+        if not 0 <= index < len(self.rows) or self.guides[index] is None:
+            return None
+        guide = self.guides[index]
+        when = self.time_for(x)
+        i = guide.index_at(when)
+        if i < len(guide) and guide.starts[i] <= when < guide.stops[i]:
+            return index, i
+        return None
+
+    def slots(self, left, width):
+        # Label times (multiples of GRID_SLOT_SECONDS) inside [left, left + width)
+        first = int(self.time_for(left))
+        first += -first % GRID_SLOT_SECONDS
+        last = self.time_for(left + width)
+        return list(range(first, int(last) + 1, GRID_SLOT_SECONDS))
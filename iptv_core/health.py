@@ -0,0 +1,207 @@
+import functools
+import threading
+import time
+from collections import OrderedDict, deque, namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+PROBE_WORKERS = 16 # Streams checked at the same time
+PROBE_PER_HOST = 2 # Concurrent checks against one host, providers often cap connections per account
+PROBE_TIMEOUT = 8 # Seconds before a stream counts as offline
+PROBE_TTL = 15 * 60 # Seconds a result stays valid before the stream is checked again
+PROBE_RESULT_LIMIT = 100000 # Results kept at most, the oldest dropped first
+SLOW_TTFB = 2.0 # Seconds to first byte above which a working stream is reported as slow
+MANIFEST_PEEK_BYTES = 64 * 1024 # How much of an HLS manifest is read to validate it
+
+STATUS_OK = "ok"
+STATUS_SLOW = "slow"
+STATUS_BROKEN = "broken" # Reachable, but not serving a usable stream (e.g. an invalid HLS manifest)
+STATUS_OFFLINE = "offline"
+
+# Lower ranks sort first when channels are ordered by health; unknown streams go between
+STATUS_RANK = {STATUS_OK: 0, STATUS_SLOW: 1, None: 2, STATUS_BROKEN: 3, STATUS_OFFLINE: 4}
+
+ProbeResult = namedtuple("ProbeResult", ["status", "http_status", "ttfb", "hls_valid", "checked_at", "error"])
+
+def is_hls_manifest(data):
+    # A playable HLS playlist starts with #EXTM3U and lists either segments or variant streams
+    text = data.lstrip(b"\xef\xbb\xbf").lstrip()
+    if not text.startswith(b"#EXTM3U"):
+        return False
+    return b"#EXTINF" in text or b"#EXT-X-STREAM-INF" in text or b"#EXT-X-TARGETDURATION" in text
+
+def looks_like_hls(url, content_type):
+    return urlsplit(url).path.lower().endswith(".m3u8") or "mpegurl" in (content_type or "").lower()
+
+def probe_stream(session, url, timeout=PROBE_TIMEOUT):
+    # Opens url, waits for the first bytes and, for HLS, validates the manifest.
+    # Never raises: every failure is reported as a ProbeResult.
+    import requests
+
+    started = time.perf_counter()
+    try:
+        with session.get(url, timeout=timeout, stream=True) as response:
+            if response.status_code >= 400:
+                return ProbeResult(STATUS_OFFLINE, response.status_code, None, None, time.time(), f"HTTP {response.status_code}")
+
+            hls = looks_like_hls(url, response.headers.get("Content-Type"))
+            chunks = response.iter_content(chunk_size=MANIFEST_PEEK_BYTES if hls else 4096)
+            first = next(chunks, b"")
+            ttfb = time.perf_counter() - started
+            if not first:
+                return ProbeResult(STATUS_BROKEN, response.status_code, ttfb, None, time.time(), "empty response")
+
+            hls_valid = None
+            if hls or first.lstrip().startswith(b"#EXTM3U"):
+                data = first
+                while len(data) < MANIFEST_PEEK_BYTES and b"#EXTINF" not in data and b"#EXT-X-STREAM-INF" not in data:
+                    more = next(chunks, b"")
+                    if not more:
+                        break
+                    data += more
+                hls_valid = is_hls_manifest(data)
+                if not hls_valid:
+                    return ProbeResult(STATUS_BROKEN, response.status_code, ttfb, False, time.time(), "invalid HLS manifest")
+
+            status = STATUS_SLOW if ttfb >= SLOW_TTFB else STATUS_OK
+            return ProbeResult(status, response.status_code, ttfb, hls_valid, time.time(), None)
+    except requests.exceptions.RequestException as e:
+        return ProbeResult(STATUS_OFFLINE, None, None, None, time.time(), str(e))
+
+class StreamProber:
+    # Checks channel URLs in the background with a bounded worker pool and a per-host limit,
+    # keeping the results for PROBE_TTL seconds. on_result(url, result) is called from the
+    # worker thread that produced the result.
+    # Every host has its own queue drained by at most per_host checks at a time; a worker checks
+    # one url and then puts its host back behind the other work, so a host at its limit never
+    # holds a worker that could be checking another host.
+    def __init__(self, session=None, workers=PROBE_WORKERS, per_host=PROBE_PER_HOST,
+                 timeout=PROBE_TIMEOUT, ttl=PROBE_TTL, on_result=None):
+        self._session = session
+        self.workers = workers
+        self.per_host = per_host
+        self.timeout = timeout
+        self.ttl = ttl
+        self.on_result = on_result
+        self.results = OrderedDict() # {url: ProbeResult}, oldest check first
+        self._pending = set()
+        self._queues = {} # {host: deque of (url, record, Future)}
+        self._active = {} # {host: checks of host scheduled or running}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="probe")
+
+    @property
+    def session(self):
+        if self._session is None:
+            from .model import create_session
+            self._session = create_session(self.workers)
+        return self._session
+
+    def result(self, url, now=None):
+        # The last result for url, or None if it was never checked or has expired
+        result = self.results.get(url)
+        if result is None or (now or time.time()) - result.checked_at > self.ttl:
+            return None
+        return result
+
+    def status(self, url):
+        result = self.result(url)
+        return result.status if result is not None else None
+
+    def rank(self, url):
+        # Sort key putting working, fast streams first
+        result = self.result(url)
+        if result is None:
+            return (STATUS_RANK[None], 0.0)
+        return (STATUS_RANK[result.status], result.ttfb or 0.0)
+
+    def submit(self, urls):
+        # Queues every url that has no fresh result and is not already queued
+        now = time.time()
+        queued = 0
+        for url in urls:
+            with self._lock:
+                if url in self._pending or self.result(url, now) is not None:
+                    continue
+                self._pending.add(url)
+            self.check(url).add_done_callback(functools.partial(self._done, url))
+            queued += 1
+        return queued
+
+    def check(self, url, record=True):
+        # Queues a check of url and returns a Future of its ProbeResult, which is recorded
+        # unless record is False (e.g. one-off checks of huge playlists)
+        future = Future()
+        host = urlsplit(url).netloc
+        with self._lock:
+            queue = self._queues.get(host)
+            if queue is None:
+                queue = self._queues[host] = deque()
+            queue.append((url, record, future))
+            active = self._active.get(host, 0)
+            if active < self.per_host:
+                self._active[host] = active + 1
+                self._executor.submit(self._run, host)
+        return future
+
+    def probe(self, url, record=True):
+        # Checks url and waits for the result; the per-host limit applies as for submit()
+        return self.check(url, record).result()
+
+    def _run(self, host):
+        # Checks the next queued url of host, then either schedules the host's next check or
+        # gives up its slot
+        with self._lock:
+            queue = self._queues.get(host)
+            url, record, future = queue.popleft() if queue else (None, False, None)
+        if future is not None and future.set_running_or_notify_cancel():
+            try:
+                result = probe_stream(self.session, url, self.timeout)
+            except BaseException as e: # e.g. requests missing; report it to whoever waits
+                future.set_exception(e)
+            else:
+                if record:
+                    self._record(url, result)
+                future.set_result(result)
+        with self._lock:
+            queue = self._queues.get(host)
+            if queue:
+                self._executor.submit(self._run, host)
+                return
+            self._active[host] -= 1
+            if not self._active[host]:
+                del self._active[host]
+                self._queues.pop(host, None)
+
+    def _record(self, url, result):
+        # Results are kept in the order they were checked, so the expired ones, and beyond
+        # PROBE_RESULT_LIMIT the oldest ones, are dropped from the front
+        with self._lock:
+            results = self.results
+            results.pop(url, None)
+            results[url] = result
+            expired = result.checked_at - self.ttl
+            while results:
+                oldest = next(iter(results.values()))
+                if len(results) <= PROBE_RESULT_LIMIT and oldest.checked_at >= expired:
+                    break
+                results.popitem(last=False)
+
+    def _done(self, url, future):
+        with self._lock:
+            self._pending.discard(url)
+        if self.on_result is not None and not future.cancelled() and future.exception() is None:
+            self.on_result(url, future.result())
+
+    def cancel_pending(self):
+        # Drops queued checks that have not started; checks already running still complete
+        with self._lock:
+            queued = [item for queue in self._queues.values() for item in queue]
+            for queue in self._queues.values():
+                queue.clear()
+        for _, _, future in queued:
+            future.cancel()
+
+    def shutdown(self):
+        self.cancel_pending()
+        self._executor.shutdown(wait=False, cancel_futures=True)
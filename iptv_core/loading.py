@@ -0,0 +1,65 @@
+import queue
+import threading
+
+from .metrics import METRICS
+
+class LoadJob:
+    # One load or refresh running on a worker thread. The worker is handed cancel_event (to pass
+    # to PlaylistModel.load_progressively() or fetch()) and, for queue-driven loads, `events`.
+    def __init__(self, generation):
+        self.generation = generation
+        self.cancel_event = threading.Event()
+        self.events = queue.Queue()
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+class LoadManager:
+    # Tags every load with an increasing generation and keeps only the latest one alive:
+    # begin() cancels the job it supersedes, whose downloads stop at their next chunk, and
+    # publish() only lets the current job's results into the model. A superseded job may still
+    # be winding down on its thread, but nothing it produces is applied. Meant for the thread
+    # that owns the UI, like PlaylistModel.apply().
+    def __init__(self):
+        self.generation = 0
+        self.current = None
+
+    @property
+    def running(self):
+        return self.current is not None
+
+    def begin(self):
+        # Starts a new generation; the job still running (if any) is cancelled
+        if self.current is not None:
+            self.current.cancel()
+            METRICS.increment("loads_superseded")
+        self.generation += 1
+        self.current = LoadJob(self.generation)
+        return self.current
+
+    def is_current(self, job):
+        return job is self.current and not job.cancelled
+
+    def publish(self, job, apply, *args):
+        # Calls apply(*args) if job is still the current generation; returns whether it did
+        if not self.is_current(job):
+            METRICS.increment("load_results_discarded")
+            return False
+        apply(*args)
+        return True
+
+    def finish(self, job):
+        # Marks job as done; returns False if it had been superseded or cancelled meanwhile
+        if job is not self.current:
+            return False
+        self.current = None
+        return not job.cancelled
+
+    def cancel(self):
+        if self.current is not None:
+            self.current.cancel()
+            self.current = None
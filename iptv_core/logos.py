@@ -0,0 +1,194 @@
+import hashlib
+import io
+import os
+import struct
+import threading
+from collections import OrderedDict, deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from .cache import atomic_write
+from .metrics import METRICS
+
+LOGO_SIZE = (36, 20) # Bounding box of a thumbnail in pixels (width, height); fits a tree row
+LOGO_MEMORY_BYTES = 8 * 1024 * 1024 # Budget of the in-memory thumbnail LRU
+LOGO_WORKERS = 4 # Logos downloaded and decoded at the same time
+LOGO_TIMEOUT = 10 # Seconds to wait for a logo server
+LOGO_MAX_BYTES = 2 * 1024 * 1024 # Images larger than this are not downloaded
+LOGO_ENTRY_BYTES = 100 # Charged per LRU entry on top of the thumbnail, so failed URLs count too
+
+PNG_MAGIC = b"\x89PNG\r\n\x1a\n"
+GIF_MAGICS = (b"GIF87a", b"GIF89a")
+
+# A thumbnail ready for tk.PhotoImage(data=...): PNG or GIF bytes, plus the integer factor to
+# subsample it by when shown (1 unless Pillow is missing and the original had to be kept)
+LogoImage = namedtuple("LogoImage", ["data", "subsample"])
+
+def image_size(data):
+    # (width, height) read from a PNG or GIF header, or None for other formats
+    if data.startswith(PNG_MAGIC) and len(data) >= 24:
+        return struct.unpack(">II", data[16:24])
+    if data[:6] in GIF_MAGICS and len(data) >= 10:
+        return struct.unpack("<HH", data[6:10])
+    return None
+
+def _fit_factor(data, size):
+    # Integer factor by which a PNG or GIF must be subsampled to fit size; None for other formats
+    dimensions = image_size(data)
+    if dimensions is None or not all(dimensions):
+        return None
+    (width, height), (max_width, max_height) = dimensions, size
+    return max(1, -(-width // max_width), -(-height // max_height))
+
+def _native_thumbnail(data, size):
+    # Without Pillow, only what Tk decodes itself is usable, shrunk when shown
+    factor = _fit_factor(data, size)
+    return None if factor is None else LogoImage(data, factor)
+
+def make_thumbnail(data, size=LOGO_SIZE):
+    # LogoImage fitting `size` for encoded image bytes, or None if they cannot be decoded.
+    # Pillow, when installed, decodes any format and scales smoothly; without it PNG and GIF
+    # still work.
+    try:
+        from PIL import Image
+    except ImportError:
+        return _native_thumbnail(data, size)
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            image.draft("RGB", size) # JPEGs are decoded at a reduced scale straight away
+            if image.mode not in ("RGB", "RGBA"):
+                image = image.convert("RGBA")
+            image.thumbnail(size, Image.Resampling.LANCZOS)
+            output = io.BytesIO()
+            image.save(output, "PNG")
+    except (OSError, ValueError, SyntaxError, Image.DecompressionBombError):
+        return None
+    return LogoImage(output.getvalue(), 1)
+
+class LogoCache:
+    # Channel logos as small thumbnails in two tiers: an LRU in memory bounded by a byte budget,
+    # and a directory holding one file per logo URL hash. Nothing blocks the caller: get() only
+    # looks in memory, and request() queues downloads for a bounded worker pool, which also
+    # decodes and scales them. A new request() replaces the queued URLs that have not started,
+    # so scrolling past thousands of rows only ever fetches what is still wanted.
+    # on_ready(url) is called from the worker thread once a URL's result is in memory.
+    def __init__(self, directory, size=LOGO_SIZE, memory_bytes=LOGO_MEMORY_BYTES, workers=LOGO_WORKERS,
+                 session=None, on_ready=None):
+        self.directory = os.path.join(directory, f"{size[0]}x{size[1]}")
+        self.size = size
+        self.memory_budget = memory_bytes
+        self.memory_bytes = 0
+        self.workers = workers
+        self.on_ready = on_ready
+        self._session = session
+        self._memory = OrderedDict() # {url: LogoImage, or None for a logo that could not be loaded}
+        self._queue = deque()
+        self._in_flight = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="logo")
+
+    @property
+    def session(self):
+        if self._session is None:
+            from .model import create_session
+            self._session = create_session(self.workers)
+        return self._session
+
+    def _path(self, url):
+        return os.path.join(self.directory, hashlib.sha1(url.encode("utf-8")).hexdigest() + ".img")
+
+    def get(self, url):
+        # (found, LogoImage or None) from memory; found is False until the logo has been loaded
+        with self._lock:
+            if url not in self._memory:
+                return False, None
+            self._memory.move_to_end(url)
+            return True, self._memory[url]
+
+    def request(self, urls):
+        # Queues the logos of urls (most wanted first) that are neither in memory nor being
+        # loaded, dropping whatever earlier requests had queued and not started yet
+        with self._lock:
+            self._queue = deque(url for url in dict.fromkeys(urls)
+                                if url and url not in self._memory and url not in self._in_flight)
+            queued = len(self._queue)
+            self._dispatch()
+        return queued
+
+    def _dispatch(self):
+        # Called with the lock held: keeps at most `workers` loads running
+        while self._queue and len(self._in_flight) < self.workers:
+            url = self._queue.popleft()
+            self._in_flight.add(url)
+            self._executor.submit(self._run, url)
+
+    def _remember(self, url, logo):
+        # Called with the lock held
+        self._memory[url] = logo
+        self.memory_bytes += LOGO_ENTRY_BYTES + (len(logo.data) if logo is not None else 0)
+        while self.memory_bytes > self.memory_budget and len(self._memory) > 1:
+            _, evicted = self._memory.popitem(last=False)
+            self.memory_bytes -= LOGO_ENTRY_BYTES + (len(evicted.data) if evicted is not None else 0)
+
+    def _run(self, url):
+        logo = None
+        try:
+            logo = self.load(url)
+        finally:
+            with self._lock:
+                self._in_flight.discard(url)
+                self._remember(url, logo)
+                self._dispatch()
+        if self.on_ready is not None:
+            self.on_ready(url)
+
+    def load(self, url):
+        # Returns the thumbnail for url from disk, or downloads, scales and stores it; None if
+        # the logo cannot be had. Failures are not written to disk, so they are retried after a
+        # restart.
+        path = self._path(url)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            pass
+        else:
+            METRICS.increment("logo_requests", result="disk")
+            return LogoImage(data, _fit_factor(data, self.size) or 1)
+
+        data = self._download(url)
+        logo = make_thumbnail(data, self.size) if data is not None else None
+        if logo is None:
+            METRICS.increment("logo_requests", result="failed")
+            return None
+        METRICS.increment("logo_requests", result="fetched")
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            atomic_write(path, logo.data)
+        except OSError:
+            pass # The disk tier is an optimisation; the logo is still shown
+        return logo
+
+    def _download(self, url):
+        # The image bytes at url, or None on any error or if it exceeds LOGO_MAX_BYTES
+        import requests
+
+        if not url.startswith(("http://", "https://")):
+            return None
+        try:
+            with self.session.get(url, timeout=LOGO_TIMEOUT, stream=True) as response:
+                response.raise_for_status()
+                chunks = []
+                received = 0
+                for chunk in response.iter_content(64 * 1024):
+                    received += len(chunk)
+                    if received > LOGO_MAX_BYTES:
+                        return None
+                    chunks.append(chunk)
+        except requests.exceptions.RequestException:
+            return None
+        return b"".join(chunks)
+
+    def shutdown(self):
+        with self._lock:
+            self._queue.clear()
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,78 @@
+import re
+
+M3U_CHUNK_SIZE = 64 * 1024 # Bytes read from the network per chunk while streaming a playlist
+
+# Matches every key="value" attribute of an #EXTINF line in a single pass
+M3U_ATTRIBUTE_RE = re.compile(r'([A-Za-z0-9_-]+)="([^"]*)"')
+# Runs over the attribute part of an #EXTINF line, up to the comma that starts the display name;
+# quoted values are skipped whole, so commas inside them do not end it
+M3U_ATTRIBUTES_END_RE = re.compile(r'(?:[^",]+|"[^"]*")*')
+ATTRIBUTE_KEY_CACHE_SIZE = 1024 # Distinct attribute names remembered with their channel dict key
+_ATTRIBUTE_KEYS = {} # Raw attribute name -> channel dict key ("TVG-ID" -> "tvg_id")
+
+def parse_extinf(line):
+    # Returns (attributes, display_name) for an "#EXTINF:-1 key="value" ...,Name" line.
+    # The display name is whatever follows the first comma outside quoted values, so commas
+    # inside values such as group-title="News, Sport" are not mistaken for it, and text in the
+    # name that looks like an attribute (Foo group-title="X") is not read as one.
+    comma = _name_comma(line)
+    attributes = {}
+    for key, value in M3U_ATTRIBUTE_RE.findall(line, 8, comma if comma != -1 else len(line)):
+        attributes[key.lower()] = value
+    display_name = line[comma + 1:].strip() if comma != -1 else ""
+    return attributes, display_name
+
+def _name_comma(line):
+    # Offset of the comma ending the attributes of an #EXTINF line, or -1 if there is none
+    end = M3U_ATTRIBUTES_END_RE.match(line, 8).end() # len("#EXTINF:")
+    if end < len(line) and line[end] == '"':
+        return line.find(",", end) # A quote that is never closed; take the next comma
+    return end if end < len(line) else -1
+
+def iter_m3u_channels(lines, raw=False):
+    # Yields one channel dict per playlist entry as soon as its URL line has been read.
+    # Every #EXTINF attribute is kept, with dashes mapped to underscores (tvg-logo -> tvg_logo),
+    # and group-title exposed as "category" like the rest of the app expects.
+    # With raw=True, yields (channel, text) pairs instead, text being the entry's original lines
+    # (directives such as #EXTVLCOPT included) so it can be written out unchanged.
+    current_channel_info = None
+    current_group = None
+    keys = _ATTRIBUTE_KEYS
+    entry_lines = []
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode("utf-8", errors="replace")
+        line = line.strip()
+        if not line:
+            continue
+        if raw and not line.startswith("#EXTM3U"):
+            entry_lines.append(line)
+        if line.startswith("#EXTINF:"):
+            comma = _name_comma(line)
+            pairs = M3U_ATTRIBUTE_RE.findall(line, 8, comma if comma != -1 else len(line))
+            current_channel_info = {}
+            for key, value in pairs:
+                name = keys.get(key)
+                if name is None:
+                    name = key.lower().replace("-", "_")
+                    if len(keys) < ATTRIBUTE_KEY_CACHE_SIZE:
+                        keys[key] = name
+                current_channel_info[name] = value
+            channel_name = line[comma + 1:].strip() if comma != -1 else ""
+            current_channel_info["name"] = channel_name or current_channel_info.get("tvg_name") or "Unknown Channel"
+            current_channel_info["category"] = current_channel_info.pop("group_title", None)
+            current_channel_info["tvg_id"] = current_channel_info.get("tvg_id") or None
+            current_group = None
+        elif line.startswith("#EXTGRP:"):
+            current_group = line[8:].strip() or None
+        elif not line.startswith("#"):
+            if current_channel_info is not None:
+                current_channel_info["url"] = line
+                current_channel_info["category"] = current_channel_info["category"] or current_group or "Uncategorized"
+                if raw:
+                    yield current_channel_info, "\n".join(entry_lines) + "\n"
+                else:
+                    yield current_channel_info
+            current_channel_info = None
+            current_group = None
+            entry_lines = []
@@ -0,0 +1,205 @@
+import functools
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+
+from .cache import atomic_write
+
+# Upper bounds (seconds) of the Prometheus histogram buckets every timer is sorted into
+TIMER_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+JOURNAL_LIMIT = 10000 # Samples buffered between two flush_journal() calls; older ones are dropped
+METRIC_PREFIX = "iptv_"
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+_NULL_TIMER = _NullTimer()
+
+class _Timer:
+    __slots__ = ("metrics", "name", "labels", "started")
+
+    def __init__(self, metrics, name, labels):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.observe(self.name, time.perf_counter() - self.started, **self.labels)
+        return False
+
+class _TimerStats:
+    __slots__ = ("count", "total", "minimum", "maximum", "last", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.minimum = None
+        self.maximum = 0.0
+        self.last = 0.0
+        self.buckets = [0] * (len(TIMER_BUCKETS) + 1) # Non-cumulative; the last one is +Inf
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.minimum = seconds if self.minimum is None else min(self.minimum, seconds)
+        self.maximum = max(self.maximum, seconds)
+        self.last = seconds
+        self.buckets[bisect_left(TIMER_BUCKETS, seconds)] += 1
+
+class Metrics:
+    # Timers, counters and gauges for finding out where time goes, keyed by name plus optional
+    # labels (e.g. observe("stream_start", 1.2, kind="cold")). While `enabled` is False every
+    # call returns right after one attribute check, so instrumentation can stay in hot paths.
+    # Samples can be exported as JSON lines and as a Prometheus text exposition file.
+    # Safe to use from several threads.
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.timers = {} # {(name, labels): _TimerStats}
+        self.counters = {} # {(name, labels): number}
+        self.gauges = {} # {(name, labels): number}
+        self._journal = deque(maxlen=JOURNAL_LIMIT)
+        self._lock = threading.Lock()
+
+    def timer(self, name, **labels):
+        # Context manager timing its block: `with metrics.timer("parse_m3u"): ...`
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, name, labels)
+
+    def observe(self, name, seconds, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            stats = self.timers.get(key)
+            if stats is None:
+                stats = self.timers[key] = _TimerStats()
+            stats.add(seconds)
+            self._journal.append({"time": round(time.time(), 3), "type": "timer", "name": name,
+                                  "labels": labels, "seconds": round(seconds, 6)})
+
+    def increment(self, name, amount=1, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+            self._journal.append({"time": round(time.time(), 3), "type": "counter", "name": name,
+                                  "labels": labels, "amount": amount})
+
+    def set_gauge(self, name, value, **labels):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.gauges[(name, tuple(sorted(labels.items())))] = value
+
+    def reset(self):
+        with self._lock:
+            self.timers.clear()
+            self.counters.clear()
+            self.gauges.clear()
+            self._journal.clear()
+
+    def snapshot(self):
+        # Plain-data copy of every metric, e.g. for a diagnostics view:
+        # [(kind, name, labels, values)] sorted by name
+        with self._lock:
+            rows = [("timer", name, dict(labels), {"count": stats.count, "total": stats.total,
+                                                    "mean": stats.total / stats.count, "min": stats.minimum,
+                                                    "max": stats.maximum, "last": stats.last})
+                    for (name, labels), stats in self.timers.items()]
+            rows += [("counter", name, dict(labels), {"value": value}) for (name, labels), value in self.counters.items()]
+            rows += [("gauge", name, dict(labels), {"value": value}) for (name, labels), value in self.gauges.items()]
+        rows.sort(key=lambda row: (row[1], sorted(row[2].items())))
+        return rows
+
+    def flush_journal(self, path):
+        # Appends the samples recorded since the last flush to path, one JSON object per line
+        with self._lock:
+            records = list(self._journal)
+            self._journal.clear()
+        if not records:
+            return 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, "a", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record, separators=(",", ":")) + "\n")
+        return len(records)
+
+    def to_prometheus(self):
+        # Prometheus text exposition format: timers as histograms in seconds, counters as *_total
+        lines = []
+        with self._lock:
+            timers = sorted(self.timers.items())
+            counters = sorted(self.counters.items())
+            gauges = sorted(self.gauges.items())
+
+        declared = set()
+        def declare(metric, kind):
+            if metric not in declared:
+                declared.add(metric)
+                lines.append(f"# TYPE {metric} {kind}")
+
+        for (name, labels), stats in timers:
+            metric = f"{METRIC_PREFIX}{name}_seconds"
+            declare(metric, "histogram")
+            cumulative = 0
+            for bound, count in zip(TIMER_BUCKETS + (None,), stats.buckets):
+                cumulative += count
+                le = "+Inf" if bound is None else repr(bound)
+                lines.append(f"{metric}_bucket{_format_labels(labels + (('le', le),))} {cumulative}")
+            lines.append(f"{metric}_sum{_format_labels(labels)} {stats.total!r}")
+            lines.append(f"{metric}_count{_format_labels(labels)} {stats.count}")
+        for (name, labels), value in counters:
+            metric = f"{METRIC_PREFIX}{name}_total"
+            declare(metric, "counter")
+            lines.append(f"{metric}{_format_labels(labels)} {value}")
+        for (name, labels), value in gauges:
+            metric = f"{METRIC_PREFIX}{name}"
+            declare(metric, "gauge")
+            lines.append(f"{metric}{_format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path):
+        # Rewritten atomically, so a node_exporter textfile collector never reads half a file
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        atomic_write(path, self.to_prometheus().encode("utf-8"))
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in labels)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + "}"
+
+METRICS = Metrics() # Process-wide registry used by the core and the GUI; disabled until switched on
+
+def timed(name, metrics=None):
+    # Decorator timing every call of a function under `name` while the registry is enabled
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            registry = metrics or METRICS
+            if not registry.enabled:
+                return function(*args, **kwargs)
+            started = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                registry.observe(name, time.perf_counter() - started)
+        return wrapper
+    return decorate
@@ -0,0 +1,651 @@
+import functools
+import io
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from .cache import SourceCache
+from .channels import ChannelTable
+from .epg import EPGIndex, parse_xmltv_time
+from .epg_pool import EPG_POOL_MIN_BYTES, default_pool, ingest_in_processes
+from .favourites import FavouritesStore
+from .metrics import METRICS, timed
+from .programmes import ProgrammeDatabase
+from .m3u import M3U_CHUNK_SIZE, iter_m3u_channels
+from .search import ChannelSearchIndex
+from .xmltv import open_decompressed_stream, iter_xmltv
+
+HTTP_TIMEOUT = 20 # Seconds to wait for a source to connect or send data
+HTTP_POOL_SIZE = 8 # Keep-alive connections kept per host by the shared session
+MAX_HOLE_RATIO = 0.5 # Share of removed rows a reconciled table may hold before it is rebuilt from scratch
+EPG_KEEP_PAST_HOURS = 2 # Programmes that ended longer ago than this are not kept
+EPG_KEEP_FUTURE_HOURS = 72 # Programmes starting further ahead than this are not kept
+EPG_REFETCH_HOURS = 12 # A guide whose window ends this much before the current one is downloaded again in full
+LOAD_BATCH_ROWS = 5000 # Rows parsed between two hand-offs to the UI during a progressive load...
+LOAD_BATCH_SECONDS = 0.1 # ...or at least this often, so a slow download still shows channels as they arrive
+
+# Events put on the queue of PlaylistModel.load_progressively(), as (kind, value) pairs
+LOAD_TABLE = "table" # The ChannelTable being filled; sent once, before any LOAD_ROWS
+LOAD_ROWS = "rows" # Row count of that table up to which rows are complete and can be shown
+LOAD_PROGRESS = "progress" # A LoadProgress
+LOAD_CHANNELS = "channels" # ModelUpdate holding the finished table, with its lookups and search index
+LOAD_GUIDE = "guide" # ModelUpdate holding the guide; always comes after LOAD_CHANNELS
+LOAD_ERROR = "error" # The exception that ended the load
+LOAD_DONE = "done" # Always the last event
+
+# Download progress of one stage ("channels" or "guide"). Playlists download together and each
+# reports its own progress, source being its position (1 to sources) in the configuration; guides
+# are reported as one (source == sources). received/total are bytes on the wire; total is None
+# when unknown.
+LoadProgress = namedtuple("LoadProgress", ["stage", "source", "sources", "received", "total"])
+
+class LoadCancelled(Exception):
+    # Raised inside a load or fetch once its cancel event is set; the download it was reading
+    # is closed on the way out
+    pass
+
+def _check_cancelled(cancel):
+    if cancel is not None and cancel.is_set():
+        raise LoadCancelled()
+
+def _cancellable(iterable, cancel):
+    # Passes the items through, raising LoadCancelled before the next one once cancel is set
+    for item in iterable:
+        if cancel.is_set():
+            raise LoadCancelled()
+        yield item
+
+def split_urls(urls):
+    # Sources are configured as one string holding one or more whitespace-separated URLs
+    if isinstance(urls, str):
+        return urls.split()
+    return [url for url in urls or () if url]
+
+@timed("parse_m3u")
+def parse_m3u(m3u_source):
+    # m3u_source may be the whole playlist as a string or any iterable of lines
+    # (e.g. a streamed HTTP response), so the raw text never has to be held at once.
+    if isinstance(m3u_source, (str, bytes)):
+        m3u_source = m3u_source.splitlines()
+    return ChannelTable.from_channels(iter_m3u_channels(m3u_source))
+
+@timed("parse_epg")
+def parse_epg(epg_source, keep_from=None, keep_until=None, pool=None):
+    # epg_source is either the whole XMLTV document or a binary file-like stream.
+    # Elements are handled one at a time and discarded, so the DOM is never built.
+    # Programmes outside [keep_from, keep_until) (epoch seconds) are never stored.
+    # With an EPGProcessPool, guides of EPG_POOL_MIN_BYTES and more (decompressed) are parsed by
+    # its worker processes instead of this thread.
+    from xml.etree.ElementTree import ParseError
+    import lzma
+
+    if isinstance(epg_source, str):
+        epg_source = epg_source.encode("utf-8")
+    if isinstance(epg_source, bytes):
+        epg_source = io.BytesIO(epg_source)
+
+    epg_index = EPGIndex(keep_from, keep_until)
+    try:
+        stream = open_decompressed_stream(epg_source)
+        if pool is not None:
+            head = stream.read(EPG_POOL_MIN_BYTES)
+            if len(head) < EPG_POOL_MIN_BYTES:
+                pool = None # All of it; starting the workers and merging would cost more than they save
+                stream = io.BytesIO(head)
+        if pool is not None:
+            ingest_in_processes(stream, epg_index, pool, head=head)
+        else:
+            for kind, record in iter_xmltv(stream):
+                if kind == "channel":
+                    epg_index.add_channel(*record)
+                elif record["title"] != "N/A" or record["description"] != "No description":
+                    epg_index.add_programme(record["channel"], parse_xmltv_time(record["start"]),
+                                            parse_xmltv_time(record["stop"]),
+                                            record["title"], record["description"])
+        epg_index.finalize()
+    except LoadCancelled:
+        raise
+    except ParseError as e:
+        raise ValueError(f"EPG XML parsing error: {e}")
+    except (OSError, EOFError, lzma.LZMAError) as e:
+        raise ValueError(f"EPG decompression error: {e}")
+    except Exception as e:
+        raise ValueError(f"General EPG parsing error: {e}")
+    return epg_index
+
+def _parse_m3u_response(response, cancel=None):
+    lines = response.iter_lines(chunk_size=M3U_CHUNK_SIZE)
+    return parse_m3u(lines if cancel is None else _cancellable(lines, cancel))
+
+def _content_length(response):
+    try:
+        return int(response.headers["Content-Length"])
+    except (KeyError, ValueError):
+        return None
+
+class _WatchedReader(io.RawIOBase):
+    # Passes a urllib3 response through, reporting the bytes received so far (compressed, as
+    # counted against Content-Length) after every read and stopping with LoadCancelled once
+    # cancel is set
+    def __init__(self, raw, on_progress=None, cancel=None):
+        self._raw = raw
+        self._on_progress = on_progress
+        self._cancel = cancel
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        _check_cancelled(self._cancel)
+        count = self._raw.readinto(buffer)
+        if self._on_progress is not None:
+            self._on_progress(self._raw.tell())
+        return count
+
+def _parse_epg_response(response, keep_from=None, keep_until=None, on_progress=None, cancel=None, pool=None):
+    # on_progress(response, received, total) is called as the guide is read
+    response.raw.decode_content = True # Undo any Content-Encoding transparently
+    response.raw.auto_close = False # Reaching EOF must not close it under the read-ahead buffer
+    source = response.raw
+    if on_progress is not None or cancel is not None:
+        total = _content_length(response)
+        report = None if on_progress is None else lambda received: on_progress(response, received, total)
+        source = _WatchedReader(source, report, cancel)
+    return parse_epg(source, keep_from, keep_until, pool)
+
+def create_session(pool_size=HTTP_POOL_SIZE):
+    # One pooled keep-alive session shared by every download of a model
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+def describe_load_error(error):
+    # User-facing message for an exception raised by PlaylistModel.load()
+    import requests
+    if isinstance(error, requests.exceptions.Timeout):
+        return "Request timed out. Please check the URL or your internet connection."
+    if isinstance(error, requests.exceptions.RequestException):
+        return f"Could not fetch data: {error}"
+    return f"An error occurred during parsing: {error}"
+
+class ModelUpdate:
+    # The result of PlaylistModel.fetch(): fully built replacement data, ready to be swapped in by
+    # apply(). Fields are None for the parts that did not change.
+    def __init__(self):
+        self.channels = None
+        self.search_index = None
+        self.channel_diff = None # ChannelDiff against `base`, or None when the table was rebuilt
+        self.base = None # The ChannelTable channel_diff was computed against
+        self.epg_index = None
+        self.epg_changed = None # Channel ids whose guide changed, or None when unknown (all of them)
+        self.programme_error = None # Why the programme database could not be updated, if it could not
+        self.sources = {}
+
+    def __bool__(self):
+        return self.channels is not None or self.epg_index is not None or bool(self.sources)
+
+class PlaylistModel:
+    # Everything the player knows about its sources, without any GUI or VLC dependency:
+    # channels grouped by category, the EPG index, the search index and the favourites.
+    # The Tk front end owns one of these; batch jobs and benchmarks can use it directly.
+    def __init__(self, cache_dir="cache"):
+        self.channels = ChannelTable() # Every playlist entry, addressed by row id
+        self.epg_index = EPGIndex() # Per-channel programme arrays keyed by tvg-id
+        self.search_index = ChannelSearchIndex(self.channels) # Rebuilt whenever self.channels is replaced
+        self.favourites = FavouritesStore()
+        self.source_cache = SourceCache(cache_dir)
+        self.programme_db = ProgrammeDatabase(os.path.join(cache_dir, "programmes.sqlite3")) # Searchable copy of the guide
+        self._programmes_ingested = False
+        self.programme_error = None # Why the last update could not write the programme database
+        # (hours before, hours after) the current time of guide data to keep; None on either side
+        # keeps everything on that side
+        self.epg_retention = (EPG_KEEP_PAST_HOURS, EPG_KEEP_FUTURE_HOURS)
+        self.epg_playlist_channels_only = False # Skip guide channels no playlist entry refers to
+        # Processes parsing downloaded guides, so the GIL stays free for the UI; None parses them
+        # on the download threads
+        self.epg_pool = default_pool()
+        self._loaded_sources = {} # {"channels"/"epg_index": URLs the in-memory data was merged from}
+        self._session = None
+
+    @property
+    def session(self):
+        if self._session is None:
+            self._session = create_session()
+        return self._session
+
+    def parse_m3u(self, m3u_source):
+        self.channels = parse_m3u(m3u_source)
+
+    def parse_epg(self, epg_source):
+        self.epg_index = parse_epg(epg_source, *self.epg_window(), self.epg_pool)
+
+    def epg_window(self, now=None):
+        # (keep_from, keep_until) in epoch seconds for the retention window, None for no bound
+        if self.epg_retention is None:
+            return None, None
+        now = int(time.time()) if now is None else now
+        past, future = self.epg_retention
+        return (None if past is None else now - int(past * 3600),
+                None if future is None else now + int(future * 3600))
+
+    def _retain(self, epg_index, channels):
+        # Applies the retention window and the playlist filter to a merged guide; snapshots may
+        # have been parsed hours ago, so programmes that aged out since are dropped here too
+        keep_from, _ = self.epg_window()
+        if keep_from is not None:
+            epg_index, _ = epg_index.evicted(keep_from)
+        if self.epg_playlist_channels_only:
+            epg_index = epg_index.restricted(set(channels.tvg_ids))
+        return epg_index
+
+    def _guide_covers(self, epg_index):
+        # Whether a guide parsed earlier still reaches far enough ahead. It holds nothing past the
+        # keep_until it was parsed with, so a 304 for it is no use once that lags the current
+        # window by EPG_REFETCH_HOURS: the unchanged source has to be parsed again.
+        if epg_index.keep_until is None:
+            return True
+        _, keep_until = self.epg_window()
+        return keep_until is not None and epg_index.keep_until >= keep_until - EPG_REFETCH_HOURS * 3600
+
+    def evict_expired(self, now=None):
+        # Drops the programmes that left the retention window since the guide was loaded and
+        # returns how many; meant for the thread that owns the UI, like apply()
+        keep_from, _ = self.epg_window(now)
+        if keep_from is None:
+            return 0
+        epg_index, dropped = self.epg_index.evicted(keep_from)
+        if dropped:
+            self.epg_index = epg_index
+            METRICS.increment("epg_programmes_evicted", dropped)
+        return dropped
+
+    def _load_snapshots(self, urls):
+        snapshots = [self.source_cache.load(url) for url in urls]
+        return None if any(snapshot is None for snapshot in snapshots) else snapshots
+
+    def load_cached(self, m3u_urls, epg_urls):
+        # Loads the local snapshots of every source; returns False if a playlist snapshot is missing
+        m3u_urls = tuple(split_urls(m3u_urls))
+        tables = self._load_snapshots(m3u_urls) if m3u_urls else None
+        if tables is None or not all(isinstance(table, ChannelTable) for table in tables):
+            return False
+        self.channels = ChannelTable.merge(tables)
+        self.search_index = ChannelSearchIndex(self.channels)
+        self._loaded_sources["channels"] = m3u_urls
+
+        epg_urls = tuple(split_urls(epg_urls))
+        indexes = self._load_snapshots(epg_urls) if epg_urls else None
+        if indexes is not None:
+            self.epg_index = self._retain(EPGIndex.merge(indexes), self.channels)
+            self._loaded_sources["epg_index"] = epg_urls
+        return True
+
+    def _fetch_source(self, url, parse, in_memory, usable=None):
+        # Downloads url and returns (parsed data, changed), sending the cached ETag/Last-Modified
+        # so an unchanged source costs a single 304 response. When the server confirms that the
+        # copy already merged into memory is current, returns (None, False).
+        # A failed download falls back to the local snapshot if nothing is in memory yet.
+        # usable(snapshot) says whether a snapshot can stand in for the source at all; one that
+        # cannot is downloaded in full, and only kept as the fallback.
+        import requests
+
+        cached = None if in_memory else self.source_cache.load(url)
+        revalidate = in_memory or (cached is not None and (usable is None or usable(cached)))
+        headers = self.source_cache.conditional_headers(url) if revalidate else {}
+        started = time.perf_counter()
+        try:
+            with self.session.get(url, timeout=HTTP_TIMEOUT, stream=True, headers=headers) as response:
+                if response.status_code == 304:
+                    METRICS.increment("source_requests", result="not_modified")
+                    return cached, not in_memory
+                response.raise_for_status()
+                data = parse(response)
+                etag = response.headers.get("ETag")
+                last_modified = response.headers.get("Last-Modified")
+        except requests.exceptions.RequestException:
+            if cached is not None:
+                METRICS.increment("source_requests", result="cache_fallback")
+                return cached, True
+            METRICS.increment("source_requests", result="failed")
+            raise
+
+        METRICS.increment("source_requests", result="fetched")
+        METRICS.observe("fetch_source", time.perf_counter() - started) # Download and parse together
+        self.source_cache.store(url, data, etag, last_modified)
+        return data, True
+
+    def _fetch_all(self, executor, kind, urls, parse, usable=None):
+        # Starts one download per source; returns a callable that waits for them and yields the
+        # list of per-source results in configuration order, or None if nothing changed.
+        # usable is passed on to _fetch_source() and also applies to the data in memory.
+        current = self._loaded_sources.get(kind)
+        if usable is not None and not usable(getattr(self, kind)):
+            current = None
+        futures = [executor.submit(self._fetch_source, url, parse, current == urls, usable) for url in urls]
+
+        def collect():
+            results = [future.result() for future in futures]
+            if current == urls and not any(changed for _, changed in results):
+                return None
+            data = [result for result, _ in results]
+            for i, url in enumerate(urls):
+                if data[i] is None:
+                    # Unchanged but needed again for the new merge: the snapshot is on disk
+                    data[i] = self.source_cache.load(url)
+                    if data[i] is None:
+                        data[i], _ = self._fetch_source(url, parse, False, usable)
+            return data
+        return collect
+
+    @timed("fetch")
+    def fetch(self, m3u_urls, epg_urls, reconcile=False, cancel=None):
+        # Fetches (or revalidates) every playlist and guide concurrently over one pooled session
+        # and builds the merged replacement data without modifying the model, so it can run on a
+        # worker thread while the UI keeps reading the current data. Returns a ModelUpdate, which
+        # is empty (false) if nothing changed. With reconcile=True the new channel table keeps the
+        # row ids of channels that are still there and the update carries the diff.
+        # Network errors propagate as requests exceptions, parse errors as ValueError. Setting the
+        # `cancel` event (a threading.Event) aborts every download at its next chunk with
+        # LoadCancelled.
+        m3u_urls = tuple(split_urls(m3u_urls))
+        epg_urls = tuple(split_urls(epg_urls))
+        current_channels = self.channels
+        current_epg_index = self.epg_index
+        if self.search_index.trigrams is None:
+            self.search_index.build_trigrams() # Finish indexing a cached playlist first
+
+        update = ModelUpdate()
+        keep_from, keep_until = self.epg_window()
+        parse_playlist = functools.partial(_parse_m3u_response, cancel=cancel)
+        parse_guide = functools.partial(_parse_epg_response, keep_from=keep_from, keep_until=keep_until, cancel=cancel,
+                                        pool=self.epg_pool)
+        with ThreadPoolExecutor(max_workers=max(1, len(m3u_urls) + len(epg_urls))) as executor:
+            collect_channels = self._fetch_all(executor, "channels", m3u_urls, parse_playlist)
+            collect_guides = (self._fetch_all(executor, "epg_index", epg_urls, parse_guide, self._guide_covers)
+                              if epg_urls else None)
+
+            tables = collect_channels()
+            if tables is not None:
+                channels = ChannelTable.merge(tables)
+                if reconcile and len(current_channels):
+                    reconciled, diff = current_channels.reconcile(channels)
+                    if reconciled.holes <= MAX_HOLE_RATIO * len(reconciled):
+                        channels = reconciled
+                        update.channel_diff = diff
+                        update.base = current_channels
+                update.channels = channels.build_lookup()
+                update.search_index = ChannelSearchIndex(channels).build_trigrams()
+                update.sources["channels"] = m3u_urls
+
+            if collect_guides is not None:
+                indexes = collect_guides()
+                if indexes is None and update.channels is not None and self.epg_playlist_channels_only:
+                    # Same guide, new playlist: filter the guide again from its full snapshots
+                    indexes = self._load_snapshots(epg_urls)
+                if indexes is not None:
+                    channels = update.channels if update.channels is not None else current_channels
+                    update.epg_index = self._retain(EPGIndex.merge(indexes), channels)
+                    if reconcile:
+                        update.epg_changed = update.epg_index.changed_channels(current_epg_index)
+                    update.sources["epg_index"] = epg_urls
+            elif "epg_index" in self._loaded_sources:
+                update.epg_index = EPGIndex()
+                update.sources["epg_index"] = None
+
+        _check_cancelled(cancel)
+        if update.epg_index is None and not self._programmes_ingested and len(current_epg_index):
+            # e.g. a guide cached before the database existed
+            update.programme_error = self._update_programmes(current_epg_index)
+        else:
+            update.programme_error = self._update_programmes(update.epg_index)
+        return update
+
+    @timed("update_programmes")
+    def _update_programmes(self, epg_index):
+        # Writes a new guide to the programme database (if any) and drops the programmes that
+        # left the retention window. Programme search is an extra; a database problem must not
+        # fail the load, so it is returned as a message for the update to carry.
+        keep_from, _ = self.epg_window()
+        try:
+            if epg_index is not None:
+                self.programme_db.ingest(epg_index)
+                self._programmes_ingested = True
+            if keep_from is not None:
+                self.programme_db.evict(keep_from)
+        except sqlite3.Error as e:
+            METRICS.increment("programme_ingest_errors")
+            return str(e)
+        return None
+
+    def apply(self, update):
+        # Swaps the data of a fetch() result in; meant for the thread that owns the UI. Returns
+        # the channel diff, or None if the channel table was replaced wholesale (or unchanged).
+        diff = None
+        if update.channels is not None:
+            if update.channel_diff is not None and update.base is self.channels:
+                diff = update.channel_diff
+            self.channels = update.channels
+            self.search_index = update.search_index
+        if update.epg_index is not None:
+            self.epg_index = update.epg_index
+        self.programme_error = update.programme_error
+        for kind, urls in update.sources.items():
+            if urls is None:
+                self._loaded_sources.pop(kind, None)
+            else:
+                self._loaded_sources[kind] = urls
+        if METRICS.enabled:
+            METRICS.set_gauge("channels", len(self.channels) - self.channels.holes)
+            METRICS.set_gauge("epg_channels", len(self.epg_index))
+        return diff
+
+    def _iter_playlist(self, url, response_info, cancel=None):
+        # Channel dicts of one playlist as it downloads. If the download fails before the first
+        # channel, the snapshot's channels are yielded instead. Fills response_info with the
+        # response ("raw", "total", "etag", "last_modified"), or sets "cached" on a fallback.
+        # Raises LoadCancelled, closing the download, once cancel is set.
+        import requests
+
+        yielded = False
+        try:
+            with self.session.get(url, timeout=HTTP_TIMEOUT, stream=True) as response:
+                response.raise_for_status()
+                response_info.update(raw=response.raw, total=_content_length(response),
+                                     etag=response.headers.get("ETag"),
+                                     last_modified=response.headers.get("Last-Modified"))
+                for channel in iter_m3u_channels(response.iter_lines(chunk_size=M3U_CHUNK_SIZE)):
+                    _check_cancelled(cancel)
+                    yielded = True
+                    yield channel
+        except requests.exceptions.RequestException:
+            cached = None if yielded else self.source_cache.load(url)
+            if not isinstance(cached, ChannelTable):
+                METRICS.increment("source_requests", result="failed")
+                raise
+            METRICS.increment("source_requests", result="cache_fallback")
+            response_info.clear()
+            response_info["cached"] = True
+            for row in range(len(cached)):
+                _check_cancelled(cancel)
+                yield cached.as_dict(row)
+            return
+        METRICS.increment("source_requests", result="fetched")
+
+    def _stream_playlists(self, m3u_urls, events, cancel=None):
+        # Downloads the playlists concurrently and returns a ModelUpdate with the table of all
+        # channels. Each playlist is parsed into its own table on the executor (and stored as its
+        # snapshot); the LOAD_TABLE table takes their rows in the order they arrive, so a slow
+        # source holds nothing up, and complete rows are announced with LOAD_ROWS as each
+        # source reports them. ChannelTable.merge()'s precedence needs the earlier playlists
+        # first, so rows that arrived ahead of them are only deduplicated first-come; once all
+        # are in, the table is reconciled with the real merge and the update carries the diff
+        # (a single playlist's table is used as it is).
+        tables = [ChannelTable() for _ in m3u_urls]
+        shown = tables[0] if len(tables) == 1 else ChannelTable()
+        events.put((LOAD_TABLE, shown))
+        notices = queue.Queue() # (position, complete rows, finished) from the downloads
+        stop = threading.Event() # Ends the other downloads once one fails or the load is cancelled
+        responses = [{} for _ in m3u_urls]
+        seen_urls = set()
+        tvg_id_sources = {} # {tvg-id: position of the first playlist seen with it}
+        copied = [0] * len(tables) # Rows of each table already offered to `shown`
+        started = time.perf_counter()
+        announced = None
+
+        def download(position, url):
+            table = tables[position]
+            response_info = responses[position]
+            source_started = reported_at = time.perf_counter()
+            try:
+                with METRICS.timer("parse_m3u"): # Download and parse together, as for parse_m3u() in fetch()
+                    for channel in self._iter_playlist(url, response_info, stop):
+                        table.append_channel(channel)
+                        if (len(table) - copied[position] >= LOAD_BATCH_ROWS
+                                or time.perf_counter() - reported_at >= LOAD_BATCH_SECONDS):
+                            reported_at = time.perf_counter()
+                            notices.put((position, len(table), False))
+                if not response_info.get("cached"):
+                    METRICS.observe("fetch_source", time.perf_counter() - source_started)
+                    self.source_cache.store(url, table, response_info.get("etag"), response_info.get("last_modified"))
+            finally:
+                notices.put((position, len(table), True))
+
+        executor = ThreadPoolExecutor(max_workers=max(1, len(m3u_urls)))
+        futures = [executor.submit(download, position, url) for position, url in enumerate(m3u_urls)]
+        try:
+            running = len(futures)
+            while running:
+                try:
+                    position, count, finished = notices.get(timeout=LOAD_BATCH_SECONDS)
+                except queue.Empty:
+                    _check_cancelled(cancel)
+                    continue
+                _check_cancelled(cancel)
+                if finished:
+                    futures[position].result() # Raises the error that ended the download
+                    running -= 1
+                table = tables[position]
+                if shown is not table:
+                    for row in range(copied[position], count):
+                        channel_url = table.urls[row]
+                        tvg_id = table.tvg_ids[row]
+                        if tvg_id is not None and tvg_id_sources.setdefault(tvg_id, position) != position:
+                            continue
+                        if channel_url is not None and channel_url not in seen_urls:
+                            seen_urls.add(channel_url)
+                            shown.append(table.names[row], channel_url, tvg_id, table.category(row),
+                                         table.logos[row], table.extras.get(row))
+                copied[position] = count
+                if announced is None and count:
+                    METRICS.observe("load_first_rows", time.perf_counter() - started)
+                announced = count if shown is table else len(shown)
+                events.put((LOAD_ROWS, announced))
+                raw = responses[position].get("raw")
+                if raw is not None:
+                    events.put((LOAD_PROGRESS, LoadProgress("channels", position + 1, len(m3u_urls), raw.tell(),
+                                                            responses[position].get("total"))))
+        finally:
+            # Downloads still waiting for a response when the load fails end on their own: none is
+            # stored once stop is set
+            stop.set()
+            executor.shutdown(wait=False)
+
+        update = ModelUpdate()
+        update.channels = shown
+        if len(tables) > 1:
+            merged = ChannelTable.merge(tables)
+            reconciled, diff = shown.reconcile(merged)
+            if reconciled.holes > MAX_HOLE_RATIO * len(reconciled):
+                update.channels = merged
+            elif diff.added or diff.removed or diff.changed:
+                update.channels = reconciled
+                update.channel_diff = diff
+                update.base = shown
+        return update
+
+    def _fetch_guides(self, epg_urls, channels, events, cancel=None):
+        # Downloads the guides concurrently for load_progressively(), reporting their combined
+        # progress, and returns a ModelUpdate with the merged guide
+        update = ModelUpdate()
+        if not epg_urls:
+            if "epg_index" in self._loaded_sources:
+                update.epg_index = EPGIndex()
+                update.sources["epg_index"] = None
+            return update
+
+        progress = {} # {response: (received, total)}
+        lock = threading.Lock()
+        last_reported = [0.0, None] # Time and byte count of the last LOAD_PROGRESS
+
+        def report(response, received, total):
+            with lock:
+                progress[response] = (received, total)
+                now = time.perf_counter()
+                received = sum(received for received, _ in progress.values())
+                totals = [total for _, total in progress.values()]
+                combined = sum(totals) if len(totals) == len(epg_urls) and None not in totals else None
+                if received == last_reported[1] or (now - last_reported[0] < LOAD_BATCH_SECONDS and received != combined):
+                    return
+                last_reported[:] = now, received
+                events.put((LOAD_PROGRESS, LoadProgress("guide", len(epg_urls), len(epg_urls), received, combined)))
+
+        keep_from, keep_until = self.epg_window()
+        parse_guide = functools.partial(_parse_epg_response, keep_from=keep_from, keep_until=keep_until,
+                                        on_progress=report, cancel=cancel, pool=self.epg_pool)
+        with ThreadPoolExecutor(max_workers=len(epg_urls)) as executor:
+            indexes = self._fetch_all(executor, "epg_index", epg_urls, parse_guide, self._guide_covers)()
+        if indexes is None and self.epg_playlist_channels_only:
+            indexes = self._load_snapshots(epg_urls) # Same guide, new playlist: filter it again
+        if indexes is not None:
+            update.epg_index = self._retain(EPGIndex.merge(indexes), channels)
+            update.sources["epg_index"] = epg_urls
+        return update
+
+    def load_progressively(self, m3u_urls, epg_urls, events, cancel=None):
+        # A first load that lets the UI show channels while the playlists are still downloading.
+        # Runs on a worker thread and, like fetch(), never modifies the model: it puts
+        # LOAD_* events on the `events` queue instead. Rows of the LOAD_TABLE table are handed
+        # over in batches as they are parsed; the guides are only downloaded once the channel
+        # list is complete, so they never hold it up. Playlists are always downloaded in full
+        # (no revalidation), since nothing of them is shown yet. Once the `cancel` event is set
+        # the load stops at the next chunk it reads and its downloads are closed; the queue
+        # then gets LOAD_ERROR with LoadCancelled.
+        m3u_urls = tuple(split_urls(m3u_urls))
+        epg_urls = tuple(split_urls(epg_urls))
+        try:
+            with METRICS.timer("load_data"):
+                update = self._stream_playlists(m3u_urls, events, cancel)
+                _check_cancelled(cancel)
+                channels = update.channels.build_lookup()
+                update.search_index = ChannelSearchIndex(channels).build_trigrams()
+                update.sources["channels"] = m3u_urls
+                _check_cancelled(cancel)
+                events.put((LOAD_CHANNELS, update))
+
+                update = self._fetch_guides(epg_urls, channels, events, cancel)
+                _check_cancelled(cancel)
+                update.programme_error = self._update_programmes(update.epg_index)
+                events.put((LOAD_GUIDE, update))
+        except LoadCancelled as e:
+            METRICS.increment("loads_cancelled")
+            events.put((LOAD_ERROR, e))
+        except Exception as e:
+            events.put((LOAD_ERROR, e))
+        events.put((LOAD_DONE, None))
+
+    def load(self, m3u_urls, epg_urls):
+        # fetch() and apply() in one go. Returns True if anything changed.
+        update = self.fetch(m3u_urls, epg_urls)
+        if not update:
+            return False
+        self.apply(update)
+        return True
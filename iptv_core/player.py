@@ -0,0 +1,333 @@
+import sys
+import threading
+import time
+from collections import deque, namedtuple
+
+from .metrics import METRICS
+
+EVENT_PLAYING = "playing"
+EVENT_ERROR = "error"
+EVENT_BUFFERING = "buffering" # value: fill level of the input buffer in percent
+EVENT_STALL = "stall" # Reported by ChannelZapper when a playing stream starts rebuffering
+EVENT_STALL_END = "stall_end" # value: seconds the stall lasted
+EVENT_STARTING = "starting" # Reported by ChannelZapper on play(); value: True if the standby was swapped in
+EVENT_STOPPED = "stopped" # Reported by ChannelZapper when the active player leaves a url
+
+SWITCH_HISTORY = 50 # Channel switches kept for latency statistics
+RECENT_CHANNELS = 8 # Recently watched channels remembered as standby candidates
+
+SwitchTiming = namedtuple("SwitchTiming", ["url", "warm", "seconds"])
+
+# A player backend creates players; a player plays one url at a time and reports EVENT_PLAYING,
+# EVENT_BUFFERING and EVENT_ERROR to its `listener(player, event, value)`, possibly from a
+# backend thread. `options` are libvlc media options such as ":network-caching=1000":
+#
+#   player.start(url, options=())  player.stop()  player.is_playing()  player.set_muted(muted)
+#   player.set_output(window_id)  player.release()
+
+class VLCPlayer:
+    def __init__(self, backend):
+        self._vlc = backend.vlc
+        self._instance = backend.instance
+        self._player = backend.instance.media_player_new()
+        self.listener = None
+        events = self._player.event_manager()
+        events.event_attach(self._vlc.EventType.MediaPlayerPlaying, self._emit, EVENT_PLAYING)
+        events.event_attach(self._vlc.EventType.MediaPlayerEncounteredError, self._emit, EVENT_ERROR)
+        events.event_attach(self._vlc.EventType.MediaPlayerBuffering, self._emit_buffering)
+
+    def _emit(self, event, kind):
+        if self.listener is not None:
+            self.listener(self, kind, None)
+
+    def _emit_buffering(self, event):
+        if self.listener is not None:
+            self.listener(self, EVENT_BUFFERING, event.u.new_cache)
+
+    def start(self, url, options=()):
+        if self._player.is_playing():
+            self._player.stop()
+        self._player.set_media(self._instance.media_new(url, *options))
+        self._player.play()
+
+    def stop(self):
+        self._player.stop()
+
+    def is_playing(self):
+        return bool(self._player.is_playing())
+
+    def set_muted(self, muted):
+        self._player.audio_set_mute(muted)
+
+    def set_output(self, window_id):
+        if sys.platform.startswith("win"):
+            self._player.set_hwnd(window_id)
+        elif sys.platform == "darwin":
+            self._player.set_nsobject(window_id)
+        else:
+            self._player.set_xwindow(window_id)
+
+    def release(self):
+        self._player.stop()
+        self._player.release()
+
+class VLCBackend:
+    # libvlc is imported here rather than at module level, so the rest of the core stays
+    # importable without it. Pass e.g. "--vout=dummy", "--aout=dummy" to play without output.
+    def __init__(self, *instance_args):
+        import vlc
+        self.vlc = vlc
+        self.instance = vlc.Instance(*instance_args)
+        if self.instance is None:
+            raise RuntimeError("libvlc could not be initialised")
+
+    def new_player(self):
+        return VLCPlayer(self)
+
+class FakePlayer:
+    def __init__(self, backend):
+        self.backend = backend
+        self.listener = None
+        self.url = None
+        self.options = ()
+        self.muted = False
+        self.output = None
+        self.playing = False
+        self._timer = None
+
+    def start(self, url, options=()):
+        self.stop()
+        self.url = url
+        self.options = tuple(options)
+        self._timer = threading.Timer(self.backend.delay_for(url), self._connected, (url,))
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _connected(self, url):
+        if url != self.url:
+            return
+        if url in self.backend.failing:
+            event = EVENT_ERROR
+        else:
+            self.playing = True
+            event = EVENT_PLAYING
+        if self.listener is not None:
+            self.listener(self, event, None)
+
+    def simulate_buffering(self, percent):
+        # Reports a buffer fill level as libvlc would, e.g. 40 then 100 for a short stall
+        if self.url is not None and self.listener is not None:
+            self.listener(self, EVENT_BUFFERING, percent)
+
+    def stop(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self.url = None
+        self.playing = False
+
+    def is_playing(self):
+        return self.playing
+
+    def set_muted(self, muted):
+        self.muted = muted
+
+    def set_output(self, window_id):
+        self.output = window_id
+
+    def release(self):
+        self.stop()
+
+class FakeBackend:
+    # Stand-in for libvlc: a started player reports EVENT_PLAYING after `startup_delay` seconds
+    # (or delays[url]) on a timer thread, or EVENT_ERROR for urls in `failing`.
+    def __init__(self, startup_delay=0.0, delays=None, failing=()):
+        self.startup_delay = startup_delay
+        self.delays = delays or {}
+        self.failing = set(failing)
+
+    def delay_for(self, url):
+        return self.delays.get(url, self.startup_delay)
+
+    def new_player(self):
+        return FakePlayer(self)
+
+class ChannelZapper:
+    # Plays channels on an active player while a second, muted player warms up the channel that
+    # is most likely to be picked next. play() swaps the standby in when it already holds the
+    # requested url, so the switch skips connecting, fetching the manifest and buffering.
+    # Besides the active player's events, on_event gets EVENT_STARTING and EVENT_STOPPED around
+    # each play, which is what a BufferingPolicy needs; its media_options fits `options_for`.
+    # play(), prewarm() and close() belong to one thread; player events may arrive on others.
+    def __init__(self, backend, standby=True, on_event=None, options_for=None, clock=time.perf_counter):
+        self.backend = backend
+        self.clock = clock
+        self.on_event = on_event # on_event(event, url, value) for events of the active player
+        self.options_for = options_for # options_for(url): media options to start url with
+        self.active = self._new_player()
+        self.standby = self._new_player() if standby else None
+        self.urls = {self.active: None} # {player: url it was started with}
+        self.ready = set() # Players that reached EVENT_PLAYING for their current url
+        self.switches = deque(maxlen=SWITCH_HISTORY)
+        self.recent = deque(maxlen=RECENT_CHANNELS) # Most recently played urls, newest last
+        self._switch = None # (url, started, warm) of the switch waiting for EVENT_PLAYING
+        self._stalled_since = None # When the active player started rebuffering after it was playing
+        self._lock = threading.Lock()
+        if self.standby is not None:
+            self.urls[self.standby] = None
+            self.standby.set_muted(True)
+
+    def _new_player(self):
+        player = self.backend.new_player()
+        player.listener = self._on_player_event
+        return player
+
+    @property
+    def current_url(self):
+        return self.urls[self.active]
+
+    @property
+    def standby_url(self):
+        return self.urls.get(self.standby)
+
+    def set_outputs(self, active_window, standby_window=None):
+        # Each player keeps its window; the caller shows the window of `active` after a switch
+        self.active.set_output(active_window)
+        if self.standby is not None and standby_window is not None:
+            self.standby.set_output(standby_window)
+
+    def play(self, url):
+        # Switches to url and returns True if a warm standby was swapped in
+        started = self.clock()
+        previous = self.current_url
+        if previous is not None and self.on_event is not None:
+            self.on_event(EVENT_STOPPED, previous, None)
+        with self._lock:
+            warm = self.standby is not None and self.urls[self.standby] == url
+            if warm:
+                self.active, self.standby = self.standby, self.active
+                self.active.set_muted(False)
+                ready = self.active in self.ready
+            else:
+                ready = False
+            self._switch = (url, started, warm)
+            self._stalled_since = None
+            if ready:
+                self._finish_switch()
+
+        if self.on_event is not None:
+            # Reported before the player starts, so it precedes any event of the new url
+            self.on_event(EVENT_STARTING, url, warm)
+        if warm:
+            self._stop(self.standby)
+            self.standby.set_muted(True)
+        else:
+            self._start(self.active, url)
+        if not self.recent or self.recent[-1] != url:
+            self.recent.append(url)
+        if ready and self.on_event is not None:
+            # The standby reached EVENT_PLAYING before it became active; report it now
+            self.on_event(EVENT_PLAYING, url, None)
+        return warm
+
+    def prewarm(self, url):
+        # Starts url muted on the standby player, replacing whatever it was warming
+        if self.standby is None or not url or url in (self.current_url, self.standby_url):
+            return False
+        self._start(self.standby, url)
+        return True
+
+    def cancel_prewarm(self):
+        if self.standby is not None and self.standby_url is not None:
+            self._stop(self.standby)
+
+    def stop(self):
+        with self._lock:
+            self._switch = None
+        previous = self.current_url
+        self._stop(self.active)
+        if previous is not None and self.on_event is not None:
+            self.on_event(EVENT_STOPPED, previous, None)
+        if self.standby is not None:
+            self._stop(self.standby)
+
+    def close(self):
+        self.stop()
+        self.active.release()
+        if self.standby is not None:
+            self.standby.release()
+
+    def _start(self, player, url):
+        with self._lock:
+            self.urls[player] = url
+            self.ready.discard(player)
+        player.start(url, self.options_for(url) if self.options_for is not None else ())
+
+    def _stop(self, player):
+        with self._lock:
+            self.urls[player] = None
+            self.ready.discard(player)
+        player.stop()
+
+    def _finish_switch(self):
+        # Called with the lock held once the active player plays the url of the pending switch
+        url, started, warm = self._switch
+        self._switch = None
+        switch = SwitchTiming(url, warm, self.clock() - started)
+        self.switches.append(switch)
+        METRICS.observe("stream_start", switch.seconds, kind="warm" if warm else "cold")
+
+    def _on_player_event(self, player, event, value=None):
+        with self._lock:
+            url = self.urls.get(player)
+            if url is None:
+                return
+            if event == EVENT_PLAYING:
+                self.ready.add(player)
+            if player is not self.active:
+                return
+            if event == EVENT_PLAYING and self._switch is not None and self._switch[0] == url:
+                self._finish_switch()
+            elif event == EVENT_BUFFERING:
+                # Buffering before the first EVENT_PLAYING is start-up; after it, it is a stall
+                if player not in self.ready:
+                    return
+                if value < 100 and self._stalled_since is None:
+                    self._stalled_since = self.clock()
+                    event = EVENT_STALL
+                    METRICS.increment("playback_stalls")
+                elif value >= 100 and self._stalled_since is not None:
+                    value = self.clock() - self._stalled_since
+                    self._stalled_since = None
+                    event = EVENT_STALL_END
+                    METRICS.observe("playback_stall", value)
+                else:
+                    return
+            elif event == EVENT_ERROR:
+                METRICS.increment("playback_errors")
+        if self.on_event is not None:
+            self.on_event(event, url, value)
+
+    def latency_stats(self):
+        # {"warm"/"cold": (switches, mean seconds, worst seconds)} over the recent switches
+        stats = {}
+        for warm, label in ((True, "warm"), (False, "cold")):
+            seconds = [switch.seconds for switch in self.switches if switch.warm == warm]
+            if seconds:
+                stats[label] = (len(seconds), sum(seconds) / len(seconds), max(seconds))
+        return stats
+
+def standby_candidate(current, neighbours=(), recent=(), favourites=()):
+    # The url most worth warming up next: the channel after the current one in the list, then
+    # the previously watched channel, then the first favourite that is not playing.
+    # `neighbours` are urls in list order around (and excluding) the current channel.
+    for url in neighbours:
+        if url and url != current:
+            return url
+    for url in reversed(recent):
+        if url and url != current:
+            return url
+    for url in favourites:
+        if url and url != current:
+            return url
+    return None
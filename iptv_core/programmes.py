@@ -0,0 +1,206 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+from collections import namedtuple
+
+SEARCH_LIMIT = 200 # Default number of programmes returned by a search
+MAX_PROGRAMME_SECONDS = 24 * 3600 # Longest programme assumed by window queries, bounding the start index scan
+BULK_INGEST_PROGRAMMES = 50000 # From this many new programmes on, the time indexes are rebuilt rather than updated
+SCHEMA_VERSION = 1
+
+ProgrammeMatch = namedtuple("ProgrammeMatch", ["channel_id", "display_name", "start", "stop", "title", "description"])
+IngestStats = namedtuple("IngestStats", ["channels", "changed", "removed", "programmes"])
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS channels (
+    id INTEGER PRIMARY KEY,
+    channel_id TEXT NOT NULL UNIQUE,
+    display_name TEXT,
+    digest BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS programmes (
+    id INTEGER PRIMARY KEY,
+    channel INTEGER NOT NULL REFERENCES channels(id) ON DELETE CASCADE,
+    start INTEGER NOT NULL,
+    stop INTEGER NOT NULL,
+    title TEXT NOT NULL,
+    description TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS programmes_channel_start ON programmes(channel, start);
+CREATE VIRTUAL TABLE IF NOT EXISTS programme_text USING fts5(
+    title, description, content='programmes', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+);
+"""
+# Kept apart so a bulk ingest can drop them and build them once at the end, which is several
+# times faster than updating them row by row
+_TIME_INDEXES = """
+CREATE INDEX IF NOT EXISTS programmes_start ON programmes(start);
+CREATE INDEX IF NOT EXISTS programmes_stop ON programmes(stop);
+"""
+
+_TERM_RE = re.compile(r"\w+", re.UNICODE)
+
+def guide_digest(guide):
+    # Fingerprint of one channel's programmes; equal digests mean nothing to re-ingest
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(guide.starts.tobytes())
+    digest.update(guide.stops.tobytes())
+    digest.update("\0".join(guide.titles).encode("utf-8", "surrogatepass"))
+    digest.update("\0".join(guide.descriptions).encode("utf-8", "surrogatepass"))
+    digest.update((guide.display_name or "").encode("utf-8", "surrogatepass"))
+    return digest.digest()
+
+def fts_query(text):
+    # Turns free text into an FTS5 query matching every word as a prefix ("match tonigh" finds
+    # "Match Tonight"); returns None if text has no words. FTS operators are never interpreted.
+    terms = _TERM_RE.findall(text)
+    if not terms:
+        return None
+    return " ".join(f'"{term}"*' for term in terms)
+
+class ProgrammeDatabase:
+    # The whole guide in a local SQLite database: programmes with indexes on channel/start,
+    # start and stop, plus an FTS5 index over titles and descriptions for searching every
+    # channel at once. ingest() only rewrites channels whose programmes changed. Each thread
+    # gets its own connection; WAL mode lets the UI query while a worker thread ingests.
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._schema_lock = threading.Lock()
+        self._schema_ready = False
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute("PRAGMA foreign_keys=ON")
+            connection.execute("PRAGMA cache_size=-32768") # 32 MiB
+            with self._schema_lock:
+                if not self._schema_ready:
+                    if connection.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+                        connection.executescript("DROP TABLE IF EXISTS programme_text; DROP TABLE IF EXISTS programmes;"
+                                                 "DROP TABLE IF EXISTS channels;")
+                    connection.executescript(_SCHEMA + _TIME_INDEXES)
+                    connection.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+                    self._schema_ready = True
+            self._local.connection = connection
+        return connection
+
+    def close(self):
+        # Closes the calling thread's connection
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+    def ingest(self, epg_index, channel_ids=None):
+        # Brings the database in line with epg_index in one transaction. Channels whose
+        # programmes are unchanged (same digest) are skipped; channels missing from the guide are
+        # dropped. With channel_ids, only those channels are considered present.
+        connection = self._connection()
+        stored = {channel_id: (key, digest) for key, channel_id, digest in
+                  connection.execute("SELECT id, channel_id, digest FROM channels")}
+        changed = []
+        for channel_id, guide in epg_index.channels.items():
+            if channel_ids is not None and channel_id not in channel_ids:
+                continue
+            digest = guide_digest(guide)
+            key, old_digest = stored.pop(channel_id, (None, None))
+            if old_digest != digest:
+                changed.append((channel_id, guide, digest, key))
+        programmes = sum(len(guide) for _, guide, _, _ in changed)
+        if not changed and not stored:
+            return IngestStats(len(epg_index.channels), 0, 0, 0)
+
+        bulk = programmes >= BULK_INGEST_PROGRAMMES
+        with connection:
+            # sqlite3 only opens its implicit transaction for DML, so the index drops would
+            # commit at once; a failing ingest must roll them back with everything else
+            connection.execute("BEGIN")
+            if bulk:
+                connection.execute("DROP INDEX IF EXISTS programmes_start")
+                connection.execute("DROP INDEX IF EXISTS programmes_stop")
+            for key, _ in stored.values():
+                self._delete_programmes(connection, key)
+                connection.execute("DELETE FROM channels WHERE id = ?", (key,))
+
+            # New rows get ids above the current maximum; their text is indexed in one statement
+            last_id = connection.execute("SELECT COALESCE(MAX(id), 0) FROM programmes").fetchone()[0]
+            for channel_id, guide, digest, key in changed:
+                if key is None:
+                    key = connection.execute("INSERT INTO channels(channel_id, display_name, digest) VALUES (?, ?, ?)",
+                                             (channel_id, guide.display_name, digest)).lastrowid
+                else:
+                    self._delete_programmes(connection, key)
+                    connection.execute("UPDATE channels SET display_name = ?, digest = ? WHERE id = ?",
+                                       (guide.display_name, digest, key))
+                connection.executemany(
+                    "INSERT INTO programmes(channel, start, stop, title, description) VALUES (?, ?, ?, ?, ?)",
+                    zip([key] * len(guide), guide.starts, guide.stops, guide.titles, guide.descriptions))
+            connection.execute("INSERT INTO programme_text(rowid, title, description) "
+                               "SELECT id, title, description FROM programmes WHERE id > ?", (last_id,))
+            if bulk:
+                for statement in _TIME_INDEXES.strip().splitlines():
+                    connection.execute(statement)
+        return IngestStats(len(epg_index.channels), len(changed), len(stored), programmes)
+
+    def _delete_programmes(self, connection, key):
+        # The FTS table holds no copy of the text, so its entries are removed with the old values
+        connection.execute("INSERT INTO programme_text(programme_text, rowid, title, description) "
+                           "SELECT 'delete', id, title, description FROM programmes WHERE channel = ?", (key,))
+        connection.execute("DELETE FROM programmes WHERE channel = ?", (key,))
+
+    def evict(self, before):
+        # Drops the programmes that ended by `before`; returns how many
+        connection = self._connection()
+        with connection:
+            connection.execute("INSERT INTO programme_text(programme_text, rowid, title, description) "
+                               "SELECT 'delete', id, title, description FROM programmes WHERE stop <= ?", (before,))
+            return connection.execute("DELETE FROM programmes WHERE stop <= ?", (before,)).rowcount
+
+    def search(self, text, start=None, stop=None, limit=SEARCH_LIMIT):
+        # Programmes whose title or description contains every word of text (as word prefixes),
+        # optionally only those overlapping [start, stop), ordered by start time
+        query = fts_query(text)
+        if query is None:
+            return []
+        sql = ("SELECT c.channel_id, c.display_name, p.start, p.stop, p.title, p.description "
+               "FROM programme_text JOIN programmes p ON p.id = programme_text.rowid "
+               "JOIN channels c ON c.id = p.channel WHERE programme_text MATCH ?")
+        parameters = [query]
+        if start is not None:
+            sql += " AND p.stop > ?"
+            parameters.append(start)
+        if stop is not None:
+            sql += " AND p.start < ?"
+            parameters.append(stop)
+        sql += " ORDER BY p.start LIMIT ?"
+        parameters.append(limit)
+        # fts_query() quotes every term, so the query itself cannot fail; errors are the database's
+        return [ProgrammeMatch(*row) for row in self._connection().execute(sql, parameters)]
+
+    def window(self, start, stop, channel_ids=None):
+        # {channel_id: [ProgrammeMatch, ...]} of the programmes overlapping [start, stop)
+        sql = ("SELECT c.channel_id, c.display_name, p.start, p.stop, p.title, p.description "
+               "FROM programmes p JOIN channels c ON c.id = p.channel "
+               "WHERE p.start < ? AND p.start > ? AND p.stop > ?")
+        parameters = [stop, start - MAX_PROGRAMME_SECONDS, start]
+        if channel_ids is not None:
+            channel_ids = list(channel_ids)
+            sql += f" AND c.channel_id IN ({','.join('?' * len(channel_ids))})"
+            parameters += channel_ids
+        sql += " ORDER BY p.channel, p.start"
+        result = {}
+        for row in self._connection().execute(sql, parameters):
+            result.setdefault(row[0], []).append(ProgrammeMatch(*row))
+        return result
+
+    def __len__(self):
+        return self._connection().execute("SELECT COUNT(*) FROM programmes").fetchone()[0]
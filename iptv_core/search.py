@@ -0,0 +1,57 @@
+import unicodedata
+from array import array
+
+def normalize_search_text(text):
+    # Case-folds and strips accents so "Télé" and "TELE" compare equal
+    decomposed = unicodedata.normalize("NFKD", text.casefold())
+    if decomposed.isascii():
+        return decomposed
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+class ChannelSearchIndex:
+    # Substring search over channel names, built once per playlist load. Names are normalized
+    # up front and every trigram maps to the ids of the names containing it, so a query only
+    # verifies the channels sharing its rarest trigram. A query that extends the previous one
+    # narrows the previous result instead of starting over.
+    def __init__(self, table):
+        self.table = table # The ChannelTable being searched; ids below are its row ids
+        self.names = [normalize_search_text(name) for name in table.names] # Normalized name of each row
+        self.trigrams = None # Filled by build_trigrams(); until then queries scan every name
+        self._last_query = None
+        self._last_matches = None
+
+    def build_trigrams(self):
+        # The slowest part of building the index, meant to run off the Tk thread
+        trigrams = {}
+        for row, name in enumerate(self.names):
+            for trigram in {name[i:i + 3] for i in range(len(name) - 2)}:
+                postings = trigrams.get(trigram)
+                if postings is None:
+                    postings = trigrams[trigram] = array("I")
+                postings.append(row)
+        self.trigrams = trigrams
+        return self
+
+    def search(self, text):
+        # Returns the ascending row ids of the matching channels, or None when text matches everything
+        query = normalize_search_text(text.strip())
+        if not query:
+            self._last_query = self._last_matches = None
+            return None
+
+        if self._last_query is not None and self._last_query in query:
+            candidates = self._last_matches
+        elif len(query) >= 3 and self.trigrams is not None:
+            postings = [self.trigrams.get(query[i:i + 3], ()) for i in range(len(query) - 2)]
+            candidates = min(postings, key=len)
+        else:
+            candidates = range(len(self.names))
+
+        names = self.names
+        matches = [row for row in candidates if query in names[row]]
+        self._last_query = query
+        self._last_matches = matches
+        return matches
+
+    def group_by_category(self, matches):
+        return self.table.group_rows(matches)
@@ -0,0 +1,51 @@
+import io
+import gzip
+import lzma
+
+XMLTV_CHUNK_SIZE = 256 * 1024 # Read-ahead buffer used while streaming an XMLTV guide
+
+GZIP_MAGIC = b"\x1f\x8b"
+XZ_MAGIC = b"\xfd7zXZ\x00"
+
+def open_decompressed_stream(fileobj):
+    # Wraps a binary stream so that .xml.gz and .xml.xz guides are decompressed on the fly.
+    # The format is sniffed from the first bytes rather than the URL, since servers often
+    # serve compressed guides under plain names (or plain XML under .gz after Content-Encoding).
+    stream = fileobj if hasattr(fileobj, "peek") else io.BufferedReader(fileobj, XMLTV_CHUNK_SIZE)
+    magic = stream.peek(len(XZ_MAGIC))[:len(XZ_MAGIC)]
+    if magic.startswith(GZIP_MAGIC):
+        return gzip.GzipFile(fileobj=stream, mode="rb")
+    if magic.startswith(XZ_MAGIC):
+        return lzma.LZMAFile(stream, mode="rb")
+    return stream
+
+def _element_text(elem, tag):
+    child = elem.find(tag)
+    return child.text if child is not None and child.text else None
+
+def iter_xmltv(stream):
+    # Yields ("channel", (channel_id, [display names])) and ("programme", {...}) records
+    # from an XMLTV stream. Each top-level element is cleared from the tree as soon as it has
+    # been converted, so memory stays flat no matter how large the guide is.
+    import xml.etree.ElementTree as ET # Deferred so importing iptv_core stays cheap
+
+    context = ET.iterparse(stream, events=("start", "end"))
+    _, root = next(context)
+    for event, elem in context:
+        if event != "end":
+            continue
+        if elem.tag == "programme":
+            yield "programme", {
+                "channel": elem.get("channel"),
+                "title": _element_text(elem, "title") or "N/A",
+                "description": _element_text(elem, "desc") or "No description",
+                "start": elem.get("start"),
+                "stop": elem.get("stop"),
+            }
+            root.clear()
+        elif elem.tag == "channel":
+            channel_id = elem.get("id")
+            if channel_id:
+                display_names = [name.text.strip() for name in elem.findall("display-name") if name.text]
+                yield "channel", (channel_id, display_names)
+            root.clear()
@@ -0,0 +1,79 @@
+from iptv_core.buffering import (CACHING_DEFAULT_MS, CACHING_MAX_MS, CACHING_MIN_MS, CALM_SECONDS, BufferingPolicy,
+                                 StreamStats)
+from iptv_core.player import EVENT_ERROR, EVENT_PLAYING, EVENT_STALL, EVENT_STALL_END, EVENT_STARTING, EVENT_STOPPED
+
+URL = "http://provider.example/live/1.m3u8"
+
+def play(policy, url, now, startup=3.0, watched=0.0, stalls=()):
+    # Replays one play of url starting at `now`: slow start-up, then stalls of the given
+    # lengths and `watched` seconds of playback after the last one. Returns the end time.
+    policy.observe(EVENT_STARTING, url, False, now=now)
+    now += startup
+    policy.observe(EVENT_PLAYING, url, now=now)
+    for seconds in stalls:
+        now += 10
+        policy.observe(EVENT_STALL, url, now=now)
+        now += seconds
+        policy.observe(EVENT_STALL_END, url, now=now)
+    now += watched
+    policy.observe(EVENT_STOPPED, url, now=now)
+    return now
+
+def test_unknown_channel_gets_default():
+    policy = BufferingPolicy()
+    assert policy.caching_ms(URL) == CACHING_DEFAULT_MS
+    assert policy.media_options(URL) == (f":network-caching={CACHING_DEFAULT_MS}", f":live-caching={CACHING_DEFAULT_MS}")
+
+def test_stall_raises_caching():
+    policy = BufferingPolicy()
+    play(policy, URL, 0.0, stalls=[2.0])
+    raised = policy.caching_ms(URL)
+    assert raised >= CACHING_DEFAULT_MS + 2000 # At least enough to have ridden the stall out
+    play(policy, URL, 100.0, stalls=[2.0])
+    assert raised < policy.caching_ms(URL) <= CACHING_MAX_MS
+    assert policy.dirty
+
+def test_stable_playback_decays_caching():
+    policy = BufferingPolicy()
+    end = play(policy, URL, 0.0, stalls=[2.0])
+    raised = policy.caching_ms(URL)
+    play(policy, URL, end, watched=CALM_SECONDS * 2)
+    lowered = policy.caching_ms(URL)
+    assert lowered < raised
+    play(policy, URL, end + 1000, watched=CALM_SECONDS * 200)
+    assert policy.caching_ms(URL) == CACHING_MIN_MS
+
+def test_short_calm_changes_nothing():
+    policy = BufferingPolicy()
+    play(policy, URL, 0.0, stalls=[1.0])
+    raised = policy.caching_ms(URL)
+    play(policy, URL, 100.0, watched=CALM_SECONDS / 2)
+    assert policy.caching_ms(URL) == raised
+
+def test_error_while_playing_counts_as_stall():
+    policy = BufferingPolicy()
+    policy.observe(EVENT_STARTING, URL, False, now=0.0)
+    policy.observe(EVENT_PLAYING, URL, now=3.0)
+    policy.observe(EVENT_ERROR, URL, now=30.0)
+    assert policy.caching_ms(URL) > CACHING_DEFAULT_MS
+
+def test_new_channel_inherits_host_caching():
+    policy = BufferingPolicy()
+    play(policy, URL, 0.0, stalls=[3.0])
+    sibling = "http://provider.example/live/2.m3u8"
+    assert policy.caching_ms(sibling) == policy.caching_ms(URL)
+    assert policy.caching_ms("http://other.example/live/1.m3u8") == CACHING_DEFAULT_MS
+
+def test_events_of_other_urls_are_ignored():
+    policy = BufferingPolicy()
+    policy.observe(EVENT_STARTING, URL, False, now=0.0)
+    policy.observe(EVENT_STALL_END, "http://provider.example/live/2.m3u8", 5.0, now=1.0)
+    assert not policy.hosts and not policy.channels
+
+def test_round_trip_through_json():
+    policy = BufferingPolicy()
+    play(policy, URL, 0.0, stalls=[2.0])
+    restored = BufferingPolicy.from_json(policy.to_json())
+    assert restored.caching_ms(URL) == policy.caching_ms(URL)
+    assert isinstance(restored.hosts["provider.example"], StreamStats)
+    assert BufferingPolicy.from_json("not json").caching_ms(URL) == CACHING_DEFAULT_MS
@@ -0,0 +1,36 @@
+import os
+import threading
+
+from iptv_core.cache import SourceCache, atomic_write
+
+def test_atomic_write_replaces_file(tmp_path):
+    path = tmp_path / "config.ini"
+    atomic_write(str(path), b"old")
+    atomic_write(str(path), b"new")
+    assert path.read_bytes() == b"new"
+    assert os.listdir(tmp_path) == ["config.ini"]
+
+def test_concurrent_writers_never_tear(tmp_path):
+    path = str(tmp_path / "snapshot.pickle")
+    payloads = [bytes([i]) * 200000 for i in range(8)]
+    def write(data):
+        for _ in range(10):
+            atomic_write(path, data)
+    threads = [threading.Thread(target=write, args=(data,)) for data in payloads]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    with open(path, "rb") as f:
+        assert f.read() in payloads
+    assert os.listdir(tmp_path) == ["snapshot.pickle"]
+
+def test_source_cache_round_trip(tmp_path):
+    cache = SourceCache(str(tmp_path))
+    url = "http://example.com/list.m3u"
+    assert cache.load(url) is None and cache.conditional_headers(url) == {}
+    cache.store(url, {"channels": [1, 2]}, etag='"abc"', last_modified="Mon, 01 Jan 2024 00:00:00 GMT")
+    assert cache.load(url) == {"channels": [1, 2]}
+    assert cache.conditional_headers(url) == {"If-None-Match": '"abc"',
+                                              "If-Modified-Since": "Mon, 01 Jan 2024 00:00:00 GMT"}
+    assert cache.load("http://example.com/other.m3u") is None
@@ -0,0 +1,76 @@
+import pickle
+
+from iptv_core.channels import ChannelDiff, ChannelTable
+
+def table_of(*entries):
+    # ChannelTable of (name, url, tvg-id, category) entries
+    table = ChannelTable()
+    for name, url, tvg_id, category in entries:
+        table.append(name, url, tvg_id, category)
+    return table
+
+def live_rows(table):
+    return [(table.names[row], table.urls[row]) for row in range(len(table)) if not table.is_hole(row)]
+
+def test_categories_are_interned_and_rows_grouped():
+    table = ChannelTable.from_channels([
+        {"name": "One", "url": "http://s/1", "tvg_id": "one", "category": "News", "tvg_logo": "http://l/1.png"},
+        {"name": "Two", "url": "http://s/2", "category": "Sport", "catchup": "shift"},
+        {"name": "Three", "url": "http://s/3", "tvg_id": "", "category": "News"},
+    ])
+    assert table.categories == ["News", "Sport"]
+    assert list(table.category_ids) == [0, 1, 0]
+    assert {category: list(rows) for category, rows in table.by_category().items()} == {"News": [0, 2], "Sport": [1]}
+    assert table.tvg_ids == ["one", None, None]
+    assert table.channel(0) == (0, "One", "http://s/1", "one", "News", "http://l/1.png")
+    assert table.as_dict(1) == {"name": "Two", "url": "http://s/2", "tvg_id": None, "category": "Sport",
+                                "catchup": "shift"}
+    assert table.group_rows([2, 1, 0]) == {"News": [2, 0], "Sport": [1]}
+
+def test_lookups():
+    table = table_of(("One", "http://s/1", "one", "News"), ("One HD", "http://s/1hd", "one", "News"),
+                     ("One", "http://s/1b", None, "News"), ("Two", "http://s/2", "two", "Sport"))
+    assert table.rows_for_tvg_id("one") == [0, 1]
+    assert table.rows_for_tvg_id("two") == (3,)
+    assert table.rows_for_tvg_id("three") == ()
+    assert table.row_for_name("One", "News") == 0 # First of a duplicated name
+    assert table.row_for_name("One", "Sport") is None
+    # Appending invalidates the lookups
+    table.append("Three", "http://s/3", "two", "Sport")
+    assert table.rows_for_tvg_id("two") == [3, 4]
+
+def test_snapshots_leave_the_lookups_out():
+    table = table_of(("One", "http://s/1", "one", "News")).build_lookup()
+    copy = pickle.loads(pickle.dumps(table))
+    assert copy._tvg_rows is None and copy.rows_for_tvg_id("one") == (0,)
+
+def test_merge_precedence():
+    first = table_of(("One", "http://s/1", "one", "News"), ("One SD", "http://s/1sd", "one", "News"))
+    second = table_of(("One again", "http://s/1", None, "News"), ("One backup", "http://s/1b", "one", "News"),
+                      ("Two", "http://s/2", "two", "Sport"), ("Two HD", "http://s/2hd", "two", "Sport"))
+    merged = ChannelTable.merge([first, second])
+    # Same URL or a tvg-id an earlier playlist had: dropped; variants inside one playlist: kept
+    assert live_rows(merged) == [("One", "http://s/1"), ("One SD", "http://s/1sd"), ("Two", "http://s/2"),
+                                 ("Two HD", "http://s/2hd")]
+    assert ChannelTable.merge([first]) is first
+
+def test_reconcile_keeps_row_ids():
+    old = table_of(("One", "http://s/1", "one", "News"), ("Two", "http://s/2", "two", "Sport"),
+                   ("Three", "http://s/3", "three", "Sport"))
+    fresh = table_of(("Three", "http://s/3", "three", "Sport"), ("Four", "http://s/4", "four", "Kids"),
+                     ("One (renamed)", "http://s/1", "one", "News"))
+    table, diff = old.reconcile(fresh)
+    assert diff == ChannelDiff(added=[3], removed=[1], changed=[0])
+    assert table.urls == ["http://s/1", None, "http://s/3", "http://s/4"]
+    assert table.names[0] == "One (renamed)" and table.is_hole(1) and table.holes == 1
+    # Categories list the rows in the fresh playlist's order
+    assert {category: list(rows) for category, rows in table.by_category().items()} == {
+        "News": [0], "Sport": [2], "Kids": [3]}
+    assert table.build_lookup().rows_for_tvg_id("two") == ()
+    # The old table is not touched, so views can keep reading it meanwhile
+    assert live_rows(old) == [("One", "http://s/1"), ("Two", "http://s/2"), ("Three", "http://s/3")]
+
+    again, diff = table.reconcile(table_of(("Four", "http://s/4", "four", "Kids")))
+    assert diff == ChannelDiff(added=[], removed=[0, 2], changed=[])
+    assert again.holes == 3 and live_rows(again) == [("Four", "http://s/4")]
+    assert len(again) == 4
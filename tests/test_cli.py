@@ -0,0 +1,76 @@
+import json
+
+import pytest
+
+from iptv_core.cli import main
+
+FIRST = """#EXTM3U url-tvg="http://example.com/guide.xml.gz"
+#EXTINF:-1 tvg-id="news.uk" group-title="News",News One
+#EXTVLCOPT:http-user-agent=Test
+http://s/news
+#EXTINF:-1 tvg-id="sport.uk" group-title="Sport HD",Sport One
+http://s/sport
+#EXTINF:-1 group-title="Adult XXX",Late
+http://s/late
+"""
+
+SECOND = """#EXTM3U
+#EXTINF:-1 tvg-id="sport.uk" group-title="Sport",Sport One Backup
+http://s/sport-backup
+#EXTINF:-1 tvg-id="sport.fr" group-title="Sport",Sport Two test
+http://s/news
+#EXTINF:-1 group-title="Sport",Sport Three
+http://s/sport-3
+"""
+
+@pytest.fixture
+def inputs(tmp_path):
+    first = tmp_path / "first.m3u"
+    second = tmp_path / "second.m3u"
+    first.write_text(FIRST)
+    second.write_text(SECOND)
+    return str(first), str(second)
+
+def test_filters_and_dedup_keep_original_entries(inputs, tmp_path):
+    output = tmp_path / "out.m3u"
+    assert main([*inputs, "--exclude-category", "*xxx*", "--exclude-name", "test", "-o", str(output), "-q"]) == 0
+    assert output.read_text() == ('#EXTM3U url-tvg="http://example.com/guide.xml.gz"\n'
+                                  '#EXTINF:-1 tvg-id="news.uk" group-title="News",News One\n'
+                                  "#EXTVLCOPT:http-user-agent=Test\nhttp://s/news\n"
+                                  '#EXTINF:-1 tvg-id="sport.uk" group-title="Sport HD",Sport One\nhttp://s/sport\n'
+                                  '#EXTINF:-1 tvg-id="sport.uk" group-title="Sport",Sport One Backup\n'
+                                  "http://s/sport-backup\n"
+                                  '#EXTINF:-1 group-title="Sport",Sport Three\nhttp://s/sport-3\n')
+
+@pytest.mark.parametrize("dedup, names", [
+    ("url", ["News One", "Sport One", "Late", "Sport One Backup", "Sport Three"]),
+    ("tvg-id", ["News One", "Sport One", "Late", "Sport Two test", "Sport Three"]), # Entries without tvg-id all stay
+    ("none", ["News One", "Sport One", "Late", "Sport One Backup", "Sport Two test", "Sport Three"]),
+])
+def test_dedup_keys(inputs, tmp_path, dedup, names):
+    output = tmp_path / "out.jsonl"
+    assert main([*inputs, "--dedup", dedup, "-o", str(output), "-q"]) == 0
+    assert [json.loads(line)["name"] for line in output.read_text().splitlines()] == names
+
+def test_category_patterns_and_json_output(inputs, tmp_path):
+    output = tmp_path / "out.json"
+    assert main([*inputs, "--category", "sport*", "--name", "one", "-o", str(output), "-q"]) == 0
+    channels = json.loads(output.read_text())
+    assert [(channel["name"], channel["category"]) for channel in channels] == [("Sport One", "Sport HD"),
+                                                                                 ("Sport One Backup", "Sport")]
+
+@pytest.mark.parametrize("arguments", [
+    ["--name", "("], # Bad regular expression
+    ["missing.m3u"], # Missing input after a good one
+])
+def test_failed_run_leaves_previous_output(inputs, tmp_path, capsys, arguments):
+    output = tmp_path / "out.m3u"
+    output.write_text("previous\n")
+    extra_inputs = [str(tmp_path / argument) if argument.endswith(".m3u") else argument for argument in arguments]
+    assert main([inputs[0], *extra_inputs, "-o", str(output), "-q"]) == 1
+    assert "Error:" in capsys.readouterr().err
+    assert output.read_text() == "previous\n"
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["first.m3u", "out.m3u", "second.m3u"]
+
+def test_output_to_device_is_written_in_place(inputs):
+    assert main([*inputs, "-o", "/dev/null", "-q"]) == 0
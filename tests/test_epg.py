@@ -0,0 +1,115 @@
+import pytest
+
+from iptv_core.epg import EPGIndex, parse_xmltv_time
+
+HOUR = 3600
+MIDNIGHT = 1767225600 # 2026-01-01 00:00 UTC
+
+def index_with(channel_id, *spans, keep_from=None, keep_until=None):
+    # EPGIndex holding one channel with programmes at the given (start, stop) spans
+    index = EPGIndex(keep_from, keep_until)
+    index.add_channel(channel_id, [channel_id.title()])
+    for n, (start, stop) in enumerate(spans):
+        index.add_programme(channel_id, start, stop, f"Show {n}", "")
+    index.finalize()
+    return index
+
+def test_derived_indexes_keep_the_retention_window():
+    index = index_with("one", (0, HOUR), (HOUR, 2 * HOUR), keep_from=-HOUR, keep_until=10 * HOUR)
+    evicted, dropped = index.evicted(HOUR)
+    assert dropped == 1
+    assert (evicted.keep_from, evicted.keep_until) == (HOUR, 10 * HOUR)
+    restricted = index.restricted({"one"})
+    assert (restricted.keep_from, restricted.keep_until) == (-HOUR, 10 * HOUR)
+
+    # Still enforced on the derived index
+    assert not evicted.add_programme("one", 11 * HOUR, 12 * HOUR, "Late", "")
+    assert not evicted.add_programme("one", -3 * HOUR, 0, "Early", "")
+
+def test_merge_keeps_the_narrowest_window():
+    first = index_with("one", (0, HOUR), keep_from=-2 * HOUR, keep_until=10 * HOUR)
+    second = index_with("two", (0, HOUR), keep_from=-HOUR, keep_until=20 * HOUR)
+    unbounded = index_with("three", (0, HOUR))
+    merged = EPGIndex.merge([first, second, unbounded])
+    assert (merged.keep_from, merged.keep_until) == (-HOUR, 10 * HOUR)
+    assert set(merged.channels) == {"one", "two", "three"}
+    assert EPGIndex.merge([unbounded, index_with("four", (0, HOUR))]).keep_until is None
+
+@pytest.mark.parametrize("value, epoch", [
+    ("20260101000000 +0000", MIDNIGHT),
+    ("20260101000000", MIDNIGHT), # No offset means UTC
+    ("202601010130 +0000", MIDNIGHT + 90 * 60), # No seconds
+    ("20260101013015 +0000", MIDNIGHT + 90 * 60 + 15),
+    ("20260101010000 +0100", MIDNIGHT),
+    ("20251231183000 -0530", MIDNIGHT),
+    ("20260101000000 +0000 ", MIDNIGHT),
+    ("20260101000000 CET", MIDNIGHT), # Offsets given as names are not understood
+    ("20261301000000 +0000", None), # No such month
+    ("tomorrow", None),
+    ("", None),
+    (None, None),
+])
+def test_parse_xmltv_time(value, epoch):
+    assert parse_xmltv_time(value) == epoch
+    assert parse_xmltv_time(value) == epoch # Again from the day cache
+
+@pytest.fixture
+def schedule():
+    # News 0-1h, Film 1-3h, a gap, then Late 4-5h
+    return index_with("one", (0, HOUR), (HOUR, 3 * HOUR), (4 * HOUR, 5 * HOUR))
+
+def titles(programmes):
+    return [programme.title if programme is not None else None for programme in programmes]
+
+@pytest.mark.parametrize("when, expected", [
+    (-1, [None, "Show 0"]), # Before the first programme
+    (0, ["Show 0", "Show 1"]), # Exactly at a start
+    (HOUR - 1, ["Show 0", "Show 1"]),
+    (HOUR, ["Show 1", "Show 2"]), # A stop is the next programme's start
+    (3 * HOUR, [None, "Show 2"]), # In the gap
+    (5 * HOUR - 1, ["Show 2", None]),
+    (5 * HOUR, [None, None]), # After the last programme
+])
+def test_now_next_at_boundaries(schedule, when, expected):
+    assert titles(schedule.now_next("one", when)) == expected
+
+def test_now_next_of_unknown_channel(schedule):
+    assert schedule.now_next("two", 0) == (None, None)
+
+def test_window_and_upcoming(schedule):
+    guide = schedule.get("one")
+    assert titles(schedule.window("one", HOUR, 4 * HOUR)) == ["Show 1"] # [start, stop): Late starts at 4h
+    assert titles(schedule.window("one", HOUR - 1, 4 * HOUR + 1)) == ["Show 0", "Show 1", "Show 2"]
+    assert titles(schedule.window("one", 3 * HOUR, 4 * HOUR)) == []
+    assert titles(guide.upcoming(2 * HOUR)) == ["Show 1", "Show 2"]
+    assert titles(guide.upcoming(3 * HOUR, limit=1)) == ["Show 2"]
+    assert not guide.overlaps(3 * HOUR, 4 * HOUR)
+    assert guide.overlaps(3 * HOUR, 4 * HOUR + 1)
+
+def test_finalize_sorts_and_collapses_shared_starts():
+    index = EPGIndex()
+    index.add_channel("one", ["One"])
+    for start, title in ((2 * HOUR, "C"), (0, "A"), (HOUR, "B"), (0, "A again")):
+        index.add_programme("one", start, start + HOUR, title, "")
+    index.finalize()
+    guide = index.get("one")
+    assert list(guide.starts) == [0, HOUR, 2 * HOUR]
+    assert guide.titles == ["A", "B", "C"]
+
+def test_add_programme_drops_what_it_cannot_place():
+    index = EPGIndex(keep_from=0, keep_until=10 * HOUR)
+    index.add_channel("one", [])
+    assert not index.add_programme("two", 0, HOUR, "Undeclared channel", "")
+    assert not index.add_programme("one", None, HOUR, "Broken time", "")
+    assert not index.add_programme("one", -HOUR, 0, "Ended at keep_from", "")
+    assert not index.add_programme("one", 10 * HOUR, 11 * HOUR, "Starts at keep_until", "")
+    assert index.add_programme("one", -HOUR, 1, "Still airing", "")
+
+def test_merge_fills_gaps_from_later_guides():
+    first = index_with("one", (0, HOUR), (2 * HOUR, 3 * HOUR))
+    second = index_with("one", (0, HOUR), (HOUR, 2 * HOUR), (2 * HOUR + 1, 4 * HOUR))
+    second.get("one").titles = ["Other 0", "Other 1", "Other 2"]
+    guide = EPGIndex.merge([first, second]).get("one")
+    # The gap is filled; overlapping programmes of the later guide are not taken
+    assert titles(guide) == ["Show 0", "Other 1", "Show 1"]
+    assert list(guide.starts) == [0, HOUR, 2 * HOUR]
@@ -0,0 +1,77 @@
+import io
+
+import pytest
+
+from benchmarks.generators import EPG_ANCHOR, channel_ids, iter_xmltv_lines, xmltv_time
+from iptv_core import epg_pool, model as model_module
+from iptv_core.epg import EPGIndex
+from iptv_core.epg_pool import EPGProcessPool, ingest_in_processes
+from iptv_core.model import parse_epg
+
+KEEP_FROM = EPG_ANCHOR + 6 * 3600
+KEEP_UNTIL = EPG_ANCHOR + 30 * 3600
+
+def guide_bytes():
+    # A generated guide plus the programmes either parser has to drop or keep as they are
+    lines = list(iter_xmltv_lines(30, days=2, programmes_per_day=24))
+    first = channel_ids(30)[0]
+    extra = [
+        f'<programme start="{xmltv_time(EPG_ANCHOR + 7 * 3600)}" stop="{xmltv_time(EPG_ANCHOR + 8 * 3600)}" '
+        f'channel="undeclared"><title>Nobody</title></programme>\n',
+        f'<programme start="{xmltv_time(EPG_ANCHOR + 9 * 3600)}" stop="{xmltv_time(EPG_ANCHOR + 10 * 3600)}" '
+        f'channel="{first}"/>\n', # Placeholder: no title, no description
+        f'<programme start="broken" stop="{xmltv_time(EPG_ANCHOR + 10 * 3600)}" channel="{first}">'
+        f'<title>Broken</title></programme>\n',
+        f'<programme start="{xmltv_time(EPG_ANCHOR + 29 * 3600 + 1800)}" stop="{xmltv_time(EPG_ANCHOR + 31 * 3600)}" '
+        f'channel="{first}"><title>Télé €</title><desc>Ünïcode</desc></programme>\n',
+    ]
+    return "".join(lines[:-1] + extra + lines[-1:]).encode("utf-8")
+
+def columns(epg_index):
+    return {channel_id: (guide.display_name, list(guide.starts), list(guide.stops), list(guide.titles),
+                         list(guide.descriptions))
+            for channel_id, guide in epg_index.channels.items()}
+
+@pytest.fixture(scope="module")
+def pool():
+    pool = EPGProcessPool(processes=2)
+    yield pool
+    pool.shutdown()
+
+@pytest.fixture
+def submitted(pool, monkeypatch):
+    # Arguments of every chunk the pool is given, with parse_epg() using it from 1 KB on
+    monkeypatch.setattr(model_module, "EPG_POOL_MIN_BYTES", 1024)
+    submitted = []
+    submit = pool.submit
+    monkeypatch.setattr(pool, "submit", lambda *args: submitted.append(args) or submit(*args))
+    return submitted
+
+@pytest.mark.parametrize("read_bytes, chunk_bytes, chunks", [
+    (2048, 4096, 50), # Chunks cut at many <programme> tags, merged as they complete
+    (1024 * 1024, 64 * 1024, 2),
+])
+def test_pool_parse_matches_sequential_parse(pool, submitted, monkeypatch, read_bytes, chunk_bytes, chunks):
+    monkeypatch.setattr(epg_pool, "EPG_READ_BYTES", read_bytes)
+    data = guide_bytes()
+    expected = parse_epg(data, KEEP_FROM, KEEP_UNTIL)
+    epg_index = ingest_in_processes(io.BytesIO(data), EPGIndex(KEEP_FROM, KEEP_UNTIL), pool, chunk_bytes=chunk_bytes)
+    epg_index.finalize()
+    assert len(submitted) >= chunks
+    assert columns(epg_index) == columns(expected)
+    assert sum(len(guide) for guide in epg_index.channels.values()) > 500
+
+def test_parse_epg_hands_large_guides_to_the_pool(pool, submitted):
+    data = guide_bytes()
+    assert columns(parse_epg(data, KEEP_FROM, KEEP_UNTIL, pool=pool)) == columns(parse_epg(data, KEEP_FROM, KEEP_UNTIL))
+    assert submitted
+    submitted.clear()
+    small = b'<?xml version="1.0"?><tv><channel id="a"><display-name>A</display-name></channel></tv>'
+    assert list(parse_epg(small, pool=pool).channels) == ["a"]
+    assert not submitted # Smaller than EPG_POOL_MIN_BYTES: parsed on this thread
+
+def test_pool_reports_broken_guides(pool, submitted):
+    data = guide_bytes()
+    with pytest.raises(ValueError, match="XML parsing"):
+        parse_epg(data[:len(data) // 2], pool=pool)
+    assert submitted
@@ -0,0 +1,67 @@
+import json
+
+from iptv_core.channels import ChannelTable
+from iptv_core.favourites import FavouritesStore
+
+def table_of(*entries):
+    # ChannelTable of (name, url, tvg-id, category) entries
+    table = ChannelTable()
+    for name, url, tvg_id, category in entries:
+        table.append(name, url, tvg_id, category)
+    return table
+
+PLAYLIST = table_of(("One", "http://s/1", "one", "News"), ("One HD", "http://s/1hd", "one", "News"),
+                    ("Radio", "http://s/radio", None, "Music"), ("Two", "http://s/2", "two", "Sport"))
+
+def test_add_and_remove_keep_the_category_index():
+    store = FavouritesStore()
+    store.resolve(PLAYLIST)
+    assert store.add(1) and store.add(2) and store.add(0)
+    assert not store.add(1)
+    assert 1 in store and 3 not in store
+    assert store.by_category == {"News": [1, 0], "Music": [2]}
+    assert store.dirty
+    assert store.remove(2) and not store.remove(2)
+    assert store.by_category == {"News": [1, 0]}
+    assert len(store) == 2
+
+def test_resolve_finds_favourites_in_a_reloaded_playlist():
+    store = FavouritesStore()
+    store.resolve(PLAYLIST)
+    for row in (1, 2, 3):
+        store.add(row)
+    reloaded = table_of(("Radio", "http://s/radio-new", None, "Music"),
+                        ("Two (new name)", "http://s/2", "two", "Sport"),
+                        ("One", "http://s/1", "one", "News"), ("One HD", "http://s/1hd-new", "one", "News"))
+    store.resolve(reloaded)
+    # HD variant told apart by its name; a renamed channel still found by its tvg-id; no tvg-id: name and category
+    assert sorted(store._rows) == [0, 1, 3]
+    assert store.by_category == {"Music": [0], "Sport": [1], "News": [3]}
+    store.resolve(table_of(("Radio", "http://s/radio", None, "Talk")))
+    assert store.by_category == {} and len(store) == 3 # Kept for when they come back
+
+def test_save_round_trip_is_atomic_and_only_when_dirty(tmp_path):
+    path = tmp_path / "settings" / "favourites.json"
+    store = FavouritesStore()
+    store.resolve(PLAYLIST)
+    assert not store.save(str(path))
+    store.add(1)
+    store.add(2)
+    assert store.save(str(path)) and not store.dirty
+    assert not store.save(str(path))
+    assert [entry.name for entry in path.parent.iterdir()] == ["favourites.json"] # No temp file left behind
+
+    loaded = FavouritesStore.load(str(path))
+    loaded.resolve(PLAYLIST)
+    assert loaded.by_category == {"News": [1], "Music": [2]}
+
+def test_legacy_and_broken_files():
+    # Older versions stored [name, category] pairs
+    store = FavouritesStore.from_json(json.dumps([["Radio", "Music"], ["Two", "Sport"]]))
+    store.resolve(PLAYLIST)
+    assert store.by_category == {"Music": [2], "Sport": [3]}
+    assert json.loads(store.to_json()) == [{"tvg_id": None, "name": "Radio", "category": "Music"},
+                                           {"tvg_id": None, "name": "Two", "category": "Sport"}]
+    assert len(FavouritesStore.from_json("not json")) == 0
+    assert len(FavouritesStore.from_json(json.dumps([{"name": "No category"}]))) == 0
+    assert len(FavouritesStore.load("/nonexistent/favourites.json")) == 0
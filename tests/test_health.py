@@ -0,0 +1,73 @@
+import threading
+
+import pytest
+
+from benchmarks.server import StreamStandInHandler, serve_streams
+from iptv_core import health
+from iptv_core.health import STATUS_BROKEN, STATUS_OFFLINE, STATUS_OK, STATUS_SLOW, StreamProber
+
+@pytest.fixture
+def origin(monkeypatch):
+    # The stand-in origin with a slow stream that takes 0.5 s instead of 3 s
+    monkeypatch.setattr(StreamStandInHandler, "slow_delay", 0.5)
+    monkeypatch.setattr(health, "SLOW_TTFB", 0.3)
+    with serve_streams() as base_url:
+        yield base_url
+
+@pytest.fixture
+def prober():
+    prober = StreamProber(timeout=2)
+    yield prober
+    prober.shutdown()
+
+@pytest.mark.parametrize("path, status", [
+    ("good.m3u8", STATUS_OK),
+    ("master.m3u8", STATUS_OK),
+    ("good.ts", STATUS_OK),
+    ("slow.m3u8", STATUS_SLOW),
+    ("broken.m3u8", STATUS_BROKEN),
+    ("empty.ts", STATUS_BROKEN),
+    ("gone.m3u8", STATUS_OFFLINE),
+])
+def test_probe_classifies_streams(origin, prober, path, status):
+    result = prober.probe(f"{origin}/{path}")
+    assert result.status == status
+    assert prober.status(f"{origin}/{path}") == status
+
+def test_probe_unreachable_host_is_offline(prober):
+    result = prober.probe("http://127.0.0.1:9/good.m3u8", record=False)
+    assert result.status == STATUS_OFFLINE
+    assert prober.result("http://127.0.0.1:9/good.m3u8") is None
+
+def test_submit_reports_every_url_once(origin, prober):
+    urls = [f"{origin}/good-{i}.m3u8" for i in range(20)] + [f"{origin}/broken-{i}.m3u8" for i in range(5)]
+    reported = {}
+    done = threading.Event()
+    def on_result(url, result):
+        reported[url] = result.status
+        if len(reported) == len(urls):
+            done.set()
+    prober.on_result = on_result
+    assert prober.submit(urls) == len(urls)
+    assert prober.submit(urls) == 0 # Already queued or checked
+    assert done.wait(10)
+    assert sum(status == STATUS_OK for status in reported.values()) == 20
+    assert sum(status == STATUS_BROKEN for status in reported.values()) == 5
+    assert prober.submit(urls) == 0 # Fresh results are not checked again
+
+def test_busy_host_does_not_hold_up_others(origin, prober):
+    # A host at its per-host limit leaves the other workers to the remaining hosts
+    slow = [f"{origin}/slow-{i}.m3u8" for i in range(6)]
+    other = origin.replace("127.0.0.1", "localhost")
+    fast = [f"{other}/good-{i}.m3u8" for i in range(10)]
+    slow_futures = [prober.check(url) for url in slow]
+    fast_futures = [prober.check(url) for url in fast]
+    assert all(future.result(timeout=1).status == STATUS_OK for future in fast_futures)
+    assert not all(future.done() for future in slow_futures)
+    assert all(future.result(timeout=5).status == STATUS_SLOW for future in slow_futures)
+
+def test_results_are_bounded(origin, prober, monkeypatch):
+    monkeypatch.setattr(health, "PROBE_RESULT_LIMIT", 3)
+    for i in range(5):
+        prober.probe(f"{origin}/good-{i}.m3u8")
+    assert list(prober.results) == [f"{origin}/good-{i}.m3u8" for i in (2, 3, 4)]
@@ -0,0 +1,65 @@
+import pytest
+
+from iptv_core.m3u import iter_m3u_channels, parse_extinf
+from iptv_core.model import parse_m3u
+
+PLAYLIST = """#EXTM3U url-tvg="http://example.com/guide.xml"
+
+#EXTINF:-1 tvg-id="news.uk" tvg-logo="http://l/news.png" group-title="News, Weather" catchup="shift",BBC News, HD
+#EXTVLCOPT:http-user-agent=Test
+http://s/news
+#EXTINF:-1 tvg-name="Sport One" TVG-CHNO="7",
+#EXTGRP:Sport
+http://s/sport
+http://s/without-extinf
+#EXTINF:-1 group-title="Films",Cinema
+http://s/cinema
+#EXTINF:-1,No group
+http://s/plain
+"""
+
+@pytest.mark.parametrize("line, attributes, name", [
+    ('#EXTINF:-1 tvg-id="a" group-title="News, Sport",Name', {"tvg-id": "a", "group-title": "News, Sport"}, "Name"),
+    ('#EXTINF:-1,Foo group-title="X"', {}, 'Foo group-title="X"'), # Attribute-like text in the name
+    ('#EXTINF:-1 TVG-ID="a",Name, with comma', {"tvg-id": "a"}, "Name, with comma"),
+    ('#EXTINF:-1 tvg-id="a"', {"tvg-id": "a"}, ""),
+    ('#EXTINF:-1 tvg-name="unclosed,Name', {}, "Name"), # A quote that is never closed
+])
+def test_parse_extinf(line, attributes, name):
+    assert parse_extinf(line) == (attributes, name)
+
+def test_iter_m3u_channels_yields_one_dict_per_entry():
+    channels = list(iter_m3u_channels(PLAYLIST.splitlines()))
+    assert [channel["url"] for channel in channels] == ["http://s/news", "http://s/sport", "http://s/cinema",
+                                                         "http://s/plain"]
+    news, sport, cinema, plain = channels
+    assert news == {"tvg_id": "news.uk", "tvg_logo": "http://l/news.png", "catchup": "shift", "name": "BBC News, HD",
+                    "category": "News, Weather", "url": "http://s/news"}
+    # No display name: tvg-name stands in; #EXTGRP gives the category
+    assert (sport["name"], sport["category"], sport["tvg_chno"], sport["tvg_id"]) == ("Sport One", "Sport", "7", None)
+    assert cinema["category"] == "Films"
+    assert plain["category"] == "Uncategorized"
+
+def test_iter_m3u_channels_accepts_bytes_and_keeps_raw_text():
+    lines = [line.encode("utf-8") for line in PLAYLIST.splitlines()]
+    entries = list(iter_m3u_channels(iter(lines), raw=True))
+    assert entries[0][1] == ('#EXTINF:-1 tvg-id="news.uk" tvg-logo="http://l/news.png" group-title="News, Weather" '
+                             'catchup="shift",BBC News, HD\n#EXTVLCOPT:http-user-agent=Test\nhttp://s/news\n')
+    assert entries[1][1] == '#EXTINF:-1 tvg-name="Sport One" TVG-CHNO="7",\n#EXTGRP:Sport\nhttp://s/sport\n'
+    # The stray URL line belongs to no entry and is not carried into the next one
+    assert entries[2][1] == '#EXTINF:-1 group-title="Films",Cinema\nhttp://s/cinema\n'
+
+def test_iter_m3u_channels_is_lazy():
+    def lines():
+        yield "#EXTM3U"
+        yield "#EXTINF:-1,First"
+        yield "http://s/1"
+        raise AssertionError("read past the first entry")
+    assert next(iter_m3u_channels(lines()))["name"] == "First"
+
+def test_parse_m3u_builds_table():
+    table = parse_m3u(PLAYLIST)
+    assert len(table) == 4
+    assert table.categories == ["News, Weather", "Sport", "Films", "Uncategorized"]
+    assert table.channel(0)[1:] == ("BBC News, HD", "http://s/news", "news.uk", "News, Weather", "http://l/news.png")
+    assert table.extras == {0: {"catchup": "shift"}, 1: {"tvg_chno": "7"}} # tvg-name only kept when it differs
@@ -0,0 +1,262 @@
+import os
+import queue
+import threading
+import time
+
+import pytest
+
+from benchmarks.generators import EPG_ANCHOR, xmltv_time
+from benchmarks.server import QuietHandler, serve_directory
+from iptv_core.channels import ChannelDiff, ChannelTable
+from iptv_core.metrics import METRICS
+from iptv_core.model import LOAD_CHANNELS, LOAD_DONE, LOAD_ERROR, LOAD_PROGRESS, LOAD_ROWS, PlaylistModel, parse_m3u
+
+def playlist(*entries):
+    # M3U text of (name, url, tvg-id, group) entries
+    lines = ["#EXTM3U"]
+    for name, url, tvg_id, group in entries:
+        lines.append(f'#EXTINF:-1 tvg-id="{tvg_id}" group-title="{group}",{name}')
+        lines.append(url)
+    return "\n".join(lines) + "\n"
+
+def guide(channel_id, start, hours, title="Hour"):
+    # XMLTV text of one channel with hour-long programmes from start (epoch seconds), titled
+    # "<title> <hour>"
+    lines = ['<?xml version="1.0" encoding="UTF-8"?>', "<tv>",
+             f'<channel id="{channel_id}"><display-name>{channel_id}</display-name></channel>']
+    for hour in range(hours):
+        begin = start + hour * 3600
+        lines.append(f'<programme channel="{channel_id}" start="{xmltv_time(begin)}" stop="{xmltv_time(begin + 3600)}">'
+                     f'<title>{title} {hour}</title></programme>')
+    lines.append("</tv>")
+    return "\n".join(lines) + "\n"
+
+@pytest.fixture
+def served(tmp_path):
+    # (directory, base URL) of a local HTTP server for the files of directory
+    directory = tmp_path / "www"
+    directory.mkdir()
+    with serve_directory(directory) as base_url:
+        yield directory, base_url
+
+@pytest.fixture
+def model(tmp_path):
+    model = PlaylistModel(str(tmp_path / "cache"))
+    model.epg_pool = None
+    return model
+
+def load_events(model, m3u_urls, epg_urls=""):
+    events = queue.Queue()
+    model.load_progressively(m3u_urls, epg_urls, events)
+    result = []
+    while True:
+        kind, value = events.get_nowait()
+        if kind == LOAD_ERROR:
+            raise value
+        result.append((kind, value))
+        if kind == LOAD_DONE:
+            return result
+
+@pytest.fixture
+def metrics(monkeypatch):
+    METRICS.reset()
+    monkeypatch.setattr(METRICS, "enabled", True)
+    yield METRICS
+    METRICS.reset()
+
+def timer_counts(metrics):
+    return {name: values["count"] for kind, name, labels, values in metrics.snapshot() if kind == "timer"}
+
+def test_progressive_load_times_playlist_parsing(served, model, metrics):
+    directory, base_url = served
+    (directory / "a.m3u").write_text(playlist(("One", "http://s/1", "one", "News")))
+    (directory / "b.m3u").write_text(playlist(("Two", "http://s/2", "two", "Sport")))
+    load_events(model, f"{base_url}/a.m3u {base_url}/b.m3u")
+    counts = timer_counts(metrics)
+    assert counts["parse_m3u"] == 2
+    assert counts["fetch_source"] == 2
+
+def test_unchanged_guide_is_parsed_again_once_its_window_runs_out(served, model, monkeypatch):
+    # The snapshot only holds the 72 hours ahead of its first load; a 304 days later must not
+    # leave the guide to run empty while the source itself still covers the time
+    directory, base_url = served
+    (directory / "a.m3u").write_text(playlist(("One", "http://s/1", "one", "News")))
+    (directory / "guide.xml").write_text(guide("one", EPG_ANCHOR, 8 * 24))
+    clock = [EPG_ANCHOR + 1800]
+    monkeypatch.setattr(time, "time", lambda: clock[0])
+    urls = (f"{base_url}/a.m3u", f"{base_url}/guide.xml")
+
+    model.apply(model.fetch(*urls))
+    assert model.epg_index.get("one").now_next(clock[0])[0].title == "Hour 0"
+
+    clock[0] += 80 * 3600
+    model.apply(model.fetch(*urls))
+    current, upcoming = model.epg_index.get("one").now_next(clock[0])
+    assert (current.title, upcoming.title) == ("Hour 80", "Hour 81")
+
+    # A restart revalidates the stale snapshot the same way
+    restarted = PlaylistModel(model.source_cache.directory)
+    restarted.epg_pool = None
+    assert restarted.load_cached(*urls)
+    clock[0] += 80 * 3600
+    restarted.apply(restarted.fetch(*urls))
+    assert restarted.epg_index.get("one").now_next(clock[0])[0].title == "Hour 160"
+
+class HeldHandler(QuietHandler):
+    # Holds back files whose name starts with "held" until `release` is set; records the paths
+    # asked for in `requested`
+    release = None
+    requested = None
+
+    def do_GET(self):
+        self.requested.append(self.path)
+        if self.path.lstrip("/").startswith("held"):
+            self.release.wait(5)
+        super().do_GET()
+
+@pytest.fixture
+def held(tmp_path, monkeypatch):
+    # Like served, with HeldHandler answering
+    monkeypatch.setattr(HeldHandler, "release", threading.Event())
+    monkeypatch.setattr(HeldHandler, "requested", [])
+    directory = tmp_path / "www"
+    directory.mkdir()
+    with serve_directory(directory, HeldHandler) as base_url:
+        try:
+            yield directory, base_url
+        finally:
+            HeldHandler.release.set()
+
+def wait_for(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.005)
+    return True
+
+def channel_set(table):
+    return {(table.names[row], table.urls[row], table.tvg_ids[row]) for row in range(len(table))
+            if not table.is_hole(row)}
+
+def test_progressive_load_shows_later_playlists_first_and_keeps_merge_precedence(held, model):
+    directory, base_url = held
+    first = playlist(("One", "http://s/1", "one", "News"), ("Shared", "http://s/shared", "x", "News"))
+    second = playlist(("Two", "http://s/2", "two", "Sport"), ("Shared B", "http://s/shared", "y", "Sport"),
+                      ("One B", "http://s/1b", "one", "Sport"))
+    (directory / "held.m3u").write_text(first)
+    (directory / "b.m3u").write_text(second)
+    events = queue.Queue()
+    worker = threading.Thread(target=model.load_progressively,
+                              args=(f"{base_url}/held.m3u {base_url}/b.m3u", "", events))
+    worker.start()
+    try:
+        # The second playlist is shown while the first is still held back
+        seen = []
+        while (LOAD_ROWS, 3) not in seen:
+            seen.append(events.get(timeout=5))
+        seen.append(events.get(timeout=5)) # Its LOAD_PROGRESS
+        progress = [value for kind, value in seen if kind == LOAD_PROGRESS]
+        assert progress and all(value.source == 2 and value.sources == 2 for value in progress)
+    finally:
+        HeldHandler.release.set()
+        worker.join(10)
+
+    result = dict(seen)
+    while True:
+        kind, value = events.get_nowait()
+        assert kind != LOAD_ERROR, value
+        result[kind] = value
+        if kind == LOAD_DONE:
+            break
+    update = result[LOAD_CHANNELS]
+    merged = ChannelTable.merge([parse_m3u(first), parse_m3u(second)])
+    assert channel_set(update.channels) == channel_set(merged)
+    # Rows already shown keep their ids; the ones the first playlist overrides are in the diff
+    shown = update.base
+    assert shown.names[:3] == ["Two", "Shared B", "One B"]
+    assert update.channels.urls[:2] == ["http://s/2", "http://s/shared"]
+    assert update.channels.names[1] == "Shared"
+    assert update.channel_diff.removed == [2] and update.channel_diff.changed == [1]
+
+def test_progressive_load_of_playlists_in_order_needs_no_diff(served, model):
+    directory, base_url = served
+    (directory / "a.m3u").write_text(playlist(("One", "http://s/1", "one", "News")))
+    (directory / "b.m3u").write_text(playlist(("Two", "http://s/2", "two", "Sport"), ("One", "http://s/1", "one", "News")))
+    update = dict(load_events(model, f"{base_url}/a.m3u {base_url}/b.m3u"))[LOAD_CHANNELS]
+    assert channel_set(update.channels) == {("One", "http://s/1", "one"), ("Two", "http://s/2", "two")}
+
+def test_fetch_downloads_sources_together_and_merges_them_in_order(held, model):
+    directory, base_url = held
+    (directory / "held.m3u").write_text(playlist(("One", "http://s/1", "one", "News"),
+                                                 ("Shared", "http://s/shared", None, "News")))
+    (directory / "b.m3u").write_text(playlist(("Shared B", "http://s/shared", None, "Sport"),
+                                              ("One B", "http://s/1b", "one", "Sport"),
+                                              ("Two", "http://s/2", "two", "Sport")))
+    now = int(time.time()) // 3600 * 3600
+    (directory / "held-guide.xml").write_text(guide("one", now, 2, title="First"))
+    (directory / "guide-b.xml").write_text(guide("one", now, 4, title="Second"))
+    result = []
+    worker = threading.Thread(target=lambda: result.append(model.fetch(
+        f"{base_url}/held.m3u {base_url}/b.m3u", f"{base_url}/held-guide.xml {base_url}/guide-b.xml")))
+    worker.start()
+    try:
+        # Every download starts before the first source has answered
+        assert wait_for(lambda: {"/b.m3u", "/guide-b.xml", "/held.m3u", "/held-guide.xml"} <= set(HeldHandler.requested))
+        assert not result
+    finally:
+        HeldHandler.release.set()
+        worker.join(10)
+
+    model.apply(result[0])
+    # The later playlist finished first, but the configured order decides
+    assert [model.channels.names[row] for row in range(len(model.channels))] == ["One", "Shared", "Two"]
+    guide_one = model.epg_index.get("one")
+    assert [programme.title for programme in guide_one] == ["First 0", "First 1", "Second 2", "Second 3"]
+
+def rewrite(path, text):
+    # Replaces a served file so If-Modified-Since (whole seconds) sees it as changed
+    path.write_text(text)
+    modified = path.stat().st_mtime + 10
+    os.utime(path, (modified, modified))
+
+def test_background_refresh_reconciles_with_the_shown_channels(served, model):
+    directory, base_url = served
+    now = int(time.time()) // 3600 * 3600
+    (directory / "a.m3u").write_text(playlist(("One", "http://s/1", "one", "News"),
+                                              ("Two", "http://s/2", "two", "News"),
+                                              ("Three", "http://s/3", "three", "Sport")))
+    (directory / "guide.xml").write_text(guide("one", now, 3))
+    urls = (f"{base_url}/a.m3u", f"{base_url}/guide.xml")
+    model.apply(model.fetch(*urls, reconcile=True))
+    shown = model.channels
+    assert not model.fetch(*urls, reconcile=True) # Both sources answer 304
+
+    rewrite(directory / "a.m3u", playlist(("One (renamed)", "http://s/1", "one", "News"),
+                                          ("Three", "http://s/3", "three", "Sport"),
+                                          ("Four", "http://s/4", "four", "Kids")))
+    update = model.fetch(*urls, reconcile=True)
+    assert update.base is shown
+    assert update.channel_diff == ChannelDiff(added=[3], removed=[1], changed=[0])
+    assert update.epg_index is None # The guide did not change
+    assert model.channels is shown # fetch() leaves the model alone until apply()
+    assert model.apply(update) == update.channel_diff
+    assert model.channels.urls == ["http://s/1", None, "http://s/3", "http://s/4"]
+    assert model.search_index.search("renamed") == [0]
+
+    rewrite(directory / "guide.xml", guide("one", now, 3, title="Changed"))
+    update = model.fetch(*urls, reconcile=True)
+    assert update.channels is None and update.epg_changed == {"one"}
+    model.apply(update)
+    assert model.epg_index.get("one")[0].title == "Changed 0"
+
+def test_diff_is_dropped_when_the_channels_changed_meanwhile(served, model):
+    directory, base_url = served
+    (directory / "a.m3u").write_text(playlist(("One", "http://s/1", "one", "News")))
+    model.apply(model.fetch(f"{base_url}/a.m3u", ""))
+    rewrite(directory / "a.m3u", playlist(("One", "http://s/1", "one", "News"), ("Two", "http://s/2", "two", "News")))
+    update = model.fetch(f"{base_url}/a.m3u", "", reconcile=True)
+    assert update.channel_diff is not None
+    model.channels = ChannelTable() # e.g. a load that finished in between
+    assert model.apply(update) is None # The caller rebuilds its views instead
+    assert model.channels is update.channels
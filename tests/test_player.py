@@ -0,0 +1,75 @@
+import threading
+import time
+
+from iptv_core.player import EVENT_PLAYING, EVENT_STARTING, EVENT_STOPPED, ChannelZapper, FakeBackend
+
+def wait_for(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.005)
+    return True
+
+class Recorder:
+    # on_event that records the events and lets a test wait for one
+    def __init__(self):
+        self.events = []
+        self.condition = threading.Condition()
+
+    def __call__(self, event, url, value):
+        with self.condition:
+            self.events.append((event, url, value))
+            self.condition.notify_all()
+
+    def wait(self, event, url, timeout=2.0):
+        with self.condition:
+            return self.condition.wait_for(lambda: any(e == event and u == url for e, u, _ in self.events), timeout)
+
+def test_play_swaps_in_warmed_standby():
+    recorder = Recorder()
+    zapper = ChannelZapper(FakeBackend(startup_delay=0.05), on_event=recorder)
+    try:
+        assert zapper.play("http://a/1") is False
+        assert recorder.wait(EVENT_PLAYING, "http://a/1")
+
+        assert zapper.prewarm("http://a/2")
+        standby = zapper.standby
+        assert standby.muted and standby.url == "http://a/2"
+        assert wait_for(lambda: standby in zapper.ready)
+
+        assert zapper.play("http://a/2") is True
+        assert zapper.active is standby
+        assert not zapper.active.muted
+        assert zapper.standby.muted and zapper.standby.url is None
+        # The standby was already playing, so the switch completes without waiting
+        assert recorder.events[-3:] == [(EVENT_STOPPED, "http://a/1", None), (EVENT_STARTING, "http://a/2", True),
+                                        (EVENT_PLAYING, "http://a/2", None)]
+        assert zapper.switches[-1].warm
+        assert zapper.switches[-1].seconds < 0.05
+    finally:
+        zapper.close()
+
+def test_play_of_other_channel_starts_cold():
+    recorder = Recorder()
+    zapper = ChannelZapper(FakeBackend(startup_delay=0.02), on_event=recorder)
+    try:
+        zapper.play("http://a/1")
+        zapper.prewarm("http://a/2")
+        active = zapper.active
+        assert zapper.play("http://a/3") is False
+        assert zapper.active is active and active.url == "http://a/3"
+        assert recorder.wait(EVENT_PLAYING, "http://a/3")
+        assert not zapper.switches[-1].warm
+    finally:
+        zapper.close()
+
+def test_players_start_with_options_for_url():
+    zapper = ChannelZapper(FakeBackend(startup_delay=1.0), options_for=lambda url: (f":network-caching={len(url)}",))
+    try:
+        zapper.play("http://a/1")
+        zapper.prewarm("http://a/22")
+        assert zapper.active.options == (":network-caching=10",)
+        assert zapper.standby.options == (":network-caching=11",)
+    finally:
+        zapper.close()
@@ -0,0 +1,57 @@
+import sqlite3
+
+import pytest
+
+from iptv_core import programmes
+from iptv_core.epg import EPGIndex
+from iptv_core.programmes import ProgrammeDatabase
+
+def guide(*titles):
+    index = EPGIndex()
+    index.add_channel("one", ["One"])
+    for i, title in enumerate(titles):
+        index.add_programme("one", i * 600, (i + 1) * 600, title, "")
+    return index
+
+def indexes(db):
+    return {name for name, in db._connection().execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+
+def test_failed_bulk_ingest_keeps_everything(tmp_path, monkeypatch):
+    monkeypatch.setattr(programmes, "BULK_INGEST_PROGRAMMES", 1)
+    db = ProgrammeDatabase(str(tmp_path / "programmes.sqlite3"))
+    db.ingest(guide("News", "Weather"))
+    before = indexes(db)
+    assert {"programmes_start", "programmes_stop"} <= before
+
+    def fail(connection, key):
+        raise sqlite3.OperationalError("disk I/O error")
+    monkeypatch.setattr(db, "_delete_programmes", fail)
+    with pytest.raises(sqlite3.OperationalError):
+        db.ingest(guide("Film"))
+
+    # The time indexes dropped for the bulk ingest come back with the rollback
+    assert indexes(db) == before
+    assert [match.title for match in db.search("weather")] == ["Weather"]
+    assert db.search("film") == []
+
+@pytest.mark.parametrize("text", ['news"', "NOT news", "news OR", "-news", "(news", "news*", "_", "^", "NEAR(news"])
+def test_search_treats_operators_as_text(tmp_path, text):
+    db = ProgrammeDatabase(str(tmp_path / "programmes.sqlite3"))
+    db.ingest(guide("News", "Weather"))
+    assert [match.title for match in db.search(text)] in ([], ["News"])
+
+def test_search_matches_word_prefixes(tmp_path):
+    db = ProgrammeDatabase(str(tmp_path / "programmes.sqlite3"))
+    db.ingest(guide("Évening News", "Weather"))
+    assert [match.title for match in db.search("evening new")] == ["Évening News"]
+    assert db.search("   ") == []
+
+def test_search_reports_database_errors(tmp_path):
+    db = ProgrammeDatabase(str(tmp_path / "programmes.sqlite3"))
+    db.ingest(guide("News"))
+    other = sqlite3.connect(str(tmp_path / "programmes.sqlite3"))
+    other.execute("DROP TABLE programme_text")
+    other.commit()
+    other.close()
+    with pytest.raises(sqlite3.OperationalError):
+        db.search("news")
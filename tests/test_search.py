@@ -0,0 +1,66 @@
+import pytest
+
+from iptv_core.channels import ChannelTable
+from iptv_core.search import ChannelSearchIndex, normalize_search_text
+
+NAMES = ["BBC One", "Télé Sport", "Sport 24", "Eurosport HD", "Sky News", "CNN", "TV5 Monde"]
+
+class CountingNames(list):
+    # Names list that counts how many of them a search verifies
+    reads = 0
+
+    def __getitem__(self, i):
+        self.reads += 1
+        return super().__getitem__(i)
+
+@pytest.fixture
+def table():
+    table = ChannelTable()
+    for n, name in enumerate(NAMES):
+        table.append(name, f"http://s/{n}", category="Sport" if "sport" in name.lower() else "General")
+    return table
+
+@pytest.fixture
+def index(table):
+    return ChannelSearchIndex(table).build_trigrams()
+
+def test_normalize_search_text():
+    assert normalize_search_text("Télé ÉTÉ") == "tele ete"
+    assert normalize_search_text("STRASSE") == normalize_search_text("Straße")
+
+@pytest.mark.parametrize("query, rows", [
+    ("sport", [1, 2, 3]),
+    ("TELE", [1]),
+    ("sp", [1, 2, 3]), # Shorter than a trigram
+    ("ne", [0, 4]),
+    ("  news ", [4]),
+    ("xyz", []),
+])
+def test_search_matches_substrings(index, table, query, rows):
+    assert index.search(query) == rows
+    # Same answer without the trigram index
+    assert ChannelSearchIndex(table).search(query) == rows
+
+def test_empty_query_matches_everything(index):
+    assert index.search("sport")
+    assert index.search("   ") is None
+    assert index._last_query is None
+
+def test_trigrams_limit_the_names_verified(index):
+    index.names = CountingNames(index.names)
+    assert index.search("monde") == [6]
+    assert index.names.reads == 1 # Only the channel with the rarest trigram
+
+def test_extended_query_narrows_previous_result(index):
+    assert index.search("sport") == [1, 2, 3]
+    index.names = CountingNames(index.names)
+    assert index.search("sport 2") == [2]
+    assert index.names.reads == 3 # Only the previous matches are checked again
+    index.names.reads = 0
+    assert index.search("sport 24") == [2]
+    assert index.names.reads == 1
+    # A query that does not extend the previous one starts over
+    assert index.search("one") == [0]
+
+def test_group_by_category(index):
+    assert index.group_by_category(index.search("s")) == {"Sport": [1, 2, 3], "General": [4]}
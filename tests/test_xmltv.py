@@ -0,0 +1,77 @@
+import gzip
+import io
+import lzma
+
+import pytest
+
+from iptv_core.model import parse_epg
+from iptv_core.xmltv import iter_xmltv, open_decompressed_stream
+
+GUIDE = b"""<?xml version="1.0" encoding="UTF-8"?>
+<tv>
+  <channel id="one.uk"><display-name>One</display-name><display-name> One HD </display-name></channel>
+  <channel><display-name>No id</display-name></channel>
+  <programme channel="one.uk" start="20260101000000 +0000" stop="20260101010000 +0000">
+    <title>Morning</title><desc>News and weather</desc>
+  </programme>
+  <programme channel="one.uk" start="20260101010000 +0000" stop="20260101020000 +0000"><title>Later</title></programme>
+  <programme channel="one.uk" start="20260101020000 +0000" stop="20260101030000 +0000"/>
+</tv>
+"""
+
+class ChunkStream(io.RawIOBase):
+    # A network-like stream with no peek(), returning one chunk per read
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = next(self.chunks, b"")
+        buffer[:len(data)] = data
+        return len(data)
+
+def chunked(data, size=7):
+    return ChunkStream(data[i:i + size] for i in range(0, len(data), size))
+
+@pytest.mark.parametrize("compress", [lambda data: data, gzip.compress, lzma.compress])
+def test_open_decompressed_stream_sniffs_the_format(compress):
+    # The format comes from the first bytes, whatever the source is called
+    assert open_decompressed_stream(chunked(compress(GUIDE))).read() == GUIDE
+
+def test_iter_xmltv_records():
+    records = list(iter_xmltv(io.BytesIO(GUIDE)))
+    assert records[0] == ("channel", ("one.uk", ["One", "One HD"]))
+    assert [kind for kind, _ in records] == ["channel", "programme", "programme", "programme"]
+    assert records[1][1] == {"channel": "one.uk", "title": "Morning", "description": "News and weather",
+                             "start": "20260101000000 +0000", "stop": "20260101010000 +0000"}
+    assert (records[2][1]["title"], records[2][1]["description"]) == ("Later", "No description")
+    assert (records[3][1]["title"], records[3][1]["description"]) == ("N/A", "No description")
+
+def test_iter_xmltv_is_incremental():
+    # The first record comes out before the rest of the document has been read
+    def chunks():
+        yield GUIDE[:GUIDE.index(b"<programme")]
+        raise AssertionError("read past the channels")
+    assert next(iter_xmltv(ChunkStream(chunks()))) == ("channel", ("one.uk", ["One", "One HD"]))
+
+@pytest.mark.parametrize("compress", [lambda data: data, gzip.compress, lzma.compress])
+def test_parse_epg_reads_compressed_guides(compress):
+    epg_index = parse_epg(compress(GUIDE))
+    guide = epg_index.get("one.uk")
+    # The placeholder programme (no title, no description) is not stored
+    assert [programme.title for programme in guide] == ["Morning", "Later"]
+    assert guide[0].start == 1767225600 and guide[0].stop == 1767229200
+
+def test_parse_epg_keeps_the_window():
+    epg_index = parse_epg(GUIDE, keep_from=1767229200 + 1, keep_until=1767232800)
+    assert [programme.title for programme in epg_index.get("one.uk")] == ["Later"]
+
+@pytest.mark.parametrize("data, message", [
+    (gzip.compress(GUIDE)[:40], "decompression"),
+    (GUIDE[:-10], "XML parsing"),
+])
+def test_parse_epg_reports_broken_guides(data, message):
+    with pytest.raises(ValueError, match=message):
+        parse_epg(data)